@@ -5,12 +5,18 @@ from django.shortcuts import render
 from django.urls import path
 from django.utils import timezone
 from django.utils.html import format_html
+from django.db import transaction
 from django.db.models import Q,F, Count, Sum
 from datetime import timedelta
 from django.conf import settings
 from django.contrib import messages
 from django.urls import reverse
 from .models import *
+from .site_context import invalidate_global_context
+from .page_cache import invalidate_page_tags
+from .autocomplete import invalidate_autocomplete
+from .review_stats import refresh_review_stats
+from .user_counters import schedule_counter_refresh
 
 # ==================== DASHBOARD VIEW ====================
 
@@ -118,9 +124,7 @@ def admin_dashboard(request):
     }
     
     # Recent Data
-    recent_products = Product.objects.select_related(
-        'vendor', 'category'
-    ).prefetch_related('images').order_by('-created_at')[:6]
+    recent_products = Product.objects.cards().order_by('-created_at')[:6]
     
     recent_orders = Order.objects.select_related(
         'user'
@@ -298,7 +302,8 @@ class ProductAdmin(admin.ModelAdmin):
                    'status', 'is_featured', 'created_at', 'action_buttons']
     list_filter = ['status', 'category', 'vendor', 'is_featured', 'is_digital', 'created_at']
     search_fields = ['name', 'sku', 'description', 'short_description', 'tags']
-    readonly_fields = ['created_at', 'updated_at', 'published_at', 'views_count']
+    readonly_fields = ['created_at', 'updated_at', 'published_at', 'views_count',
+                       'avg_rating', 'review_count', 'rating_histogram']
     list_editable = ['status', 'is_featured']  # These are in list_display
     list_per_page = 20
     actions = ['activate_products', 'draft_products', 'mark_featured', 'unmark_featured']
@@ -330,6 +335,10 @@ class ProductAdmin(admin.ModelAdmin):
             'fields': ('created_at', 'updated_at', 'published_at', 'views_count'),
             'classes': ('collapse',),
         }),
+        ('Reviews', {
+            'fields': ('avg_rating', 'review_count', 'rating_histogram'),
+            'classes': ('collapse',),
+        }),
     )
     
     def stock_status(self, obj):
@@ -352,21 +361,31 @@ class ProductAdmin(admin.ModelAdmin):
     
     def activate_products(self, request, queryset):
         updated = queryset.update(status='active')
+        invalidate_global_context()
+        invalidate_page_tags('product')
+        invalidate_autocomplete()
         self.message_user(request, f"{updated} products activated.")
     activate_products.short_description = "Activate selected products"
     
     def draft_products(self, request, queryset):
         updated = queryset.update(status='draft')
+        invalidate_global_context()
+        invalidate_page_tags('product')
+        invalidate_autocomplete()
         self.message_user(request, f"{updated} products moved to draft.")
     draft_products.short_description = "Move to draft"
     
     def mark_featured(self, request, queryset):
         updated = queryset.update(is_featured=True)
+        invalidate_global_context()
+        invalidate_page_tags('product')
         self.message_user(request, f"{updated} products marked as featured.")
     mark_featured.short_description = "Mark as featured"
     
     def unmark_featured(self, request, queryset):
         updated = queryset.update(is_featured=False)
+        invalidate_global_context()
+        invalidate_page_tags('product')
         self.message_user(request, f"{updated} products unmarked as featured.")
     unmark_featured.short_description = "Remove featured status"
 
@@ -411,13 +430,22 @@ class ProductReviewAdmin(admin.ModelAdmin):
     rating_stars.short_description = 'Rating'
     
     def approve_reviews(self, request, queryset):
-        queryset.update(is_approved=True)
-        self.message_user(request, f"{queryset.count()} reviews approved.")
+        # Read before the update: a changelist filtered on is_approved
+        # matches nothing afterwards
+        product_ids = list(queryset.values_list('product_id', flat=True))
+        with transaction.atomic():
+            updated = queryset.update(is_approved=True)
+            # QuerySet.update() sends no signals
+            refresh_review_stats(product_ids)
+        self.message_user(request, f"{updated} reviews approved.")
     approve_reviews.short_description = "Approve selected reviews"
     
     def disapprove_reviews(self, request, queryset):
-        queryset.update(is_approved=False)
-        self.message_user(request, f"{queryset.count()} reviews disapproved.")
+        product_ids = list(queryset.values_list('product_id', flat=True))
+        with transaction.atomic():
+            updated = queryset.update(is_approved=False)
+            refresh_review_stats(product_ids)
+        self.message_user(request, f"{updated} reviews disapproved.")
     disapprove_reviews.short_description = "Disapprove selected reviews"
 
 # ==================== E-COMMERCE MODELS ====================
@@ -457,23 +485,31 @@ class OrderAdmin(admin.ModelAdmin):
     action_buttons.short_description = 'Actions'
     
     def confirm_orders(self, request, queryset):
-        queryset.update(status='confirmed')
-        self.message_user(request, f"{queryset.count()} orders confirmed.")
+        user_ids = list(queryset.values_list('user_id', flat=True))
+        updated = queryset.update(status='confirmed')
+        schedule_counter_refresh(user_ids, 'orders')
+        self.message_user(request, f"{updated} orders confirmed.")
     confirm_orders.short_description = "Confirm selected orders"
     
     def ship_orders(self, request, queryset):
-        queryset.update(status='shipped')
-        self.message_user(request, f"{queryset.count()} orders marked as shipped.")
+        user_ids = list(queryset.values_list('user_id', flat=True))
+        updated = queryset.update(status='shipped')
+        schedule_counter_refresh(user_ids, 'orders')
+        self.message_user(request, f"{updated} orders marked as shipped.")
     ship_orders.short_description = "Mark as shipped"
     
     def deliver_orders(self, request, queryset):
-        queryset.update(status='delivered')
-        self.message_user(request, f"{queryset.count()} orders marked as delivered.")
+        user_ids = list(queryset.values_list('user_id', flat=True))
+        updated = queryset.update(status='delivered')
+        schedule_counter_refresh(user_ids, 'orders')
+        self.message_user(request, f"{updated} orders marked as delivered.")
     deliver_orders.short_description = "Mark as delivered"
     
     def cancel_orders(self, request, queryset):
-        queryset.update(status='cancelled')
-        self.message_user(request, f"{queryset.count()} orders cancelled.")
+        user_ids = list(queryset.values_list('user_id', flat=True))
+        updated = queryset.update(status='cancelled')
+        schedule_counter_refresh(user_ids, 'orders')
+        self.message_user(request, f"{updated} orders cancelled.")
     cancel_orders.short_description = "Cancel selected orders"
 
 @admin.register(OrderItem)
@@ -642,6 +678,14 @@ class RealTimeSensorDataAdmin(admin.ModelAdmin):
         return f"{obj.value} {obj.unit}" if obj.unit else str(obj.value)
     value_with_unit.short_description = 'Value'
 
+@admin.register(SensorDevice)
+class SensorDeviceAdmin(admin.ModelAdmin):
+    list_display = ['name', 'device_key', 'location', 'fruit_batch', 'product', 'is_active', 'last_seen_at']
+    list_filter = ['is_active', 'location']
+    search_fields = ['name', 'device_key']
+    raw_id_fields = ['fruit_batch', 'product']
+    readonly_fields = ['last_seen_at', 'offline_alerted_at', 'created_at', 'updated_at']
+
 # ==================== AI & DATASET MODELS ====================
 
 @admin.register(ProductDataset)
@@ -702,12 +746,16 @@ class ProductAlertAdmin(admin.ModelAdmin):
     severity_badge.short_description = 'Severity'
     
     def mark_resolved(self, request, queryset):
+        vendor_ids = list(queryset.values_list('product__vendor_id', flat=True))
         updated = queryset.update(is_resolved=True, resolved_at=timezone.now(), resolved_by=request.user)
+        schedule_counter_refresh(vendor_ids, 'alerts')
         self.message_user(request, f"{updated} alerts marked as resolved.")
     mark_resolved.short_description = "Mark as resolved"
     
     def mark_unresolved(self, request, queryset):
+        vendor_ids = list(queryset.values_list('product__vendor_id', flat=True))
         updated = queryset.update(is_resolved=False, resolved_at=None, resolved_by=None)
+        schedule_counter_refresh(vendor_ids, 'alerts')
         self.message_user(request, f"{updated} alerts marked as unresolved.")
     mark_unresolved.short_description = "Mark as unresolved"
 
@@ -733,12 +781,16 @@ class NotificationAdmin(admin.ModelAdmin):
     action_buttons.short_description = 'Actions'
     
     def mark_read(self, request, queryset):
+        user_ids = list(queryset.values_list('user_id', flat=True))
         updated = queryset.update(is_read=True)
+        schedule_counter_refresh(user_ids, 'notifications')
         self.message_user(request, f"{updated} notifications marked as read.")
     mark_read.short_description = "Mark as read"
     
     def mark_unread(self, request, queryset):
+        user_ids = list(queryset.values_list('user_id', flat=True))
         updated = queryset.update(is_read=False)
+        schedule_counter_refresh(user_ids, 'notifications')
         self.message_user(request, f"{updated} notifications marked as unread.")
     mark_unread.short_description = "Mark as unread"
 
@@ -0,0 +1,147 @@
+# bika/anonymous_cart.py - CART OF SHOPPERS WHO ARE NOT SIGNED IN
+from django.conf import settings
+from django.core import signing
+
+from .models import Cart, Product
+
+# The cart lives in a signed cookie ("12:2,15:1"), so browsing shoppers
+# cost no database writes at all; it is merged into Cart rows at login
+# (merge_anonymous_cart) and the cookie is written back by
+# AnonymousCartMiddleware.
+ANONYMOUS_CART_COOKIE = 'bika_cart'
+ANONYMOUS_CART_SALT = 'bika.anonymous_cart'
+DEFAULT_ANONYMOUS_CART_MAX_AGE = 60 * 60 * 24 * 30
+
+# Keeps the cookie well under the 4KB browsers allow
+MAX_ANONYMOUS_CART_LINES = 50
+MAX_LINE_QUANTITY = 999
+
+
+def _max_age():
+    return settings.BIKA_SETTINGS.get('ANONYMOUS_CART_MAX_AGE', DEFAULT_ANONYMOUS_CART_MAX_AGE)
+
+
+class AnonymousCart:
+    """{product_id: quantity}, oldest line first"""
+
+    def __init__(self, lines=None):
+        self.lines = dict(lines or {})
+        self.modified = False
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __iter__(self):
+        return iter(self.lines.items())
+
+    def __contains__(self, product_id):
+        return product_id in self.lines
+
+    @classmethod
+    def loads(cls, value):
+        lines = {}
+        for line in (value or '').split(','):
+            product_id, _, quantity = line.partition(':')
+            if product_id.isdigit() and quantity.isdigit() and int(quantity) > 0:
+                lines[int(product_id)] = min(int(quantity), MAX_LINE_QUANTITY)
+        return cls(list(lines.items())[:MAX_ANONYMOUS_CART_LINES])
+
+    def dumps(self):
+        return ','.join(f'{product_id}:{quantity}' for product_id, quantity in self)
+
+    def add(self, product_id, quantity=1):
+        """Add to a line, returning False if the cart is full"""
+        if product_id not in self.lines and len(self) >= MAX_ANONYMOUS_CART_LINES:
+            return False
+        self.lines[product_id] = min(self.lines.get(product_id, 0) + quantity, MAX_LINE_QUANTITY)
+        self.modified = True
+        return True
+
+    def set(self, product_id, quantity):
+        if quantity <= 0:
+            return self.remove(product_id)
+        self.lines[product_id] = min(quantity, MAX_LINE_QUANTITY)
+        self.modified = True
+        return True
+
+    def remove(self, product_id):
+        """Drop a line, returning whether it was there"""
+        if self.lines.pop(product_id, None) is None:
+            return False
+        self.modified = True
+        return True
+
+    def clear(self):
+        if self.lines:
+            self.lines.clear()
+            self.modified = True
+
+    def items(self):
+        """Unsaved Cart rows for the cart page, newest first"""
+        products = Product.objects.select_related('vendor', 'primary_image').in_bulk(list(self.lines))
+        return [
+            Cart(product=products[product_id], quantity=quantity)
+            for product_id, quantity in reversed(list(self)) if product_id in products
+        ]
+
+    def save(self, response):
+        """Write the cookie back if the cart changed during the request"""
+        if not self.modified:
+            return
+        if self.lines:
+            response.set_signed_cookie(
+                ANONYMOUS_CART_COOKIE, self.dumps(), salt=ANONYMOUS_CART_SALT,
+                max_age=_max_age(), httponly=True, samesite='Lax',
+                secure=settings.SESSION_COOKIE_SECURE,
+            )
+        else:
+            response.delete_cookie(ANONYMOUS_CART_COOKIE, samesite='Lax')
+
+
+def get_anonymous_cart(request):
+    """The cookie cart of this request, loaded once"""
+    cart = getattr(request, '_bika_anonymous_cart', None)
+    if cart is None:
+        value = request.get_signed_cookie(
+            ANONYMOUS_CART_COOKIE, default=None, salt=ANONYMOUS_CART_SALT, max_age=_max_age()
+        )
+        cart = AnonymousCart.loads(value)
+        request._bika_anonymous_cart = cart
+    return cart
+
+
+def merge_anonymous_cart(request, user):
+    """Move the cookie cart into the user's Cart rows with one bulk upsert
+
+    Quantities are added to what the user already had in their cart,
+    capped at the stock of tracked products like add_to_cart does.
+    Returns the number of lines merged.
+    """
+    cart = get_anonymous_cart(request)
+    if not cart:
+        return 0
+    # product_id -> units available, None when stock is not tracked
+    available = {
+        pk: stock if track_inventory else None
+        for pk, track_inventory, stock in Product.objects.filter(
+            pk__in=list(cart.lines), status='active'
+        ).values_list('pk', 'track_inventory', 'stock_quantity')
+    }
+    existing = dict(Cart.objects.filter(
+        user=user, product_id__in=list(available)
+    ).values_list('product_id', 'quantity'))
+    rows = []
+    for product_id, quantity in cart:
+        if product_id not in available:
+            continue
+        quantity += existing.get(product_id, 0)
+        if available[product_id] is not None:
+            quantity = min(quantity, available[product_id])
+        if quantity > 0:
+            rows.append(Cart(user=user, product_id=product_id, quantity=quantity))
+    Cart.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['user', 'product'],
+        update_fields=['quantity', 'updated_at'],
+    )
+    cart.clear()
+    return len(rows)
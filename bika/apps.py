@@ -15,6 +15,8 @@ class BikaConfig(AppConfig):
         except ImportError:
             print("Bika: No signals module found")
         
+        from . import checks  # noqa: F401
+
         # Initialize any startup tasks here
         self.initialize_default_data()
     
@@ -0,0 +1,341 @@
+# bika/autocomplete.py - IN-PROCESS TYPEAHEAD INDEX
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from .models import Product, ProductCategory
+
+# Product fields that appear in suggestions
+SUGGESTED_PRODUCT_FIELDS = ['name', 'slug', 'brand', 'tags', 'status']
+
+# Every worker keeps its own copy of the index. Writes bump a shared version
+# in the cache and record what changed under that version, so each worker
+# replays only the changes it missed (falling back to a full rebuild when
+# the change log has expired or fallen too far behind).
+AUTOCOMPLETE_VERSION_KEY = 'bika:autocomplete:version'
+AUTOCOMPLETE_CHANGE_KEY = 'bika:autocomplete:change:{version}'
+AUTOCOMPLETE_CHANGE_TIMEOUT = 60 * 60 * 24
+MAX_REPLAYED_CHANGES = 500
+
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+
+# Prefix matches examined per query before ranking (bounds 1-letter queries)
+MAX_PREFIX_CANDIDATES = 200
+
+# Minimum trigram similarity for a typo correction
+FUZZY_THRESHOLD = 0.35
+
+# Suggestion types, in display priority
+KIND_RANK = {'category': 0, 'brand': 1, 'product': 2, 'tag': 3}
+
+_NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def normalize(text):
+    """Lowercase, strip accents and collapse punctuation to single spaces"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_WORD.sub(' ', text.lower()).strip()
+
+
+def trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class AutocompleteIndex:
+    """Sorted prefix index over product, category, brand and tag names"""
+
+    def __init__(self):
+        self.version = None
+        self._keys = []                     # sorted (normalized suffix, entry key)
+        self._entries = {}                  # entry key -> entry dict
+        self._words = defaultdict(int)      # vocabulary word -> reference count
+        self._word_trigrams = defaultdict(set)
+        self._product_terms = {}            # product id -> entry keys it contributes
+        self._bulk_loading = False
+
+    # ----- building -----
+
+    def _add_entry(self, entry_key, text, kind, slug=None):
+        entry = self._entries.get(entry_key)
+        if entry is not None:
+            entry['refs'] += 1
+            return
+
+        norm = normalize(text)
+        if not norm:
+            return
+        words = norm.split()
+        self._entries[entry_key] = {
+            'text': text.strip(), 'kind': kind, 'slug': slug,
+            'norm': norm, 'refs': 1,
+        }
+        # One key per word start, so "mango" also finds "Fresh Mango"
+        for i in range(len(words)):
+            key = (' '.join(words[i:]), entry_key)
+            if self._bulk_loading:
+                self._keys.append(key)  # sorted once in build_index()
+            else:
+                insort(self._keys, key)
+        for word in set(words):
+            if self._words[word] == 0:
+                for gram in trigrams(word):
+                    self._word_trigrams[gram].add(word)
+            self._words[word] += 1
+
+    def _release_entry(self, entry_key):
+        entry = self._entries.get(entry_key)
+        if entry is None:
+            return
+        entry['refs'] -= 1
+        if entry['refs'] > 0:
+            return
+
+        del self._entries[entry_key]
+        words = entry['norm'].split()
+        for i in range(len(words)):
+            key = (' '.join(words[i:]), entry_key)
+            position = bisect_left(self._keys, key)
+            if position < len(self._keys) and self._keys[position] == key:
+                del self._keys[position]
+        for word in set(words):
+            self._words[word] -= 1
+            if self._words[word] <= 0:
+                del self._words[word]
+                for gram in trigrams(word):
+                    self._word_trigrams[gram].discard(word)
+
+    def add_product(self, product_id, name, slug, brand='', tags=''):
+        terms = [('product', product_id)]
+        self._add_entry(('product', product_id), name, 'product', slug)
+        if brand and normalize(brand):
+            terms.append(('brand', normalize(brand)))
+            self._add_entry(terms[-1], brand, 'brand')
+        for tag in (tags or '').split(','):
+            if normalize(tag):
+                terms.append(('tag', normalize(tag)))
+                self._add_entry(terms[-1], tag, 'tag')
+        self._product_terms[product_id] = terms
+
+    def remove_product(self, product_id):
+        for entry_key in self._product_terms.pop(product_id, []):
+            self._release_entry(entry_key)
+
+    def add_category(self, category_id, name, slug):
+        self._add_entry(('category', category_id), name, 'category', slug)
+
+    def remove_category(self, category_id):
+        self._release_entry(('category', category_id))
+
+    # ----- querying -----
+
+    def _prefix_matches(self, norm):
+        matches = {}
+        position = bisect_left(self._keys, (norm,))
+        while position < len(self._keys) and len(matches) < MAX_PREFIX_CANDIDATES:
+            key, entry_key = self._keys[position]
+            if not key.startswith(norm):
+                break
+            at_start = self._entries[entry_key]['norm'] == key
+            matches[entry_key] = matches.get(entry_key, False) or at_start
+            position += 1
+        return matches
+
+    def correct(self, norm):
+        """Replace unknown words with the closest vocabulary word"""
+        corrected = []
+        words = norm.split()
+        for i, word in enumerate(words):
+            is_last = i == len(words) - 1
+            known = word in self._words or (
+                # The last word is still being typed, so a prefix is fine
+                is_last and self._prefix_matches(word)
+            )
+            if known or len(word) < 3:
+                corrected.append(word)
+                continue
+
+            grams = trigrams(word)
+            overlap = defaultdict(int)
+            for gram in grams:
+                for candidate in self._word_trigrams.get(gram, ()):
+                    overlap[candidate] += 1
+            best, best_score = word, FUZZY_THRESHOLD
+            for candidate, shared in overlap.items():
+                score = shared / (len(grams) + len(trigrams(candidate)) - shared)
+                if score > best_score:
+                    best, best_score = candidate, score
+            corrected.append(best)
+        return ' '.join(corrected)
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Suggestions for a partial query, with typo correction as fallback"""
+        norm = normalize(query)
+        if not norm:
+            return [], None
+
+        corrected = None
+        matches = self._prefix_matches(norm)
+        if len(matches) < limit:
+            candidate = self.correct(norm)
+            if candidate != norm:
+                for entry_key, at_start in self._prefix_matches(candidate).items():
+                    matches.setdefault(entry_key, at_start)
+                corrected = candidate
+
+        ranked = sorted(
+            matches.items(),
+            key=lambda item: (
+                not item[1],
+                KIND_RANK[self._entries[item[0]]['kind']],
+                -self._entries[item[0]]['refs'],
+                len(self._entries[item[0]]['text']),
+            )
+        )
+        return [self._entries[entry_key] for entry_key, _ in ranked[:limit]], corrected
+
+# ==================== SHARED VERSION ====================
+
+def get_autocomplete_version():
+    version = cache.get(AUTOCOMPLETE_VERSION_KEY)
+    if version is None:
+        # Start from the clock so a lost key never brings back an old
+        # version that some worker still holds
+        cache.add(AUTOCOMPLETE_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(AUTOCOMPLETE_VERSION_KEY)
+    return version
+
+
+def record_autocomplete_change(kind, object_id):
+    """Publish a changed product/category to every worker's index
+
+    Workers see it through the shared cache (see CACHES in settings).
+    """
+    try:
+        version = cache.incr(AUTOCOMPLETE_VERSION_KEY)
+    except ValueError:
+        # Version lost - every worker will see a new version and rebuild
+        get_autocomplete_version()
+        return
+    cache.set(
+        AUTOCOMPLETE_CHANGE_KEY.format(version=version),
+        (kind, object_id),
+        AUTOCOMPLETE_CHANGE_TIMEOUT
+    )
+
+
+def schedule_autocomplete_change(kind, object_id):
+    transaction.on_commit(lambda: record_autocomplete_change(kind, object_id))
+
+
+def invalidate_autocomplete():
+    """Force a full rebuild, for bulk writes that send no signals"""
+    try:
+        # A version with no change record cannot be replayed
+        cache.incr(AUTOCOMPLETE_VERSION_KEY)
+    except ValueError:
+        get_autocomplete_version()
+
+# ==================== LOADING ====================
+
+def _load_products(index, ids=None):
+    products = Product.objects.filter(status='active')
+    if ids is not None:
+        products = products.filter(id__in=ids)
+    for row in products.values_list('id', 'name', 'slug', 'brand', 'tags').iterator():
+        index.add_product(*row)
+
+
+def _load_categories(index, ids=None):
+    categories = ProductCategory.objects.filter(is_active=True)
+    if ids is not None:
+        categories = categories.filter(id__in=ids)
+    for row in categories.values_list('id', 'name', 'slug').iterator():
+        index.add_category(*row)
+
+
+def build_index(version):
+    index = AutocompleteIndex()
+    index._bulk_loading = True
+    _load_products(index)
+    _load_categories(index)
+    index._keys.sort()
+    index._bulk_loading = False
+    index.version = version
+    return index
+
+
+def _replay_changes(index, version):
+    """Apply the changes between index.version and version, or return False"""
+    if not 0 < version - index.version <= MAX_REPLAYED_CHANGES:
+        return False
+    keys = [
+        AUTOCOMPLETE_CHANGE_KEY.format(version=v)
+        for v in range(index.version + 1, version + 1)
+    ]
+    changes = cache.get_many(keys)
+    if len(changes) != len(keys):
+        return False
+
+    changed = defaultdict(set)
+    for kind, object_id in changes.values():
+        changed[kind].add(object_id)
+
+    for product_id in changed['product']:
+        index.remove_product(product_id)
+    for category_id in changed['category']:
+        index.remove_category(category_id)
+    if changed['product']:
+        _load_products(index, changed['product'])
+    if changed['category']:
+        _load_categories(index, changed['category'])
+
+    index.version = version
+    return True
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_index():
+    """This worker's index, brought up to the shared version"""
+    global _index
+    version = get_autocomplete_version()
+    if _index is not None and _index.version == version:
+        return _index
+
+    with _lock:
+        if _index is None:
+            _index = build_index(version)
+        elif _index.version != version and not _replay_changes(_index, version):
+            _index = build_index(version)
+        return _index
+
+
+def suggest(query, limit=DEFAULT_LIMIT):
+    """JSON-ready suggestions for a partial query"""
+    index = get_index()
+    with _lock:
+        # Replays mutate the index in place, so never read mid-update
+        entries, corrected = index.search(query, limit)
+    suggestions = []
+    for entry in entries:
+        if entry['kind'] == 'product':
+            url = reverse('bika:product_detail', kwargs={'slug': entry['slug']})
+        elif entry['kind'] == 'category':
+            url = reverse('bika:products_by_category', kwargs={'category_slug': entry['slug']})
+        else:
+            url = f"{reverse('bika:product_list')}?{urlencode({'q': entry['text']})}"
+        suggestions.append({'text': entry['text'], 'type': entry['kind'], 'url': url})
+    return {'query': query, 'corrected': corrected, 'suggestions': suggestions}
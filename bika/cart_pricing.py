@@ -0,0 +1,86 @@
+# bika/cart_pricing.py - CART SUBTOTAL, TAX, SHIPPING AND TOTAL
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db.models import Count, DecimalField, F, Sum
+
+from .models import Cart, Product
+from .anonymous_cart import get_anonymous_cart
+
+CENTS = Decimal('0.01')
+
+CartTotals = namedtuple(
+    'CartTotals', 'count quantity subtotal tax_rate tax_amount shipping_cost total'
+)
+
+
+def _setting(name, default):
+    return Decimal(str(settings.BIKA_SETTINGS.get(name, default)))
+
+
+def price_cart(subtotal, count, quantity=None):
+    """Tax, shipping and total for a cart subtotal
+
+    Shipping is SHIPPING_COST, waived from FREE_SHIPPING_THRESHOLD up and
+    for an empty cart; tax is DEFAULT_TAX_RATE of the subtotal.
+    """
+    subtotal = Decimal(subtotal or 0).quantize(CENTS)
+    tax_rate = _setting('DEFAULT_TAX_RATE', '0.18')
+    tax_amount = (subtotal * tax_rate).quantize(CENTS, rounding=ROUND_HALF_UP)
+    shipping_cost = Decimal('0.00')
+    if count and subtotal < _setting('FREE_SHIPPING_THRESHOLD', '100000'):
+        shipping_cost = _setting('SHIPPING_COST', '5000').quantize(CENTS)
+    return CartTotals(
+        count=count,
+        quantity=count if quantity is None else quantity,
+        subtotal=subtotal,
+        tax_rate=tax_rate,
+        tax_amount=tax_amount,
+        shipping_cost=shipping_cost,
+        total=subtotal + tax_amount + shipping_cost,
+    )
+
+
+def cart_totals(user_id):
+    """CartTotals of a user's cart from a single aggregate query"""
+    totals = Cart.objects.filter(user_id=user_id).aggregate(
+        count=Count('id'),
+        units=Sum('quantity'),
+        subtotal=Sum(
+            F('quantity') * F('product__price'),
+            output_field=DecimalField(max_digits=12, decimal_places=2)
+        ),
+    )
+    return price_cart(totals['subtotal'], totals['count'], totals['units'] or 0)
+
+
+def anonymous_cart_totals(cart):
+    """CartTotals of an AnonymousCart, pricing its lines in one query"""
+    if not cart:
+        return price_cart(0, 0)
+    prices = dict(Product.objects.filter(pk__in=list(cart.lines)).values_list('pk', 'price'))
+    lines = [(prices[product_id], quantity) for product_id, quantity in cart if product_id in prices]
+    return price_cart(
+        sum(price * quantity for price, quantity in lines), len(lines),
+        sum(quantity for _, quantity in lines)
+    )
+
+
+def get_request_cart_totals(request):
+    """Totals of the current user's cart (or cookie cart), memoized on the request"""
+    totals = getattr(request, '_bika_cart_totals', None)
+    if totals is None:
+        if request.user.is_authenticated:
+            totals = cart_totals(request.user.pk)
+        else:
+            totals = anonymous_cart_totals(get_anonymous_cart(request))
+        request._bika_cart_totals = totals
+    return totals
+
+
+def forget_request_cart_totals(request):
+    """Drop the memoized totals after the cart changed during the request"""
+    request.__dict__.pop('_bika_cart_totals', None)
+    # Signed-out header counters are derived from the totals
+    request.__dict__.pop('_bika_user_counters', None)
@@ -0,0 +1,37 @@
+# bika/checks.py - SYSTEM CHECKS
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Backends whose contents other processes cannot see
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+# Printed by worker commands, which unlike web processes skip the deploy check
+PROCESS_LOCAL_CACHE_WARNING = (
+    'The default cache is local to this process: badge counts and cache '
+    'invalidations written here will not reach the web processes. Set '
+    'BIKA_CACHE_URL (see bika.E001).'
+)
+
+
+def cache_is_shared():
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Invalidation only reaches other processes through a shared cache"""
+    if cache_is_shared():
+        return []
+    return [Error(
+        'The default cache is local to each process.',
+        hint=(
+            'Cache versions and counters written by one web or worker '
+            'process would never reach the others. Set BIKA_CACHE_URL to a '
+            'Redis, Memcached or database cache.'
+        ),
+        id='bika.E001',
+    )]
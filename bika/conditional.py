@@ -0,0 +1,139 @@
+# bika/conditional.py - ETAG / LAST-MODIFIED FOR PRODUCT RESOURCES
+import hashlib
+import time
+from collections import namedtuple
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .models import Product
+from .page_cache import BASE_PAGE_TAGS, get_tag_versions
+from .anonymous_cart import ANONYMOUS_CART_COOKIE
+
+# Changes that leave the product row untouched (image uploads, review
+# edits) are tracked by a per-product timestamp that signals bump
+PRODUCT_VERSION_KEY = 'bika:product_version:{pk}'
+
+Validators = namedtuple('Validators', 'pk etag last_modified')
+
+# Product columns whose values are shown by the barcode API; fields
+# changed by QuerySet.update() (status, review aggregates, primary image)
+# are compared by value since they do not move updated_at
+API_VALIDATOR_FIELDS = (
+    'pk', 'updated_at', 'status', 'is_featured', 'stock_quantity', 'avg_rating', 'review_count',
+    'primary_image_id', 'category__name', 'category__slug', 'vendor__updated_at',
+)
+PAGE_VALIDATOR_FIELDS = (
+    'pk', 'updated_at', 'avg_rating', 'review_count', 'primary_image_id',
+)
+
+# ==================== PRODUCT VERSIONS ====================
+
+def get_product_version(pk):
+    """Time (ms) of the last image/review change of a product"""
+    key = PRODUCT_VERSION_KEY.format(pk=pk)
+    version = cache.get(key)
+    if version is None:
+        # Unknown (evicted) counts as changed now, which only costs a 200
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_product_version(pk):
+    cache.set(PRODUCT_VERSION_KEY.format(pk=pk), int(time.time() * 1000), None)
+
+
+def schedule_product_version_bump(pk):
+    """Bump once the current transaction commits"""
+    if pk is not None:
+        transaction.on_commit(lambda: bump_product_version(pk))
+
+# ==================== VALIDATORS ====================
+
+def _etag(*parts):
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def product_api_validators(request, barcode):
+    """Validators for api_product_detail from one narrow row lookup
+
+    ETag only: stock decrements and bulk status changes use update() and
+    leave updated_at alone, so no timestamp covers every change and a
+    Last-Modified would answer If-Modified-Since with stale stock.
+    """
+    row = Product.objects.filter(barcode=barcode).values_list(*API_VALIDATOR_FIELDS).first()
+    if row is None:
+        return None
+    return Validators(
+        pk=row[0],
+        etag=_etag(row, get_product_version(row[0])),
+        last_modified=None,
+    )
+
+
+def product_page_validators(request, slug):
+    """Validators for product_detail_view, for anonymous visitors only
+
+    The page also shows the header, related products and (for signed-in
+    users) cart/wishlist state, so it is validated against the page-cache
+    tag versions as well. Those are counters rather than times, so the
+    page gets an ETag but no Last-Modified.
+    """
+    if request.user.is_authenticated or len(messages.get_messages(request)):
+        return None
+    row = Product.objects.filter(slug=slug, status='active').values_list(*PAGE_VALIDATOR_FIELDS).first()
+    if row is None:
+        return None
+    tag_versions = get_tag_versions(BASE_PAGE_TAGS)
+    # Keeps the form tokens in a revalidated page matching the CSRF cookie,
+    # and the header cart badge matching the cookie cart
+    cookies = [request.COOKIES.get(name) for name in (settings.CSRF_COOKIE_NAME, ANONYMOUS_CART_COOKIE)]
+    return Validators(
+        pk=row[0],
+        etag=_etag(row, get_product_version(row[0]), sorted(tag_versions.items()), cookies),
+        last_modified=None,
+    )
+
+# ==================== DECORATOR ====================
+
+def conditional_product(get_validators, not_modified=None):
+    """Answer conditional GETs for a product resource without running the view
+
+    get_validators(request, *args, **kwargs) returns Validators, or None to
+    always run the view. not_modified(request, validators) is called for
+    requests answered with 304.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            validators = None
+            if request.method in ('GET', 'HEAD'):
+                validators = get_validators(request, *args, **kwargs)
+            if validators is None:
+                return view(request, *args, **kwargs)
+
+            etag = quote_etag(validators.etag)
+            response = get_conditional_response(
+                request, etag=etag, last_modified=validators.last_modified
+            )
+            if response is not None:
+                if response.status_code == 304 and not_modified is not None:
+                    not_modified(request, validators)
+            else:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response.headers.setdefault('ETag', etag)
+            if validators.last_modified is not None:
+                response.headers.setdefault('Last-Modified', http_date(validators.last_modified))
+            # Let clients keep a copy but check back every time
+            patch_cache_control(response, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -1,118 +1,63 @@
 # bika/context_processors.py
-from django.db import DatabaseError
-from .models import SiteInfo, Service, Cart, ProductCategory, Product, Notification
+import datetime
+
+from django.conf import settings
+
+from .models import Cart
+from .page_cache import CSRF_PLACEHOLDER
+from .site_context import get_global_context, GLOBAL_CONTEXT_KEYS
+from .user_counters import get_request_counters
+from .cart_pricing import get_request_cart_totals
+
+# ==================== LAZY VALUES ====================
+# Context processors run for every render() call, but most pages only use
+# a handful of these values. Django templates call callables when they
+# resolve a variable, so every value below is a memoized callable: nothing
+# is queried (or even looked up in the cache) until a template touches it,
+# and it is computed at most once per request.
+
+class LazyValue:
+    """Callable that computes its value on first use and memoizes it"""
+
+    def __init__(self, func):
+        self._func = func
+        self._evaluated = False
+        self._value = None
+
+    def __call__(self):
+        if not self._evaluated:
+            self._value = self._func()
+            self._evaluated = True
+        return self._value
+
+    def __repr__(self):
+        state = repr(self._value) if self._evaluated else 'not evaluated'
+        return f"<LazyValue: {state}>"
+
+
+def lazy_items(source, keys):
+    """One LazyValue per key, all sharing a single lazily computed dict"""
+    source = LazyValue(source)
+    return {key: LazyValue(lambda key=key: source()[key]) for key in keys}
+
 
 def site_info(request):
     """Add comprehensive site information to all templates"""
     context = {}
-    
-    # 1. Site Information
-    try:
-        site_info_obj = SiteInfo.objects.first()
-        if not site_info_obj:
-            # Create default site info if it doesn't exist
-            site_info_obj = SiteInfo.objects.create(
-                name="Bika",
-                tagline="AI-Powered Fruit Quality Monitoring & E-commerce Platform",
-                description="Your Success Is Our Business - Bika provides exceptional services to help your business grow.",
-                email="contact@bika.com",
-                phone="+255 123 456 789",
-                address="Dar es Salaam, Tanzania",
-                facebook_url="https://facebook.com/bika",
-                twitter_url="https://twitter.com/bika",
-                instagram_url="https://instagram.com/bika",
-                linkedin_url="https://linkedin.com/company/bika",
-            )
-        context['site_info'] = site_info_obj
-        context['site_name'] = site_info_obj.name
-        context['site_email'] = site_info_obj.email
-        context['site_phone'] = site_info_obj.phone
-        context['site_address'] = site_info_obj.address
-    except DatabaseError:
-        # Database not ready (tables not created yet)
-        context['site_info'] = None
-        context['site_name'] = 'Bika'
-        context['site_email'] = 'contact@bika.com'
-        context['site_phone'] = '+255 123 456 789'
-        context['site_address'] = 'Dar es Salaam, Tanzania'
-    except Exception as e:
-        print(f"SiteInfo error: {e}")
-        context['site_info'] = None
-        context['site_name'] = 'Bika'
-        context['site_email'] = 'contact@bika.com'
-    
-    # 2. Featured Services (for navigation dropdown)
-    try:
-        context['featured_services'] = Service.objects.filter(
-            is_active=True
-        ).order_by('display_order')[:6]
-    except Exception:
-        context['featured_services'] = []
-    
-    # 3. Product Categories (for navigation)
-    try:
-        context['product_categories'] = ProductCategory.objects.filter(
-            is_active=True,
-            parent__isnull=True  # Only top-level categories
-        ).order_by('display_order')[:8]
-    except Exception:
-        context['product_categories'] = []
-    
-    # 4. Cart Count (for header badge)
-    try:
-        if request.user.is_authenticated:
-            context['cart_count'] = Cart.objects.filter(user=request.user).count()
-            context['cart_total'] = sum(
-                item.total_price for item in 
-                Cart.objects.filter(user=request.user).select_related('product')
-            )
-        else:
-            context['cart_count'] = 0
-            context['cart_total'] = 0
-    except Exception:
-        context['cart_count'] = 0
-        context['cart_total'] = 0
-    
-    # 5. Wishlist Count
-    try:
-        if request.user.is_authenticated:
-            from .models import Wishlist
-            context['wishlist_count'] = Wishlist.objects.filter(user=request.user).count()
-        else:
-            context['wishlist_count'] = 0
-    except Exception:
-        context['wishlist_count'] = 0
-    
-    # 6. Unread Notifications Count
-    try:
-        if request.user.is_authenticated:
-            context['unread_notifications_count'] = Notification.objects.filter(
-                user=request.user,
-                is_read=False
-            ).count()
-            
-            # Get critical notifications
-            context['critical_notifications_count'] = Notification.objects.filter(
-                user=request.user,
-                is_read=False,
-                notification_type='urgent_alert'
-            ).count()
-        else:
-            context['unread_notifications_count'] = 0
-            context['critical_notifications_count'] = 0
-    except Exception:
-        context['unread_notifications_count'] = 0
-        context['critical_notifications_count'] = 0
-    
-    # 7. Featured Products (for mini display in header)
-    try:
-        context['featured_products_header'] = Product.objects.filter(
-            status='active',
-            is_featured=True
-        ).select_related('category', 'vendor')[:3]
-    except Exception:
-        context['featured_products_header'] = []
-    
+
+    # 1-3. Global data (site info, services, categories, featured products,
+    # footer stats, meta and social links) comes from a cached snapshot
+    # that model signals invalidate - see bika/site_context.py
+    context.update(lazy_items(get_global_context, GLOBAL_CONTEXT_KEYS))
+
+    # 4-6. Cart, wishlist and notification badges (one cache lookup,
+    # maintained by signals - see bika/user_counters.py)
+    context.update(lazy_items(
+        lambda: get_request_counters(request),
+        ['cart_count', 'cart_total', 'wishlist_count',
+         'unread_notifications_count', 'critical_notifications_count']
+    ))
+
     # 8. User Type Information
     if request.user.is_authenticated:
         context['user_is_vendor'] = request.user.is_vendor()
@@ -124,138 +69,90 @@ def site_info(request):
         context['user_is_customer'] = False
         context['user_is_admin'] = False
         context['user_has_business'] = False
-    
+
     # 9. Current Year (for footer)
-    import datetime
     context['current_year'] = datetime.datetime.now().year
-    
+
     # 10. Development/Production Mode
-    from django.conf import settings
     context['debug_mode'] = settings.DEBUG
-    
+
     # 11. Currency Information
     context['default_currency'] = 'TZS'  # Tanzanian Shilling
     context['currency_symbol'] = 'TSh'
-    
-    # 12. Site Statistics (for footer)
-    try:
-        context['total_products'] = Product.objects.filter(status='active').count()
-        context['total_categories'] = ProductCategory.objects.filter(is_active=True).count()
-        context['total_vendors'] = Cart.objects.filter(
-            user__user_type='vendor',
-            user__is_active=True
-        ).values('user').distinct().count()
-    except Exception:
-        context['total_products'] = 0
-        context['total_categories'] = 0
-        context['total_vendors'] = 0
-    
+
     # 13. Fruit Monitoring Stats (for vendor/admin dashboard)
-    try:
-        if request.user.is_authenticated and (request.user.is_vendor() or request.user.is_staff):
-            from .models import FruitBatch, FruitQualityReading
-            context['fruit_batch_count'] = FruitBatch.objects.filter(
-                product__vendor=request.user
-            ).count() if request.user.is_vendor() else FruitBatch.objects.count()
-            context['fruit_reading_count'] = FruitQualityReading.objects.count()
-        else:
-            context['fruit_batch_count'] = 0
-            context['fruit_reading_count'] = 0
-    except Exception:
-        context['fruit_batch_count'] = 0
-        context['fruit_reading_count'] = 0
-    
+    context.update(lazy_items(
+        lambda: fruit_monitoring_stats(request.user),
+        ['fruit_batch_count', 'fruit_reading_count']
+    ))
+
     # 14. Current Path (for active menu highlighting)
     context['current_path'] = request.path
-    
+
     # 15. Query Parameters (for maintaining filters)
-    context['query_params'] = request.GET.urlencode()
-    
-    # 16. Meta Information
-    context['meta_description'] = getattr(site_info_obj, 'meta_description', 
-        "Bika is an AI-powered platform for fruit quality monitoring and e-commerce. "
-        "We help businesses optimize storage, predict quality, and increase sales.")
-    
-    context['meta_title'] = getattr(site_info_obj, 'meta_title', 
-        "Bika - AI-Powered Fruit Quality Monitoring & E-commerce Platform")
-    
-    # 17. Social Media URLs
-    context['social_facebook'] = getattr(site_info_obj, 'facebook_url', '')
-    context['social_twitter'] = getattr(site_info_obj, 'twitter_url', '')
-    context['social_instagram'] = getattr(site_info_obj, 'instagram_url', '')
-    context['social_linkedin'] = getattr(site_info_obj, 'linkedin_url', '')
-    
+    context['query_params'] = LazyValue(request.GET.urlencode)
+
+    # 16. Pages rendered for the shared page cache get a placeholder token,
+    # swapped for the visitor's own on every response (bika/page_cache.py)
+    if getattr(request, '_bika_page_cache', False):
+        context['csrf_token'] = CSRF_PLACEHOLDER
+
     return context
 
 
+def fruit_monitoring_stats(user):
+    """Fruit batch and reading counts for vendors and staff"""
+    stats = {'fruit_batch_count': 0, 'fruit_reading_count': 0}
+    try:
+        if user.is_authenticated and (user.is_vendor() or user.is_staff):
+            from .models import FruitBatch, FruitQualityReading
+            stats['fruit_batch_count'] = FruitBatch.objects.filter(
+                product__vendor=user
+            ).count() if user.is_vendor() else FruitBatch.objects.count()
+            stats['fruit_reading_count'] = FruitQualityReading.objects.count()
+    except Exception:
+        pass
+    return stats
+
+
 def cart_details(request):
     """Detailed cart information (can be used in cart-specific pages)"""
-    context = {}
-    
-    try:
-        if request.user.is_authenticated:
-            cart_items = Cart.objects.filter(
-                user=request.user
-            ).select_related('product')
-            
-            subtotal = sum(item.total_price for item in cart_items)
-            tax_rate = 0.18  # 18% VAT
-            tax_amount = subtotal * tax_rate
-            shipping_cost = 5000  # Fixed shipping cost
-            total_amount = subtotal + tax_amount + shipping_cost
-            
-            context['cart_items_detailed'] = cart_items
-            context['cart_subtotal'] = subtotal
-            context['cart_tax_amount'] = tax_amount
-            context['cart_shipping_cost'] = shipping_cost
-            context['cart_total_amount'] = total_amount
-            context['cart_tax_rate'] = tax_rate
-        else:
-            context['cart_items_detailed'] = []
-            context['cart_subtotal'] = 0
-            context['cart_tax_amount'] = 0
-            context['cart_shipping_cost'] = 0
-            context['cart_total_amount'] = 0
-            context['cart_tax_rate'] = 0.18
-    except Exception as e:
-        print(f"Cart details error: {e}")
-        context['cart_items_detailed'] = []
-        context['cart_subtotal'] = 0
-        context['cart_tax_amount'] = 0
-        context['cart_shipping_cost'] = 0
-        context['cart_total_amount'] = 0
-        context['cart_tax_rate'] = 0.18
-    
-    return context
+    return lazy_items(
+        lambda: cart_details_for(request),
+        ['cart_items_detailed', 'cart_subtotal', 'cart_tax_amount',
+         'cart_shipping_cost', 'cart_total_amount', 'cart_tax_rate']
+    )
+
+
+def cart_details_for(request):
+    """Compute the detailed cart values for the current user"""
+    totals = get_request_cart_totals(request)
+    cart_items = []
+    if request.user.is_authenticated:
+        cart_items = Cart.objects.filter(user=request.user).select_related('product')
+    return {
+        'cart_items_detailed': cart_items,
+        'cart_subtotal': totals.subtotal,
+        'cart_tax_amount': totals.tax_amount,
+        'cart_shipping_cost': totals.shipping_cost,
+        'cart_total_amount': totals.total,
+        'cart_tax_rate': totals.tax_rate,
+    }
 
 
 def user_profile_info(request):
     """User profile information"""
     context = {}
-    
+
     if request.user.is_authenticated:
         context['user_profile'] = request.user
-        
+
         # Check if user has any pending actions
-        try:
-            from .models import Order, ProductAlert
-            context['pending_orders'] = Order.objects.filter(
-                user=request.user,
-                status='pending'
-            ).count()
-            
-            if request.user.is_vendor():
-                context['unresolved_alerts'] = ProductAlert.objects.filter(
-                    product__vendor=request.user,
-                    is_resolved=False
-                ).count()
-            else:
-                context['unresolved_alerts'] = 0
-                
-        except Exception:
-            context['pending_orders'] = 0
-            context['unresolved_alerts'] = 0
-    
+        context.update(lazy_items(
+            lambda: get_request_counters(request),
+            ['pending_orders', 'unresolved_alerts']
+        ))
+
     return context
 
 
@@ -264,4 +161,4 @@ context_processors_list = [
     'bika.context_processors.site_info',
     'bika.context_processors.cart_details',
     'bika.context_processors.user_profile_info',
-]
\ No newline at end of file
+]
@@ -0,0 +1,261 @@
+# bika/facets.py - FACETED FILTER COUNTS FOR PRODUCT LISTINGS
+import hashlib
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, Q, Value, When, CharField
+
+from .models import Product, ProductCategory
+from .search import search_products
+from .site_context import get_global_context_version
+
+# Facet results are cached per filter signature under the global context
+# version, which every Product/ProductCategory write already bumps (see
+# bika/signals.py), so a catalog change retires every cached facet set.
+FACET_CACHE_KEY = 'bika:facets:v{version}:{signature}'
+CATEGORY_TREE_KEY = 'bika:facets:categories:v{version}'
+DEFAULT_FACET_TIMEOUT = 60 * 15
+
+# (value, label, min inclusive, max exclusive) - prices are in TZS
+PRICE_BUCKETS = [
+    ('under-5k', 'Under 5,000', None, Decimal('5000')),
+    ('5k-20k', '5,000 - 20,000', Decimal('5000'), Decimal('20000')),
+    ('20k-100k', '20,000 - 100,000', Decimal('20000'), Decimal('100000')),
+    ('100k-500k', '100,000 - 500,000', Decimal('100000'), Decimal('500000')),
+    ('over-500k', '500,000 and above', Decimal('500000'), None),
+]
+
+# "N stars & up" rating filters
+MIN_RATINGS = ('4', '3', '2', '1')
+
+# Brands shown in the sidebar (selected brands are always shown)
+MAX_BRANDS = 15
+
+FACETS = ('category', 'brand', 'condition', 'price')
+
+
+def _price(value):
+    try:
+        price = Decimal(value)
+    except (TypeError, InvalidOperation):
+        return None
+    return str(price) if price.is_finite() else None
+
+
+def parse_filters(params, category=None):
+    """Normalized filter set for a listing request
+
+    Equivalent requests (different parameter order, case or spacing in
+    the query) give the same dict, and so share cached facets.
+    """
+    conditions = dict(Product.CONDITION_CHOICES)
+    buckets = {value for value, _, _, _ in PRICE_BUCKETS}
+    return {
+        'q': ' '.join(params.get('q', '').lower().split()),
+        'category': category.pk if category else None,
+        'brand': sorted({brand.strip() for brand in params.getlist('brand') if brand.strip()}),
+        'condition': sorted({c for c in params.getlist('condition') if c in conditions}),
+        'price': sorted({p for p in params.getlist('price') if p in buckets}),
+        'min_price': _price(params.get('min_price')),
+        'max_price': _price(params.get('max_price')),
+        'min_rating': params.get('rating') if params.get('rating') in MIN_RATINGS else None,
+    }
+
+
+def filter_signature(filters):
+    return hashlib.md5(json.dumps(filters, sort_keys=True).encode()).hexdigest()
+
+# ==================== CATEGORY TREE ====================
+
+def get_category_tree():
+    """Active categories as {'top': [...], 'parent': {id: parent_id}}"""
+    key = CATEGORY_TREE_KEY.format(version=get_global_context_version())
+    tree = cache.get(key)
+    if tree is None:
+        rows = list(
+            ProductCategory.objects.filter(is_active=True).values('id', 'name', 'slug', 'parent_id')
+        )
+        tree = {
+            'top': [
+                {'id': row['id'], 'name': row['name'], 'slug': row['slug']}
+                for row in rows if row['parent_id'] is None
+            ],
+            'parent': {row['id']: row['parent_id'] for row in rows},
+        }
+        cache.set(key, tree, settings.BIKA_SETTINGS.get('FACET_CACHE_TIMEOUT', DEFAULT_FACET_TIMEOUT))
+    return tree
+
+
+def _top_category(tree, category_id):
+    seen = set()
+    while tree['parent'].get(category_id) is not None and category_id not in seen:
+        seen.add(category_id)
+        category_id = tree['parent'][category_id]
+    return category_id if category_id in tree['parent'] else None
+
+
+def _category_ids(tree, category_id):
+    """A category and everything below it"""
+    return {
+        candidate for candidate in tree['parent']
+        if candidate == category_id or _is_below(tree, candidate, category_id)
+    }
+
+
+def _is_below(tree, candidate, ancestor):
+    seen = set()
+    parent = tree['parent'].get(candidate)
+    while parent is not None and parent not in seen:
+        if parent == ancestor:
+            return True
+        seen.add(parent)
+        parent = tree['parent'].get(parent)
+    return False
+
+# ==================== FILTERING ====================
+
+def _price_bucket_q(value):
+    for bucket, _, low, high in PRICE_BUCKETS:
+        if bucket == value:
+            condition = Q()
+            if low is not None:
+                condition &= Q(price__gte=low)
+            if high is not None:
+                condition &= Q(price__lt=high)
+            return condition
+    return Q()
+
+
+def _base_filter(queryset, filters):
+    """Filters that apply to every facet (price range, rating); not the search"""
+    if filters['min_price'] is not None:
+        queryset = queryset.filter(price__gte=filters['min_price'])
+    if filters['max_price'] is not None:
+        queryset = queryset.filter(price__lte=filters['max_price'])
+    if filters['min_rating'] is not None:
+        queryset = queryset.filter(avg_rating__gte=filters['min_rating'])
+    return queryset
+
+
+def filter_products(queryset, filters):
+    """Apply the price range and facet selections to a Product queryset"""
+    queryset = _base_filter(queryset, filters)
+    if filters['category'] is not None:
+        queryset = queryset.filter(
+            category_id__in=_category_ids(get_category_tree(), filters['category'])
+        )
+    if filters['brand']:
+        queryset = queryset.filter(brand__in=filters['brand'])
+    if filters['condition']:
+        queryset = queryset.filter(condition__in=filters['condition'])
+    if filters['price']:
+        bucket_q = Q()
+        for value in filters['price']:
+            bucket_q |= _price_bucket_q(value)
+        queryset = queryset.filter(bucket_q)
+    return queryset
+
+# ==================== COUNTING ====================
+
+def _price_bucket_expression():
+    whens = []
+    for value, _, low, high in PRICE_BUCKETS:
+        if high is not None:
+            whens.append(When(price__lt=high, then=Value(value)))
+    return Case(*whens, default=Value(PRICE_BUCKETS[-1][0]), output_field=CharField())
+
+
+def get_facets(filters):
+    """Counts for every facet value under the current filters
+
+    Selections within a facet are OR-ed and between facets AND-ed, so each
+    facet is counted with every filter except its own - the sidebar shows
+    how many results picking another brand would give, not just the brand
+    already picked. All four facets come from one GROUP BY over
+    (category, brand, condition, price bucket); the rest is done here.
+    """
+    key = FACET_CACHE_KEY.format(
+        version=get_global_context_version(), signature=filter_signature(filters)
+    )
+    facets = cache.get(key)
+    if facets is None:
+        facets = build_facets(filters)
+        cache.set(key, facets, settings.BIKA_SETTINGS.get('FACET_CACHE_TIMEOUT', DEFAULT_FACET_TIMEOUT))
+    return facets
+
+
+def build_facets(filters):
+    tree = get_category_tree()
+    products = Product.objects.filter(status='active')
+    if filters['q']:
+        products, _ = search_products(products, filters['q'])
+    products = _base_filter(products, filters)
+
+    rows = list(
+        products.order_by()
+        .annotate(price_bucket=_price_bucket_expression())
+        .values('category_id', 'brand', 'condition', 'price_bucket')
+        .annotate(count=Count('id'))
+    )
+
+    selected_categories = (
+        _category_ids(tree, filters['category']) if filters['category'] is not None else None
+    )
+    tests = {
+        'category': lambda row: selected_categories is None or row['category_id'] in selected_categories,
+        'brand': lambda row: not filters['brand'] or row['brand'] in filters['brand'],
+        'condition': lambda row: not filters['condition'] or row['condition'] in filters['condition'],
+        'price': lambda row: not filters['price'] or row['price_bucket'] in filters['price'],
+    }
+
+    total = 0
+    counts = {facet: {} for facet in FACETS}
+    for row in rows:
+        passed = {facet for facet in FACETS if tests[facet](row)}
+        if len(passed) == len(FACETS):
+            total += row['count']
+        top = _top_category(tree, row['category_id'])
+        values = {
+            'category': top,
+            'brand': row['brand'],
+            'condition': row['condition'],
+            'price': row['price_bucket'],
+        }
+        for facet in FACETS:
+            # Counted when every *other* facet matches
+            if len(passed - {facet}) == len(FACETS) - 1 and values[facet] not in (None, ''):
+                counts[facet][values[facet]] = counts[facet].get(values[facet], 0) + row['count']
+
+    brands = sorted(counts['brand'].items(), key=lambda item: (-item[1], item[0].lower()))
+    shown_brands = [
+        item for position, item in enumerate(brands)
+        if position < MAX_BRANDS or item[0] in filters['brand']
+    ]
+    selected_top = _top_category(tree, filters['category']) if filters['category'] else None
+
+    return {
+        'total': total,
+        'all_categories': sum(counts['category'].values()),
+        'categories': [
+            {**category, 'product_count': counts['category'].get(category['id'], 0),
+             'selected': category['id'] == selected_top}
+            for category in tree['top']
+        ],
+        'brands': [
+            {'value': brand, 'count': count, 'selected': brand in filters['brand']}
+            for brand, count in shown_brands
+        ],
+        'conditions': [
+            {'value': value, 'label': label, 'count': counts['condition'].get(value, 0),
+             'selected': value in filters['condition']}
+            for value, label in Product.CONDITION_CHOICES
+            if counts['condition'].get(value) or value in filters['condition']
+        ],
+        'price_buckets': [
+            {'value': value, 'label': label, 'count': counts['price'].get(value, 0),
+             'selected': value in filters['price']}
+            for value, label, _, _ in PRICE_BUCKETS
+        ],
+    }
@@ -0,0 +1,206 @@
+# bika/gateway_transport.py - POOLED HTTP TRANSPORT FOR PAYMENT GATEWAYS
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# One keep-alive session per PaymentGatewaySettings entry, so a payment
+# does not pay for a new TCP/TLS handshake (and OAuth token) each time,
+# and a circuit breaker that fails fast while a provider is down instead
+# of holding checkout requests for the full timeout.
+DEFAULT_GATEWAY_TIMEOUT = (3.05, 10)  # Connect, read seconds
+DEFAULT_GATEWAY_RETRIES = 2
+DEFAULT_GATEWAY_RETRY_BACKOFF = 0.25
+DEFAULT_GATEWAY_POOL_SIZE = 10
+DEFAULT_CIRCUIT_FAILURES = 5
+DEFAULT_CIRCUIT_RESET = 30
+
+RETRY_STATUSES = frozenset([429, 502, 503, 504])
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+# Tokens are dropped this many seconds before the provider expires them
+TOKEN_EXPIRY_MARGIN = 60
+
+CIRCUIT_FAILURES_KEY = 'bika:gateway_circuit:{name}:failures'
+CIRCUIT_OPEN_KEY = 'bika:gateway_circuit:{name}:open_until'
+CIRCUIT_PROBE_KEY = 'bika:gateway_circuit:{name}:probe'
+TOKEN_KEY = 'bika:gateway_token:{name}'
+
+
+def _setting(name, default):
+    return settings.BIKA_SETTINGS.get(name, default)
+
+
+class GatewayError(Exception):
+    """A payment gateway call that could not be made"""
+
+
+class GatewayUnavailable(GatewayError):
+    """The gateway's circuit is open; the call was not attempted"""
+
+# ==================== CIRCUIT BREAKER ====================
+
+class CircuitBreaker:
+    """Opens after CIRCUIT_FAILURES consecutive failed calls
+
+    State lives in the cache so every worker process sees it. Once
+    CIRCUIT_RESET seconds have passed a single probe call is let through;
+    its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.failures_key = CIRCUIT_FAILURES_KEY.format(name=name)
+        self.open_key = CIRCUIT_OPEN_KEY.format(name=name)
+        self.probe_key = CIRCUIT_PROBE_KEY.format(name=name)
+
+    @property
+    def reset_after(self):
+        return _setting('PAYMENT_GATEWAY_CIRCUIT_RESET', DEFAULT_CIRCUIT_RESET)
+
+    def allow(self):
+        open_until = cache.get(self.open_key)
+        if open_until is None:
+            return True
+        if time.time() < open_until:
+            return False
+        return cache.add(self.probe_key, 1, self.reset_after)
+
+    def record_success(self):
+        cache.delete_many([self.failures_key, self.open_key, self.probe_key])
+
+    def record_failure(self):
+        cache.add(self.failures_key, 0, None)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            failures = 1
+        if failures >= _setting('PAYMENT_GATEWAY_CIRCUIT_FAILURES', DEFAULT_CIRCUIT_FAILURES):
+            cache.set(self.open_key, time.time() + self.reset_after, None)
+            cache.delete(self.probe_key)
+            logger.warning('%s failed %s times in a row, circuit open', self.name, failures)
+
+# ==================== TRANSPORT ====================
+
+def _never_sent(exc):
+    """Whether the request failed before reaching the provider"""
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0] if exc.args else None, 'reason', None)
+    return isinstance(reason, NewConnectionError)
+
+
+class GatewayTransport:
+    """Keep-alive session, token cache, retries and circuit breaker of one gateway"""
+
+    def __init__(self, name, base_url, version=0):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.version = version
+        self.breaker = CircuitBreaker(name)
+        self.token_key = TOKEN_KEY.format(name=f'{name}:{version}')
+        self._token_lock = threading.Lock()
+
+        pool_size = _setting('PAYMENT_GATEWAY_POOL_SIZE', DEFAULT_GATEWAY_POOL_SIZE)
+        self.session = requests.Session()
+        # Retries are ours: urllib3 would also retry non-idempotent POSTs
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def url(self, path):
+        return path if '://' in path else f'{self.base_url}{path}'
+
+    def request(self, method, path, idempotent=None, **kwargs):
+        """Send a request, returning the requests.Response
+
+        Connection failures and 429/502/503/504 answers are retried up to
+        PAYMENT_GATEWAY_RETRIES times with jittered exponential backoff.
+        Non-idempotent requests (POST unless idempotent=True) are only
+        retried when they never reached the provider, so a payment is
+        not initiated twice. Raises GatewayUnavailable while the circuit
+        is open and requests.RequestException when every attempt failed.
+        """
+        if not self.breaker.allow():
+            raise GatewayUnavailable(f'{self.name} is unavailable, try again shortly')
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        kwargs.setdefault('timeout', _setting('PAYMENT_GATEWAY_TIMEOUT', DEFAULT_GATEWAY_TIMEOUT))
+        retries = _setting('PAYMENT_GATEWAY_RETRIES', DEFAULT_GATEWAY_RETRIES)
+
+        for attempt in range(retries + 1):
+            last_attempt = attempt == retries
+            try:
+                response = self.session.request(method, self.url(path), **kwargs)
+            except requests.RequestException as e:
+                if not last_attempt and (idempotent or _never_sent(e)):
+                    self._backoff(attempt)
+                    continue
+                self.breaker.record_failure()
+                raise
+            if response.status_code in RETRY_STATUSES and idempotent and not last_attempt:
+                self._backoff(attempt)
+                continue
+            if response.status_code >= 500 or response.status_code == 429:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            return response
+
+    def _backoff(self, attempt):
+        delay = _setting('PAYMENT_GATEWAY_RETRY_BACKOFF', DEFAULT_GATEWAY_RETRY_BACKOFF) * 2 ** attempt
+        time.sleep(delay * random.uniform(0.5, 1.5))
+
+    def get_token(self, fetch):
+        """A cached access token, calling fetch() -> (token, expires_in) when there is none
+
+        Shared by all processes through the cache; within a process only
+        one thread fetches a new token.
+        """
+        token = cache.get(self.token_key)
+        if token is not None:
+            return token
+        with self._token_lock:
+            token = cache.get(self.token_key)
+            if token is None:
+                token, expires_in = fetch()
+                if token and expires_in > TOKEN_EXPIRY_MARGIN:
+                    cache.set(self.token_key, token, expires_in - TOKEN_EXPIRY_MARGIN)
+        return token
+
+    def forget_token(self):
+        """Drop the cached token, e.g. after the provider rejected it"""
+        cache.delete(self.token_key)
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(config):
+    """The shared GatewayTransport of a PaymentGatewaySettings entry
+
+    Saving the entry (new credentials or URL) starts a new transport with
+    a new token; the circuit breaker stays with the entry.
+    """
+    name = f'{config.gateway or "gateway"}:{config.pk}'
+    version = config.updated_at.timestamp() if config.updated_at else 0
+    base_url = (config.base_url or '').rstrip('/')
+    transport = _transports.get(name)
+    if transport is None or (transport.version, transport.base_url) != (version, base_url):
+        with _transports_lock:
+            transport = _transports.get(name)
+            if transport is None or (transport.version, transport.base_url) != (version, base_url):
+                transport = GatewayTransport(name, base_url, version)
+                _transports[name] = transport
+    return transport
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from bika.recommendations import RELATED_PRODUCTS_K, rebuild_related_products
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the co-purchase "related products" of every product from orders, carts and wishlists'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=RELATED_PRODUCTS_K,
+                            help='Neighbours to keep per product')
+
+    def handle(self, *args, **options):
+        count = rebuild_related_products(k=options['top'])
+        self.stdout.write(self.style.SUCCESS(f'Stored related products for {count} products'))
@@ -0,0 +1,52 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from bika.models import ProductImage
+from bika.thumbnails import generate_derivatives
+
+
+def _init_worker():
+    django.setup()
+
+
+def _generate(name, force):
+    try:
+        return name, generate_derivatives(name, force=force), None
+    except Exception as e:
+        return name, 0, str(e)
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnail and WebP derivatives for existing product images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes (default: one per core)')
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate derivatives that already exist')
+
+    def handle(self, *args, **options):
+        names = sorted(set(
+            ProductImage.objects.exclude(image='').values_list('image', flat=True)
+        ))
+        # Forked workers must not share the parent's database connection
+        connections.close_all()
+
+        written = failed = 0
+        with ProcessPoolExecutor(max_workers=max(options['workers'], 1),
+                                 initializer=_init_worker) as executor:
+            futures = [executor.submit(_generate, name, options['force']) for name in names]
+            for future in as_completed(futures):
+                name, count, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+                written += count
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} derivatives for {len(names)} images ({failed} failed)'
+        ))
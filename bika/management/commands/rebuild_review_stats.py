@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from bika.review_stats import rebuild_review_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized review aggregates of every product'
+
+    def handle(self, *args, **options):
+        updated = rebuild_review_stats()
+        self.stdout.write(self.style.SUCCESS(f'Updated review stats for {updated} products'))
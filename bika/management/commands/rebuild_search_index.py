@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from bika.search import fts_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text product search index'
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            self.stdout.write(self.style.WARNING(
+                'Search index not available on this database - search uses icontains'
+            ))
+            return
+
+        indexed = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} products'))
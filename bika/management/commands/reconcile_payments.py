@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bika.checks import PROCESS_LOCAL_CACHE_WARNING, cache_is_shared
+from bika.payment_reconciliation import (
+    DEFAULT_RECONCILE_PER_GATEWAY, DEFAULT_RECONCILE_WORKERS, reconcile_pending_payments
+)
+
+
+class Command(BaseCommand):
+    help = 'Ask payment providers about pending payments and settle those whose webhook never arrived'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=DEFAULT_RECONCILE_WORKERS,
+                            help='Status queries in flight at once')
+        parser.add_argument('--per-gateway', type=int, default=DEFAULT_RECONCILE_PER_GATEWAY,
+                            help='Status queries in flight against any one provider')
+        parser.add_argument('--batch', type=int, default=500,
+                            help='Pending payments read and settled per batch')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running, reconciling every this many seconds (default: once)')
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            self.stderr.write(self.style.WARNING(PROCESS_LOCAL_CACHE_WARNING))
+        while True:
+            result = reconcile_pending_payments(
+                batch_size=options['batch'], workers=options['workers'], per_gateway=options['per_gateway']
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f'Scanned {result.scanned} pending payments: '
+                f'{result.completed} completed, {result.failed} failed'
+            ))
+            if not options['interval']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,47 @@
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from bika.checks import PROCESS_LOCAL_CACHE_WARNING, cache_is_shared
+from bika.tasks import purge_finished_tasks, run_due_tasks
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks (email, notifications, gateway calls) until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4,
+                            help='Tasks run concurrently; they mostly wait on network I/O')
+        parser.add_argument('--batch', type=int, default=50,
+                            help='Tasks claimed per poll')
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no task is due instead of polling')
+        parser.add_argument('--purge-days', type=int, default=7,
+                            help='Delete tasks that succeeded this many days ago at startup')
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            self.stderr.write(self.style.WARNING(PROCESS_LOCAL_CACHE_WARNING))
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        purged = purge_finished_tasks(options['purge_days'])
+        if purged:
+            self.stdout.write(f'Purged {purged} finished tasks')
+
+        total = 0
+        with ThreadPoolExecutor(max_workers=max(options['threads'], 1)) as executor:
+            try:
+                while True:
+                    ran = run_due_tasks(worker_id, options['batch'], executor)
+                    total += ran
+                    if not ran:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll'])
+            except KeyboardInterrupt:
+                pass
+        self.stdout.write(self.style.SUCCESS(f'Ran {total} tasks'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from bika.checks import PROCESS_LOCAL_CACHE_WARNING, cache_is_shared
+from bika.sensor_devices import flush_heartbeats, sweep_offline_devices
+
+
+class Command(BaseCommand):
+    help = 'Alert admins about sensor devices that stopped sending readings'
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            self.stderr.write(self.style.WARNING(PROCESS_LOCAL_CACHE_WARNING))
+        flush_heartbeats()
+        count = sweep_offline_devices()
+        self.stdout.write(self.style.SUCCESS(f'{count} sensor devices went offline'))
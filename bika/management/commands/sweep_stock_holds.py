@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from bika.reservations import sweep_expired_holds
+
+
+class Command(BaseCommand):
+    help = 'Delete expired checkout stock holds and release their units'
+
+    def handle(self, *args, **options):
+        removed = sweep_expired_holds()
+        self.stdout.write(self.style.SUCCESS(f'Released {removed} expired stock holds'))
@@ -1,8 +1,12 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.utils.deprecation import MiddlewareMixin
 import time
 
+from .query_budget import QueryRecorder, record_view, resolved_url_name
+
 class SecurityHeadersMiddleware(MiddlewareMixin):
     def process_response(self, request, response):
         # Add security headers to all responses
@@ -55,4 +59,35 @@ class RoleBasedAccessMiddleware(MiddlewareMixin):
                     messages.error(request, "Access denied. You don't have permission to view this page.")
                     return redirect('bika:home')
         
-        return None
\ No newline at end of file
+        return None
+
+class QueryBudgetMiddleware:
+    """Opt-in: record SQL query count, DB time and duplicate queries per view"""
+
+    def __init__(self, get_response):
+        if not settings.BIKA_SETTINGS.get('QUERY_BUDGET_MONITORING'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.get_response(request)
+
+        url_name = resolved_url_name(request)
+        if url_name:
+            record_view(url_name, recorder, request, response.status_code)
+        return response
+
+class AnonymousCartMiddleware:
+    """Write the signed cart cookie back when a view changed it"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        cart = getattr(request, '_bika_anonymous_cart', None)
+        if cart is not None:
+            cart.save(response)
+        return response
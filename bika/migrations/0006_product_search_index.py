@@ -0,0 +1,37 @@
+from django.db import migrations
+
+FTS_TABLE = 'bika_product_fts'
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite-only; other backends search with icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "name, tags, brand, model, category, short_description, description, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4')"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {FTS_TABLE} (rowid, name, tags, brand, model, category, short_description, description) "
+        "SELECT p.id, p.name, p.tags, p.brand, p.model, COALESCE(c.name, ''), "
+        "p.short_description, p.description "
+        "FROM bika_product p LEFT JOIN bika_productcategory c ON c.id = p.category_id"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bika', '0005_fruittype_paymentgatewaysettings_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
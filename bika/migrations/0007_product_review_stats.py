@@ -0,0 +1,53 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:21
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_review_stats(apps, schema_editor):
+    Product = apps.get_model('bika', 'Product')
+    ProductReview = apps.get_model('bika', 'ProductReview')
+    histograms = {}
+    rows = ProductReview.objects.filter(is_approved=True).order_by().values(
+        'product_id', 'rating'
+    ).annotate(n=Count('id'))
+    for row in rows:
+        if 1 <= row['rating'] <= 5:
+            histogram = histograms.setdefault(row['product_id'], [0, 0, 0, 0, 0])
+            histogram[row['rating'] - 1] += row['n']
+    for product_id, histogram in histograms.items():
+        count = sum(histogram)
+        total = sum(stars * n for stars, n in enumerate(histogram, start=1))
+        Product.objects.filter(pk=product_id).update(
+            avg_rating=round(total / count, 2), review_count=count, rating_histogram=histogram
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bika', '0006_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='avg_rating',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_histogram',
+            field=models.JSONField(blank=True, default=list, help_text='Approved review counts for 1-5 stars'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', '-avg_rating', '-review_count'], name='bika_product_rating_idx'),
+        ),
+        migrations.RunPython(backfill_review_stats, migrations.RunPython.noop),
+    ]
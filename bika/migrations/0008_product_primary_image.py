@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_primary_images(apps, schema_editor):
+    Product = apps.get_model('bika', 'Product')
+    ProductImage = apps.get_model('bika', 'ProductImage')
+    primary = {}
+    for image_id, product_id in ProductImage.objects.order_by(
+        'product_id', '-is_primary', 'display_order', 'id'
+    ).values_list('id', 'product_id'):
+        primary.setdefault(product_id, image_id)
+    for product_id, image_id in primary.items():
+        Product.objects.filter(pk=product_id).update(primary_image_id=image_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bika', '0007_product_review_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bika.productimage'),
+        ),
+        migrations.RunPython(backfill_primary_images, migrations.RunPython.noop),
+    ]
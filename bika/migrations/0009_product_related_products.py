@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bika', '0008_product_primary_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='related_product_ids',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
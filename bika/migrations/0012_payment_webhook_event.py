@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-16 23:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bika', '0011_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(max_length=50)),
+                ('event_id', models.CharField(max_length=150)),
+                ('payload', models.JSONField(default=dict)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-received_at'],
+                'unique_together': {('provider', 'event_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-16 23:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bika', '0012_payment_webhook_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorDevice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_key', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=200)),
+                ('is_active', models.BooleanField(default=True)),
+                ('last_seen_at', models.DateTimeField(blank=True, null=True)),
+                ('offline_alerted_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('fruit_batch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='bika.fruitbatch')),
+                ('location', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='bika.storagelocation')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='bika.product')),
+            ],
+            options={
+                'ordering': ['name'],
+                'indexes': [models.Index(condition=models.Q(('is_active', True), ('offline_alerted_at__isnull', True)), fields=['last_seen_at'], name='sensor_device_watch_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-16 23:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bika', '0013_sensor_device'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
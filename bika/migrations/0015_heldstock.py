@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-16 23:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_held_stock(apps, schema_editor):
+    HeldStock = apps.get_model('bika', 'HeldStock')
+    StockHold = apps.get_model('bika', 'StockHold')
+    HeldStock.objects.bulk_create([
+        HeldStock(product_id=product_id, quantity=total)
+        for product_id, total in StockHold.objects.order_by().values('product_id').annotate(
+            total=Sum('quantity')
+        ).values_list('product_id', 'total')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bika', '0014_productimage_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeldStock',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='held_stock', serialize=False, to='bika.product')),
+                ('quantity', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_held_stock, migrations.RunPython.noop),
+    ]
@@ -65,6 +65,13 @@ class ProductCategory(models.Model):
     def get_absolute_url(self):
         return reverse('bika:products_by_category', kwargs={'category_slug': self.slug})
 
+class ProductQuerySet(models.QuerySet):
+    def cards(self):
+        """Everything a product card renders - category, vendor and primary
+        image - in the same query as the products"""
+        return self.select_related('category', 'vendor', 'primary_image')
+
+
 class Product(models.Model):
     """Main product model"""
     STATUS_CHOICES = [
@@ -138,8 +145,27 @@ class Product(models.Model):
     
     views_count = models.PositiveIntegerField(default=0, verbose_name="View Count")
     
+    # Approved review aggregates, maintained by bika/review_stats.py
+    avg_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    rating_histogram = models.JSONField(default=list, blank=True,
+                                        help_text="Approved review counts for 1-5 stars")
+    
+    # Image shown on product cards, maintained by ProductImage.save()/delete()
+    primary_image = models.ForeignKey('ProductImage', on_delete=models.SET_NULL, null=True, blank=True,
+                                      editable=False, related_name='+')
+    
+    # Most co-purchased products, best first, rebuilt offline by the
+    # build_related_products command (see bika/recommendations.py)
+    related_product_ids = models.JSONField(default=list, blank=True, editable=False)
+    
+    objects = ProductQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', '-avg_rating', '-review_count'], name='bika_product_rating_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} - {self.sku}"
@@ -175,10 +201,20 @@ class Product(models.Model):
         return self.price
     
     def get_related_products(self, limit=4):
-        return Product.objects.filter(
-            category=self.category,
-            status='active'
-        ).exclude(id=self.id)[:limit]
+        """Co-purchased products, topped up from the same category"""
+        related = []
+        if self.related_product_ids:
+            # Filter the whole stored list before taking `limit`, so an
+            # inactive neighbour is replaced by the next co-purchased one
+            ids = self.related_product_ids
+            found = Product.objects.cards().filter(status='active').in_bulk(ids)
+            related = [found[pk] for pk in ids if pk in found][:limit]
+        if len(related) < limit:
+            related += Product.objects.cards().filter(
+                category_id=self.category_id,
+                status='active'
+            ).exclude(id__in=[self.id] + [p.id for p in related])[:limit - len(related)]
+        return related
 
 class ProductImage(models.Model):
     """Product images model"""
@@ -187,6 +223,8 @@ class ProductImage(models.Model):
     alt_text = models.CharField(max_length=200, blank=True)
     display_order = models.IntegerField(default=0)
     is_primary = models.BooleanField(default=False)
+    # Names of the generated thumbnails/WebP files (see bika/thumbnails.py)
+    derivatives = models.JSONField(default=list, blank=True, editable=False)
     
     class Meta:
         ordering = ['display_order', 'id']
@@ -197,8 +235,20 @@ class ProductImage(models.Model):
     def save(self, *args, **kwargs):
         if self.is_primary:
             # Ensure only one primary image per product
-            ProductImage.objects.filter(product=self.product, is_primary=True).update(is_primary=False)
+            ProductImage.objects.filter(product_id=self.product_id, is_primary=True).exclude(
+                pk=self.pk
+            ).update(is_primary=False)
         super().save(*args, **kwargs)
+        ProductImage.sync_primary_image(self.product_id)
+    
+    @staticmethod
+    def sync_primary_image(product_id):
+        """Point Product.primary_image at the flagged image, else the first one"""
+        image = ProductImage.objects.filter(product_id=product_id).order_by(
+            '-is_primary', 'display_order', 'id'
+        ).first()
+        Product.objects.filter(pk=product_id).update(primary_image=image)
+        return image
 
 class ProductReview(models.Model):
     """Product reviews model"""
@@ -266,6 +316,32 @@ class Cart(models.Model):
         quantity = Decimal(str(self.quantity))
         return price * quantity
     
+class StockHold(models.Model):
+    """Stock set aside for a customer between checkout and placing the order
+
+    Admission is decided on the product's HeldStock counter (see
+    bika/reservations.py).
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='stock_holds')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_holds')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['user', 'product']
+    
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} held for {self.user_id}"
+
+class HeldStock(models.Model):
+    """Units of a product covered by StockHold rows, summed for admission"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='held_stock')
+    quantity = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} held"
+
 class Order(models.Model):
     """Order model"""
     STATUS_CHOICES = [
@@ -484,6 +560,37 @@ class RealTimeSensorData(models.Model):
     def __str__(self):
         return f"{self.sensor_type} - {self.value}{self.unit}"
 
+class SensorDevice(models.Model):
+    """An IoT sensor and what it measures
+    
+    Readings sent with the device key are attached to its location, batch
+    and product without looking them up (see bika/sensor_devices.py).
+    """
+    device_key = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=200)
+    location = models.ForeignKey(StorageLocation, on_delete=models.SET_NULL, null=True, blank=True)
+    fruit_batch = models.ForeignKey(FruitBatch, on_delete=models.SET_NULL, null=True, blank=True)
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+    last_seen_at = models.DateTimeField(null=True, blank=True)
+    offline_alerted_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['name']
+        indexes = [
+            # Only devices that can still go offline, so the sweep is a
+            # short range scan however many devices there are
+            models.Index(
+                fields=['last_seen_at'], name='sensor_device_watch_idx',
+                condition=models.Q(is_active=True, offline_alerted_at__isnull=True),
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.device_key})"
+
 # ==================== AI & DATASET MODELS ====================
 
 class ProductDataset(models.Model):
@@ -589,6 +696,39 @@ class Notification(models.Model):
     def __str__(self):
         return f"{self.title} - {self.user.username}"
 
+# ==================== BACKGROUND TASK MODELS ====================
+
+class Task(models.Model):
+    """A unit of background work, run by the run_tasks worker (see bika/tasks.py)"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=100)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    # Due time; a claimed task is pushed forward by the visibility timeout,
+    # so it is retried if its worker dies before finishing it
+    run_at = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=64, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['run_at']
+        indexes = [
+            models.Index(fields=['status', 'run_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.get_status_display()})"
+
 # ==================== PAYMENT MODELS ====================
 
 class Payment(models.Model):
@@ -675,6 +815,21 @@ class Payment(models.Model):
     def is_successful(self):
         return self.status == 'completed'
 
+class PaymentWebhookEvent(models.Model):
+    """Ledger of provider callbacks, so retried callbacks are applied once"""
+    provider = models.CharField(max_length=50)
+    event_id = models.CharField(max_length=150)
+    payload = models.JSONField(default=dict)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-received_at']
+        unique_together = ['provider', 'event_id']
+    
+    def __str__(self):
+        return f"{self.provider} {self.event_id}"
+
 class PaymentGatewaySettings(models.Model):
     """Enhanced payment gateway configuration"""
     GATEWAY_CHOICES = [
@@ -3,6 +3,8 @@ from datetime import datetime, timedelta
 
 from bika.models import CustomUser, Product, ProductAlert, Notification
 from bika.service import RealProductAIService
+from bika.tasks import enqueue, notify_product_alert
+from bika.user_counters import schedule_counter_refresh
 from users import models
 
 class RealNotificationService:
@@ -87,48 +89,57 @@ class RealNotificationService:
                 detected_by=detected_by
             )
             
-            # Send notifications
-            self.send_role_based_notifications(alert)
+            # Notify in the background, once the alert is committed
+            enqueue(notify_product_alert, alert.id)
+        return alert
     
     def send_role_based_notifications(self, alert):
         """Send notifications based on user roles"""
-        # Notify admins for all alerts
-        admins = CustomUser.objects.filter(user_type='admin', is_active=True)
-        for admin in admins:
-            Notification.objects.create(
-                user=admin,
-                title=f"Product Alert: {alert.get_alert_type_display()}",
-                message=f"{alert.message} - Product: {alert.product.name}",
-                notification_type='product_alert',
-                related_object_type='product_alert',
-                related_object_id=alert.id
-            )
-        
-        # Notify product vendor
-        if alert.product.vendor:
-            Notification.objects.create(
-                user=alert.product.vendor,
-                title=f"Your Product Alert: {alert.get_alert_type_display()}",
-                message=f"{alert.message} - Your product: {alert.product.name}",
-                notification_type='product_alert',
-                related_object_type='product_alert',
-                related_object_id=alert.id
-            )
-        
-        # Notify store managers for critical alerts
-        if alert.severity in ['high', 'critical']:
-            from django.db.models import Q
-            store_managers = CustomUser.objects.filter(
-                Q(user_type='admin') | Q(user_type='vendor'),
-                is_active=True
-            )
-            for manager in store_managers:
-                if manager != alert.product.vendor:  # Avoid duplicate
-                    Notification.objects.create(
-                        user=manager,
-                        title=f"URGENT: {alert.get_alert_type_display()}",
-                        message=f"{alert.message} - Product: {alert.product.name}",
-                        notification_type='urgent_alert',
-                        related_object_type='product_alert',
-                        related_object_id=alert.id
-                    )
\ No newline at end of file
+        send_alert_notifications(alert)
+
+
+def send_alert_notifications(alert):
+    """Notify admins, the product vendor and store managers of an alert
+    
+    Runs as the notify_product_alert task; all notifications are written
+    with one bulk insert.
+    """
+    from django.db.models import Q
+    
+    def notification(user, title, notification_type='product_alert', subject='Product'):
+        return Notification(
+            user=user,
+            title=title,
+            message=f"{alert.message} - {subject}: {alert.product.name}",
+            notification_type=notification_type,
+            related_object_type='product_alert',
+            related_object_id=alert.id
+        )
+    
+    vendor = alert.product.vendor
+    label = alert.get_alert_type_display()
+    # Notify admins for all alerts
+    notifications = [
+        notification(admin, f"Product Alert: {label}")
+        for admin in CustomUser.objects.filter(user_type='admin', is_active=True)
+    ]
+    
+    # Notify product vendor
+    if vendor:
+        notifications.append(notification(vendor, f"Your Product Alert: {label}", subject='Your product'))
+    
+    # Notify store managers for critical alerts
+    if alert.severity in ['high', 'critical']:
+        store_managers = CustomUser.objects.filter(
+            Q(user_type='admin') | Q(user_type='vendor'),
+            is_active=True
+        )
+        if vendor:
+            store_managers = store_managers.exclude(pk=vendor.pk)  # Avoid duplicate
+        notifications.extend(
+            notification(manager, f"URGENT: {label}", 'urgent_alert') for manager in store_managers
+        )
+    
+    Notification.objects.bulk_create(notifications)
+    # bulk_create() sends no post_save
+    schedule_counter_refresh([n.user_id for n in notifications], 'notifications')
@@ -0,0 +1,122 @@
+# bika/orders.py - ORDER PLACEMENT
+import uuid
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, When
+
+from .cart_pricing import price_cart
+from .models import Cart, Order, OrderItem, Payment, Product
+from .page_cache import schedule_page_invalidation
+from .reservations import get_held_stock, release_holds, user_holds
+
+MOBILE_MONEY_METHODS = ('mpesa', 'airtel_tz', 'tigo_tz')
+
+CART_LINE_FIELDS = (
+    'product_id', 'quantity', 'product__price', 'product__track_inventory',
+    'product__stock_quantity', 'product__name',
+)
+
+
+class OrderError(Exception):
+    """An order that cannot be placed; the message is shown to the shopper"""
+
+
+def decrement_stock(quantities):
+    """Take {product_id: quantity} off stock in one conditional UPDATE
+
+    Every row is only decremented if it still has enough stock, checked
+    by the database at write time, so concurrent checkouts cannot
+    oversell. Returns the ids that could not be decremented; the caller
+    must roll back its transaction if there are any.
+    """
+    if not quantities:
+        return []
+    wanted = Case(
+        *[When(pk=pk, then=quantity) for pk, quantity in quantities.items()],
+        output_field=IntegerField()
+    )
+    updated = Product.objects.filter(
+        pk__in=list(quantities), stock_quantity__gte=wanted
+    ).update(stock_quantity=F('stock_quantity') - wanted)
+    if updated == len(quantities):
+        return []
+    # Only on failure: find out which products ran out, for the message
+    return list(Product.objects.filter(
+        Q(pk__in=list(quantities)) & ~Q(stock_quantity__gte=wanted)
+    ).values_list('pk', flat=True))
+
+
+def place_order(user, shipping_address, billing_address, payment_method, phone_number=''):
+    """Turn the user's cart into an Order with its items and a pending Payment
+
+    Runs a constant number of queries whatever the cart size: one read of
+    the cart lines and prices, the customer's stock holds, one conditional
+    stock UPDATE, one INSERT each for the order, its items and the
+    payment, and the cart and hold deletes. Raises OrderError when the
+    cart is empty or stock ran out.
+    """
+    with transaction.atomic():
+        lines = list(Cart.objects.filter(user=user).order_by('product_id').values_list(*CART_LINE_FIELDS))
+        if not lines:
+            raise OrderError('Your cart is empty!')
+
+        names = {}
+        tracked = {}
+        stock = {}
+        for product_id, quantity, price, track_inventory, in_stock, name in lines:
+            names[product_id] = name
+            if track_inventory:
+                tracked[product_id] = quantity
+                stock[product_id] = in_stock
+
+        # Units other customers hold at checkout are not for sale; the
+        # customer's own holds become the decrement below
+        if tracked:
+            own = user_holds(user)
+            held = get_held_stock(list(tracked))
+            for product_id, quantity in tracked.items():
+                others = max(held[product_id] - own.get(product_id, 0), 0)
+                if stock[product_id] - others < quantity:
+                    raise OrderError(f'Insufficient stock for {names[product_id]}')
+
+        sold_out = decrement_stock(tracked)
+        if sold_out:
+            raise OrderError(f'Insufficient stock for {names[sold_out[0]]}')
+
+        totals = price_cart(
+            sum(price * quantity for _, quantity, price, *_ in lines), len(lines),
+            sum(quantity for _, quantity, *_ in lines)
+        )
+        order = Order.objects.create(
+            user=user,
+            total_amount=totals.total,
+            shipping_address=shipping_address,
+            billing_address=billing_address,
+            status='pending'
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=product_id, quantity=quantity, price=price)
+            for product_id, quantity, price, *_ in lines
+        ])
+        payment = Payment.objects.create(
+            order=order,
+            payment_method=payment_method,
+            amount=totals.total,
+            currency='TZS',
+            status='pending',
+            # transaction_id is unique, so even a pending payment needs one
+            transaction_id=f'BIKA-{uuid.uuid4().hex}',
+            mobile_money_phone=phone_number if payment_method in MOBILE_MONEY_METHODS else '',
+        )
+        Cart.objects.filter(user=user, product_id__in=list(names)).delete()
+        if tracked:
+            release_holds(user)
+
+        # QuerySet.update() sends no signals. Cards show in stock, low stock
+        # with the count, or out of stock, so cached pages only change once
+        # a product is at or under its low-stock threshold
+        if tracked and Product.objects.filter(
+            pk__in=list(tracked), stock_quantity__lte=F('low_stock_threshold')
+        ).exists():
+            schedule_page_invalidation('product')
+    return order, payment
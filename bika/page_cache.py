@@ -0,0 +1,179 @@
+# bika/page_cache.py - TAG-INVALIDATED FULL-PAGE CACHE FOR ANONYMOUS VISITORS
+import hashlib
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+
+from .user_counters import get_request_counters
+
+PAGE_CACHE_KEY = 'bika:page_cache:page:{digest}'
+PAGE_TAG_VERSION_KEY = 'bika:page_cache:tag:{tag}'
+
+# Safety net for data no signal watches (e.g. the footer vendor count).
+# Tag invalidation is what keeps pages fresh.
+DEFAULT_PAGE_CACHE_TIMEOUT = 60 * 10
+
+# Every page renders the header/footer from the global context, so it
+# depends on these (see bika/site_context.py)
+BASE_PAGE_TAGS = ('siteinfo', 'service', 'productcategory', 'product')
+
+# Marketing parameters that do not change the page
+IGNORED_QUERY_PARAMS = {
+    'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content', 'fbclid', 'gclid',
+}
+
+# Stored pages contain these instead of per-visitor values; they are filled
+# in on every response (see fill_page_holes)
+CSRF_PLACEHOLDER = 'bika-page-cache-csrf-token'
+HOLE_MARKER = '<!--bika:page-hole:{name}-->'
+
+
+def page_tag(model):
+    """Tag for pages that render a model's rows ('product', 'faq', ...)"""
+    return model._meta.model_name
+
+# ==================== HOLES ====================
+# Per-visitor fragments of otherwise shared pages. Templates mark them with
+# {% page_hole "name" %} (bika/templatetags/page_cache_tags.py).
+
+def _cart_badge(request):
+    return render_to_string('bika/partials/cart_badge.html', {
+        'cart_count': get_request_counters(request)['cart_count'],
+    })
+
+
+PAGE_HOLES = {
+    'cart_badge': _cart_badge,
+}
+
+
+def render_page_hole(name, request):
+    return PAGE_HOLES[name](request)
+
+
+def fill_page_holes(request, response):
+    if response.streaming:
+        return response
+    content = response.content.decode(response.charset)
+    for name in PAGE_HOLES:
+        marker = HOLE_MARKER.format(name=name)
+        if marker in content:
+            content = content.replace(marker, render_page_hole(name, request))
+    if CSRF_PLACEHOLDER in content:
+        # Also makes CsrfViewMiddleware set the visitor's CSRF cookie
+        content = content.replace(CSRF_PLACEHOLDER, get_token(request))
+    response.content = content
+    return response
+
+# ==================== TAG VERSIONS ====================
+
+def get_tag_versions(tags):
+    keys = {tag: PAGE_TAG_VERSION_KEY.format(tag=tag) for tag in tags}
+    stored = cache.get_many(keys.values())
+    missing = [key for key in keys.values() if key not in stored]
+    if missing:
+        # Start from the clock so a lost key never brings back an old
+        # version that a stored page was saved under
+        now = int(time.time() * 1000)
+        for key in missing:
+            cache.add(key, now, None)
+        stored.update(cache.get_many(missing))
+    return {tag: stored.get(key) for tag, key in keys.items()}
+
+
+def invalidate_page_tags(*tags):
+    """Retire every cached page that depends on any of the tags"""
+    for tag in tags:
+        key = PAGE_TAG_VERSION_KEY.format(tag=tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, int(time.time() * 1000), None)
+
+
+def schedule_page_invalidation(*tags):
+    """Invalidate once the current transaction commits"""
+    transaction.on_commit(lambda: invalidate_page_tags(*tags))
+
+# ==================== CACHING ====================
+
+def page_cache_key(request):
+    """Path plus the query string with sorted, non-empty, meaningful params"""
+    params = sorted(
+        (name, value)
+        for name, values in request.GET.lists() if name not in IGNORED_QUERY_PARAMS
+        for value in values if value != ''
+    )
+    signature = f'{request.path}?{urlencode(params)}'
+    return PAGE_CACHE_KEY.format(digest=hashlib.md5(signature.encode()).hexdigest())
+
+
+def strip_ignored_params(request):
+    """Drop marketing params from request.GET before a shared page renders
+
+    They are not part of the key, so links built from request.GET (e.g.
+    {% querystring %}) would hand one visitor's utm_* to everybody.
+    """
+    if any(name in IGNORED_QUERY_PARAMS for name in request.GET):
+        params = request.GET.copy()
+        for name in IGNORED_QUERY_PARAMS:
+            params.pop(name, None)
+        params._mutable = False
+        request.GET = params
+
+
+def is_cacheable_request(request):
+    if not settings.BIKA_SETTINGS.get('PAGE_CACHE_ENABLED', True):
+        return False
+    if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+        return False
+    # Flash messages are per visitor and must be shown once
+    return len(messages.get_messages(request)) == 0
+
+
+def cached_page(*tags):
+    """Serve a view from the page cache for anonymous visitors
+
+    Pages are stored under the versions of BASE_PAGE_TAGS plus the given
+    tags, and served only while every one of them is unchanged, so a
+    saved FAQ retires the FAQ and home pages but not the product list.
+    """
+    page_tags = sorted(set(BASE_PAGE_TAGS) | set(tags))
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not is_cacheable_request(request):
+                return view(request, *args, **kwargs)
+
+            key = page_cache_key(request)
+            versions = get_tag_versions(page_tags)
+            entry = cache.get(key)
+            if entry is not None and entry['versions'] == versions:
+                response = HttpResponse(entry['content'], content_type=entry['content_type'])
+                response['X-Page-Cache'] = 'hit'
+                return fill_page_holes(request, response)
+
+            request._bika_page_cache = True
+            strip_ignored_params(request)
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response = response.render()
+            if response.status_code == 200 and not response.streaming and not response.cookies:
+                cache.set(key, {
+                    'content': response.content,
+                    'content_type': response['Content-Type'],
+                    'versions': versions,
+                }, settings.BIKA_SETTINGS.get('PAGE_CACHE_TIMEOUT', DEFAULT_PAGE_CACHE_TIMEOUT))
+                response['X-Page-Cache'] = 'miss'
+            return fill_page_holes(request, response)
+        return wrapper
+    return decorator
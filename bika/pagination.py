@@ -0,0 +1,184 @@
+# bika/pagination.py - KEYSET (CURSOR) PAGINATION
+import hashlib
+from collections.abc import Sequence
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core import signing
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Q
+
+# Storefront sort options that can be paged by keyset. Every ordering ends
+# in the primary key so that ties (same price, same name...) have a stable
+# order; the fields must be non-nullable.
+PRODUCT_SORTS = {
+    'newest': ('-created_at', '-id'),
+    'price_low': ('price', 'id'),
+    'price_high': ('-price', '-id'),
+    'name': ('name', 'id'),
+    'popular': ('-views_count', '-id'),
+    'featured': ('-is_featured', '-created_at', '-id'),
+    'rating': ('-avg_rating', '-review_count', '-id'),
+}
+
+CURSOR_SALT = 'bika.pagination.cursor'
+
+# Totals shown next to cursor pages are cached per filter, so paging
+# through a large category counts it once rather than on every page
+APPROXIMATE_COUNT_KEY = 'bika:approximate_count:{digest}'
+APPROXIMATE_COUNT_TIMEOUT = 60 * 5
+
+
+def _dump_value(value):
+    # isoformat() keeps microseconds, which the keyset comparison needs
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class CursorPage(Sequence):
+    """One page of a CursorPaginator, usable where a Paginator page was"""
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self)} items>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return None
+        return self.paginator.encode(self.object_list[-1], backwards=False)
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return None
+        return self.paginator.encode(self.object_list[0], backwards=True)
+
+
+class CursorPaginator:
+    """Page through a queryset by the values of its sort key
+
+    Each page filters on "rows after (or before) this one" instead of using
+    OFFSET, so page 1000 costs the same as page 1. Cursors are signed and
+    tied to the ordering they were issued for; a tampered or stale cursor
+    simply yields the first page.
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+
+    def encode(self, obj, backwards):
+        values = [_dump_value(getattr(obj, field.lstrip('-'))) for field in self.ordering]
+        return signing.dumps(
+            {'o': list(self.ordering), 'v': values, 'b': backwards},
+            salt=CURSOR_SALT, compress=True
+        )
+
+    def decode(self, cursor):
+        """(values, backwards) for a cursor, or None if it is not usable"""
+        if not cursor:
+            return None
+        try:
+            payload = signing.loads(cursor, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            return None
+        if payload.get('o') != list(self.ordering) or len(payload.get('v', ())) != len(self.ordering):
+            return None
+        return payload['v'], bool(payload.get('b'))
+
+    def _beyond(self, values, backwards):
+        """Rows strictly after values in the ordering (before, if backwards)
+
+        Expands (a, b, c) > (x, y, z) into
+        a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z),
+        with the comparison flipped for descending fields.
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != backwards
+            lookup = f"{name}__{'lt' if descending else 'gt'}"
+            condition |= Q(**equal, **{lookup: value})
+            equal[name] = value
+        return condition
+
+    def get_page(self, cursor=None):
+        position = self.decode(cursor)
+        queryset = self.queryset
+        ordering = self.ordering
+        backwards = False
+        if position is not None:
+            values, backwards = position
+            queryset = queryset.filter(self._beyond(values, backwards))
+            if backwards:
+                ordering = tuple(
+                    field[1:] if field.startswith('-') else f'-{field}' for field in ordering
+                )
+
+        rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            return CursorPage(rows, self, has_next=True, has_previous=has_more)
+        return CursorPage(rows, self, has_next=has_more, has_previous=position is not None)
+
+
+def approximate_count(queryset, timeout=APPROXIMATE_COUNT_TIMEOUT):
+    """Result count for a filter, cached for a few minutes"""
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    digest = hashlib.md5(f'{sql}|{params!r}'.encode()).hexdigest()
+    key = APPROXIMATE_COUNT_KEY.format(digest=digest)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+
+def paginate(request, queryset, ordering, per_page):
+    """Page of queryset for this request, and its total number of results
+
+    With a keyset ordering the page is a CursorPage (?cursor=...) and the
+    total is approximate. Without one (relevance-ranked search), or for an
+    old ?page=N link, it is a regular Paginator page with an exact count.
+    """
+    if ordering and 'page' not in request.GET:
+        paginator = CursorPaginator(queryset, ordering, per_page)
+        return paginator.get_page(request.GET.get('cursor')), approximate_count(queryset)
+
+    if ordering:
+        queryset = queryset.order_by(*ordering)
+    paginator = Paginator(queryset, per_page)
+    return paginator.get_page(request.GET.get('page')), paginator.count
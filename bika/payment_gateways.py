@@ -8,11 +8,16 @@ from django.conf import settings
 from django.utils import timezone
 import logging
 
+from .gateway_transport import GatewayError, get_transport
+
 logger = logging.getLogger(__name__)
 
 class BasePaymentGateway:
     """Base class for all payment gateways"""
     
+    # Provider payment statuses that are final, as Payment statuses
+    PROVIDER_STATUSES = {}
+    
     def __init__(self, config):
         self.config = config
         self.base_url = config.base_url
@@ -20,50 +25,72 @@ class BasePaymentGateway:
         self.api_secret = config.api_secret
         self.merchant_id = config.merchant_id
         self.environment = config.environment
+        # Shared keep-alive session, token cache and circuit breaker
+        self.transport = get_transport(config)
     
-    def make_request(self, endpoint, payload, method='POST'):
+    def make_request(self, endpoint, payload, method='POST', headers=None, idempotent=None):
         """Make API request to payment gateway"""
         try:
-            url = f"{self.base_url}{endpoint}"
-            headers = self.get_headers()
-            
             if method.upper() == 'POST':
-                response = requests.post(url, json=payload, headers=headers, timeout=30)
+                response = self.transport.request(
+                    'POST', endpoint, json=payload, headers=headers or self.get_headers(),
+                    idempotent=idempotent
+                )
             else:
-                response = requests.get(url, headers=headers, timeout=30)
+                response = self.transport.request(method, endpoint, headers=headers or self.get_headers())
             
+            if response.status_code == 401:
+                # Expired or revoked before we expected; fetch a new one next time
+                self.transport.forget_token()
             response.raise_for_status()
             return response.json()
             
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, GatewayError, ValueError) as e:
             logger.error(f"Payment gateway request error: {str(e)}")
             return {'success': False, 'message': str(e)}
     
     def get_headers(self):
         """Get request headers - to be implemented by subclasses"""
         return {'Content-Type': 'application/json'}
+    
+    def query_status(self, reference):
+        """'completed', 'failed' or 'pending' for a payment, None if unknown
+        
+        Used to catch up on payments whose webhook never arrived; to be
+        implemented by subclasses.
+        """
+        return None
+    
+    def map_status(self, provider_status):
+        if not provider_status:
+            return None
+        return self.PROVIDER_STATUSES.get(str(provider_status).upper(), 'pending')
 
 class MpesaGateway(BasePaymentGateway):
     """M-Pesa Tanzania Gateway"""
     
     def get_access_token(self):
-        """Get M-Pesa access token"""
+        """Get M-Pesa access token, cached until it expires"""
         try:
-            url = f"{self.base_url}/oauth/v1/generate?grant_type=client_credentials"
-            auth_string = f"{self.api_key}:{self.api_secret}"
-            encoded_auth = base64.b64encode(auth_string.encode()).decode()
-            
-            headers = {'Authorization': f'Basic {encoded_auth}'}
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-            
-            data = response.json()
-            return data.get('access_token')
-            
+            return self.transport.get_token(self.fetch_access_token)
         except Exception as e:
             logger.error(f"M-Pesa access token error: {str(e)}")
             return None
     
+    def fetch_access_token(self):
+        """New M-Pesa access token and its lifetime in seconds"""
+        auth_string = f"{self.api_key}:{self.api_secret}"
+        encoded_auth = base64.b64encode(auth_string.encode()).decode()
+        
+        headers = {'Authorization': f'Basic {encoded_auth}'}
+        response = self.transport.request(
+            'GET', '/oauth/v1/generate', params={'grant_type': 'client_credentials'}, headers=headers
+        )
+        response.raise_for_status()
+        
+        data = response.json()
+        return data.get('access_token'), int(data.get('expires_in', 3599))
+    
     def get_timestamp(self):
         return datetime.now().strftime('%Y%m%d%H%M%S')
     
@@ -101,13 +128,16 @@ class MpesaGateway(BasePaymentGateway):
                 "TransactionDesc": "Bika Product Purchase"
             }
             
-            url = f"{self.base_url}/mpesa/stkpush/v1/processrequest"
             headers = {
                 'Authorization': f'Bearer {access_token}',
                 'Content-Type': 'application/json'
             }
             
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
+            response = self.transport.request(
+                'POST', '/mpesa/stkpush/v1/processrequest', json=payload, headers=headers
+            )
+            if response.status_code == 401:
+                self.transport.forget_token()
             response_data = response.json()
             
             if response.status_code == 200 and response_data.get('ResponseCode') == '0':
@@ -126,10 +156,38 @@ class MpesaGateway(BasePaymentGateway):
         except Exception as e:
             logger.error(f"M-Pesa STK push error: {str(e)}")
             return {'success': False, 'message': str(e)}
+    
+    def query_status(self, reference):
+        """Status of an STK push by its CheckoutRequestID"""
+        access_token = self.get_access_token()
+        if not access_token:
+            return None
+        
+        timestamp = self.get_timestamp()
+        payload = {
+            "BusinessShortCode": self.merchant_id,
+            "Password": self.generate_password(timestamp),
+            "Timestamp": timestamp,
+            "CheckoutRequestID": reference
+        }
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json'
+        }
+        # A query changes nothing, so it may be retried
+        response = self.make_request('/mpesa/stkpushquery/v1/query', payload, headers=headers, idempotent=True)
+        if response.get('success') is False:
+            return None
+        result_code = response.get('ResultCode')
+        if result_code is None:
+            return 'pending'  # Customer has not answered the prompt yet
+        return 'completed' if str(result_code) == '0' else 'failed'
 
 class MTNRwandaGateway(BasePaymentGateway):
     """MTN Mobile Money Rwanda Gateway"""
     
+    PROVIDER_STATUSES = {'SUCCESSFUL': 'completed', 'FAILED': 'failed', 'REJECTED': 'failed', 'TIMEOUT': 'failed'}
+    
     def request_payment(self, phone_number, amount, reference):
         """Request payment from customer"""
         try:
@@ -154,7 +212,7 @@ class MTNRwandaGateway(BasePaymentGateway):
                 'X-Reference-Id': reference
             }
             
-            response = self.make_request('/collection/v1_0/requesttopay', payload)
+            response = self.make_request('/collection/v1_0/requesttopay', payload, headers=headers)
             
             if response.get('status') == 'SUCCESSFUL':
                 return {
@@ -176,10 +234,21 @@ class MTNRwandaGateway(BasePaymentGateway):
         """Generate MTN API token"""
         # Implementation for MTN API authentication
         return "mtn_api_token"
+    
+    def query_status(self, reference):
+        """Status of a request-to-pay by its reference id"""
+        headers = {
+            'Authorization': f'Bearer {self.generate_api_token()}',
+            'Content-Type': 'application/json'
+        }
+        response = self.make_request(f'/collection/v1_0/requesttopay/{reference}', None, method='GET', headers=headers)
+        return self.map_status(response.get('status'))
 
 class TigoTanzaniaGateway(BasePaymentGateway):
     """Tigo Pesa Tanzania Gateway"""
     
+    PROVIDER_STATUSES = {'SUCCESS': 'completed', 'FAILED': 'failed', 'CANCELLED': 'failed'}
+    
     def initiate_payment(self, phone_number, amount, reference):
         """Initiate Tigo Pesa payment"""
         try:
@@ -193,7 +262,7 @@ class TigoTanzaniaGateway(BasePaymentGateway):
             
             # Tigo Pesa API implementation
             headers = self.get_headers()
-            response = self.make_request('/api/v1/payments', payload)
+            response = self.make_request('/api/v1/payments', payload, headers=headers)
             
             if response.get('status') == 'SUCCESS':
                 return {
@@ -210,10 +279,18 @@ class TigoTanzaniaGateway(BasePaymentGateway):
         except Exception as e:
             logger.error(f"Tigo Pesa payment error: {str(e)}")
             return {'success': False, 'message': str(e)}
+    
+    def query_status(self, reference):
+        """Status of a Tigo Pesa payment by its reference"""
+        response = self.make_request(f'/api/v1/payments/{reference}', None, method='GET')
+        return self.map_status(response.get('status'))
 
 class AirtelAfricaGateway(BasePaymentGateway):
     """Airtel Money Gateway for multiple countries"""
     
+    # Transaction success / failed; TIP is "in progress"
+    PROVIDER_STATUSES = {'TS': 'completed', 'TF': 'failed'}
+    
     def initiate_payment(self, phone_number, amount, reference, country):
         """Initiate Airtel Money payment"""
         try:
@@ -233,7 +310,7 @@ class AirtelAfricaGateway(BasePaymentGateway):
             }
             
             headers = self.get_headers()
-            response = self.make_request('/merchant/v1/payments/', payload)
+            response = self.make_request('/merchant/v1/payments/', payload, headers=headers)
             
             if response.get('status') == 'SUCCESSFUL':
                 return {
@@ -256,10 +333,18 @@ class AirtelAfricaGateway(BasePaymentGateway):
             'TZ': 'TZS', 'RW': 'RWF', 'UG': 'UGX', 'KE': 'KES'
         }
         return currency_map.get(country, 'USD')
+    
+    def query_status(self, reference):
+        """Status of an Airtel Money payment by its reference"""
+        response = self.make_request(f'/standard/v1/payments/{reference}', None, method='GET')
+        transaction = (response.get('data') or {}).get('transaction') or {}
+        return self.map_status(transaction.get('status'))
 
 class StripeGateway(BasePaymentGateway):
     """Stripe for card payments"""
     
+    PROVIDER_STATUSES = {'SUCCEEDED': 'completed', 'CANCELED': 'failed'}
+    
     def create_payment_intent(self, amount, currency, payment_method_id, customer_email=None):
         """Create Stripe payment intent"""
         try:
@@ -288,10 +373,22 @@ class StripeGateway(BasePaymentGateway):
         except Exception as e:
             logger.error(f"Stripe payment error: {str(e)}")
             return {'success': False, 'message': str(e)}
+    
+    def query_status(self, reference):
+        """Status of a payment intent by its id"""
+        try:
+            import stripe
+            stripe.api_key = self.api_secret
+            return self.map_status(stripe.PaymentIntent.retrieve(reference).status)
+        except Exception as e:
+            logger.error(f"Stripe status error: {str(e)}")
+            return None
 
 class PayPalGateway(BasePaymentGateway):
     """PayPal Gateway"""
     
+    PROVIDER_STATUSES = {'COMPLETED': 'completed', 'VOIDED': 'failed'}
+    
     def create_order(self, amount, currency, return_url, cancel_url):
         """Create PayPal order"""
         try:
@@ -317,7 +414,7 @@ class PayPalGateway(BasePaymentGateway):
                 'Content-Type': 'application/json'
             }
             
-            response = self.make_request('/v2/checkout/orders', payload)
+            response = self.make_request('/v2/checkout/orders', payload, headers=headers)
             
             if response.get('status') == 'CREATED':
                 return {
@@ -333,30 +430,44 @@ class PayPalGateway(BasePaymentGateway):
             return {'success': False, 'message': str(e)}
     
     def get_access_token(self):
-        """Get PayPal access token"""
+        """Get PayPal access token, cached until it expires"""
         try:
-            auth_string = f"{self.api_key}:{self.api_secret}"
-            encoded_auth = base64.b64encode(auth_string.encode()).decode()
-            
-            headers = {
-                'Authorization': f'Basic {encoded_auth}',
-                'Content-Type': 'application/x-www-form-urlencoded'
-            }
-            
-            data = {'grant_type': 'client_credentials'}
-            response = requests.post(
-                f"{self.base_url}/v1/oauth2/token",
-                headers=headers,
-                data=data,
-                timeout=30
-            )
-            
-            response.raise_for_status()
-            return response.json().get('access_token')
-            
+            return self.transport.get_token(self.fetch_access_token)
         except Exception as e:
             logger.error(f"PayPal token error: {str(e)}")
             return None
+    
+    def fetch_access_token(self):
+        """New PayPal access token and its lifetime in seconds"""
+        auth_string = f"{self.api_key}:{self.api_secret}"
+        encoded_auth = base64.b64encode(auth_string.encode()).decode()
+        
+        headers = {
+            'Authorization': f'Basic {encoded_auth}',
+            'Content-Type': 'application/x-www-form-urlencoded'
+        }
+        
+        data = {'grant_type': 'client_credentials'}
+        # Asking for a token twice is harmless, so it may be retried
+        response = self.transport.request(
+            'POST', '/v1/oauth2/token', headers=headers, data=data, idempotent=True
+        )
+        
+        response.raise_for_status()
+        data = response.json()
+        return data.get('access_token'), int(data.get('expires_in', 32400))
+    
+    def query_status(self, reference):
+        """Status of a PayPal order by its id"""
+        access_token = self.get_access_token()
+        if not access_token:
+            return None
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json'
+        }
+        response = self.make_request(f'/v2/checkout/orders/{reference}', None, method='GET', headers=headers)
+        return self.map_status(response.get('status'))
 
 class PaymentGatewayFactory:
     """Factory to create payment gateway instances"""
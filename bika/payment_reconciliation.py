@@ -0,0 +1,184 @@
+# bika/payment_reconciliation.py - CATCH UP ON PAYMENTS WHOSE WEBHOOK NEVER CAME
+import logging
+from collections import defaultdict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Notification, Order, Payment, PaymentGatewaySettings
+from .payment_gateways import PaymentGatewayFactory
+from .user_counters import schedule_counter_refresh
+
+logger = logging.getLogger(__name__)
+
+# Payment.payment_method -> PaymentGatewaySettings.gateway, where they differ
+PAYMENT_METHOD_GATEWAYS = {
+    'mpesa': 'mpesa_tz',
+}
+
+DEFAULT_RECONCILE_AFTER = 120  # Seconds a webhook gets before we ask
+DEFAULT_RECONCILE_WINDOW_DAYS = 3
+DEFAULT_RECONCILE_WORKERS = 8
+DEFAULT_RECONCILE_PER_GATEWAY = 4
+
+ReconcileResult = namedtuple('ReconcileResult', 'scanned completed failed')
+
+
+def _setting(name, default):
+    return settings.BIKA_SETTINGS.get(name, default)
+
+
+def gateway_for(payment_method):
+    return PAYMENT_METHOD_GATEWAYS.get(payment_method, payment_method)
+
+
+def payment_reference(payment):
+    """The id the provider knows the payment by"""
+    return payment.mobile_money_transaction_id or payment.transaction_id
+
+# ==================== SCAN ====================
+
+def pending_payments(batch_size=500, now=None):
+    """Batches of pending payments old enough to have had their webhook
+
+    Walks the (status, created_at) index oldest first, paging on
+    (created_at, id) so each batch is one indexed range query.
+    """
+    now = now or timezone.now()
+    payments = Payment.objects.filter(
+        status='pending',
+        created_at__lte=now - timedelta(seconds=_setting('PAYMENT_RECONCILE_AFTER', DEFAULT_RECONCILE_AFTER)),
+        created_at__gte=now - timedelta(days=_setting('PAYMENT_RECONCILE_WINDOW_DAYS', DEFAULT_RECONCILE_WINDOW_DAYS)),
+    ).order_by('created_at', 'pk').only(
+        'pk', 'order_id', 'payment_method', 'transaction_id', 'mobile_money_transaction_id', 'created_at'
+    )
+    last = None
+    while True:
+        page = payments
+        if last is not None:
+            page = page.filter(Q(created_at__gt=last.created_at) | Q(created_at=last.created_at, pk__gt=last.pk))
+        batch = list(page[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]
+
+# ==================== QUERY ====================
+
+def query_statuses(payments, gateways, workers=DEFAULT_RECONCILE_WORKERS, per_gateway=DEFAULT_RECONCILE_PER_GATEWAY):
+    """{payment_id: 'completed' | 'failed' | 'pending'} from the providers
+
+    Queries run on a thread pool. At most `per_gateway` are submitted
+    for any one provider, and the next only when one of those finishes,
+    so a slow provider cannot take every worker. Payments whose gateway
+    is not configured are skipped; failed queries are left out and tried
+    again on the next run.
+    """
+    groups = defaultdict(list)
+    for payment in payments:
+        gateway = gateways.get(gateway_for(payment.payment_method))
+        if gateway is not None:
+            groups[gateway].append(payment)
+    if not groups:
+        return {}
+    queues = {gateway: iter(group) for gateway, group in groups.items()}
+
+    def query(gateway, payment):
+        try:
+            return payment.pk, gateway.query_status(payment_reference(payment))
+        except Exception as e:
+            logger.error(f"Payment {payment.pk} status query error: {e}")
+            return payment.pk, None
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        in_flight = {}
+
+        def submit_next(gateway):
+            payment = next(queues[gateway], None)
+            if payment is not None:
+                in_flight[executor.submit(query, gateway, payment)] = gateway
+
+        # Interleave the first round so every provider starts at once
+        for _ in range(max(per_gateway, 1)):
+            for gateway in groups:
+                submit_next(gateway)
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                results.append(future.result())
+                submit_next(in_flight.pop(future))
+    return {payment_id: status for payment_id, status in results if status is not None}
+
+# ==================== APPLY ====================
+
+def apply_payment_statuses(statuses):
+    """Settle payments still pending with bulk updates, returning (completed, failed)
+
+    Mirrors payment_webhook: a completed payment confirms its order, and
+    the customer is notified either way. Bulk writes send no post_save,
+    so the customers' order and notification counters are refreshed here.
+    """
+    settled = {status: [pk for pk, s in statuses.items() if s == status] for status in ('completed', 'failed')}
+    if not any(settled.values()):
+        return 0, 0
+    now = timezone.now()
+    notifications = []
+    counts = []
+    with transaction.atomic():
+        for status, ids in settled.items():
+            # A webhook may have settled some since they were queried
+            rows = list(Payment.objects.select_for_update().filter(pk__in=ids, status='pending').values_list(
+                'pk', 'order_id', 'order__user_id', 'order__order_number'
+            ))
+            counts.append(len(rows))
+            if not rows:
+                continue
+            payment_ids = [pk for pk, *_ in rows]
+            if status == 'completed':
+                Payment.objects.filter(pk__in=payment_ids).update(status=status, paid_at=now, updated_at=now)
+                Order.objects.filter(pk__in=[order_id for _, order_id, *_ in rows]).exclude(
+                    status='cancelled'
+                ).update(status='confirmed', updated_at=now)
+            else:
+                Payment.objects.filter(pk__in=payment_ids).update(status=status, updated_at=now)
+            word = 'success' if status == 'completed' else 'failed'
+            notifications.extend(
+                Notification(
+                    user_id=user_id,
+                    title=f"Payment {word}",
+                    message=f"Your payment for order #{order_number} has been {word}.",
+                    notification_type='order_update',
+                    related_object_type='payment',
+                    related_object_id=pk
+                )
+                for pk, _, user_id, order_number in rows
+            )
+        Notification.objects.bulk_create(notifications)
+        schedule_counter_refresh([n.user_id for n in notifications], 'orders', 'notifications')
+    return tuple(counts)
+
+
+def reconcile_pending_payments(batch_size=500, workers=DEFAULT_RECONCILE_WORKERS,
+                               per_gateway=DEFAULT_RECONCILE_PER_GATEWAY):
+    """Ask the providers about every pending payment and settle the answered ones"""
+    gateways = {}
+    for config in PaymentGatewaySettings.objects.filter(is_active=True):
+        gateway = PaymentGatewayFactory.create_gateway(config.gateway, config)
+        if gateway is not None:
+            gateways[config.gateway] = gateway
+
+    scanned = completed = failed = 0
+    if not gateways:
+        return ReconcileResult(scanned, completed, failed)
+    for batch in pending_payments(batch_size):
+        statuses = query_statuses(batch, gateways, workers, per_gateway)
+        done, lost = apply_payment_statuses(statuses)
+        scanned += len(batch)
+        completed += done
+        failed += lost
+    return ReconcileResult(scanned, completed, failed)
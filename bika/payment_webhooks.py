@@ -0,0 +1,61 @@
+# bika/payment_webhooks.py - IDEMPOTENT PAYMENT WEBHOOK INGESTION
+import logging
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Payment, PaymentWebhookEvent
+from .payment_reconciliation import apply_payment_statuses
+from .tasks import enqueue, process_payment_webhook
+
+logger = logging.getLogger(__name__)
+
+# Webhook status -> Payment status; anything else is recorded and ignored
+WEBHOOK_STATUSES = {
+    'success': 'completed',
+    'failed': 'failed',
+}
+
+
+def webhook_event_id(data):
+    """The provider's event id, or the transaction and status it reports"""
+    event_id = data.get('event_id') or data.get('id')
+    if event_id:
+        return str(event_id)
+    return f"{data.get('transaction_id')}:{data.get('status')}"
+
+
+def record_webhook_event(provider, data):
+    """Store a callback and queue it, returning False for a duplicate
+
+    A duplicate costs one indexed lookup on (provider, event_id); a new
+    event is two INSERTs (the ledger row and its task) in one transaction.
+    """
+    event_id = webhook_event_id(data)[:150]
+    if PaymentWebhookEvent.objects.filter(provider=provider, event_id=event_id).exists():
+        return False
+    try:
+        with transaction.atomic():
+            event = PaymentWebhookEvent.objects.create(provider=provider, event_id=event_id, payload=data)
+            enqueue(process_payment_webhook, event.pk)
+    except IntegrityError:
+        # The same callback arrived concurrently and won
+        return False
+    return True
+
+
+def apply_webhook_event(event):
+    """Move the payment and its order to the reported status and notify the customer"""
+    if event.processed_at is not None:
+        return
+    data = event.payload
+    status = WEBHOOK_STATUSES.get(data.get('status'))
+    transaction_id = data.get('transaction_id')
+    with transaction.atomic():
+        if status and transaction_id:
+            payment_id = Payment.objects.filter(transaction_id=transaction_id).values_list('pk', flat=True).first()
+            if payment_id is None:
+                logger.warning(f"Payment webhook for unknown transaction {transaction_id}")
+            else:
+                apply_payment_statuses({payment_id: status})
+        PaymentWebhookEvent.objects.filter(pk=event.pk).update(processed_at=timezone.now())
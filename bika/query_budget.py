@@ -0,0 +1,204 @@
+# bika/query_budget.py - PER-VIEW SQL QUERY BUDGETS
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.urls import reverse
+
+logger = logging.getLogger('bika.query_budget')
+
+QUERY_BUDGET_REPORT_KEY = 'bika:query_budget:report'
+QUERY_BUDGET_REPORT_TIMEOUT = 60 * 60 * 24
+
+# Fingerprints reported per view (most repeated first)
+MAX_REPORTED_DUPLICATES = 5
+
+# ==================== FINGERPRINTS ====================
+# Two queries share a fingerprint when they only differ in literal values,
+# so "SELECT ... WHERE product_id = 1" and "... = 2" both count towards the
+# same N+1 pattern.
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN \(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+# Transaction control differs between autocommit and TestCase (BEGIN/COMMIT
+# vs SAVEPOINT/RELEASE), so it is timed but not counted against a budget.
+_TRANSACTION_CONTROL = re.compile(
+    r'^\s*(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE)\b', re.IGNORECASE
+)
+
+
+def fingerprint(sql):
+    """Normalize a SQL statement so repeated query shapes compare equal"""
+    sql = sql.replace('%s', '?')
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """Database execute wrapper that counts, times and fingerprints queries"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            if not _TRANSACTION_CONTROL.match(sql):
+                self.count += 1
+                self.fingerprints[fingerprint(sql)] += 1
+
+    @contextmanager
+    def record(self):
+        """Record every query run on any database connection in this block"""
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    @property
+    def duration_ms(self):
+        return round(self.duration * 1000, 2)
+
+    def duplicates(self, limit=MAX_REPORTED_DUPLICATES):
+        """Fingerprints that ran more than once, most repeated first"""
+        return [
+            {'fingerprint': sql, 'count': count}
+            for sql, count in self.fingerprints.most_common()
+            if count > 1
+        ][:limit]
+
+# ==================== BUDGETS ====================
+
+def get_query_budget(url_name):
+    """Declared query budget for a URL name (None if it has none)"""
+    return getattr(settings, 'BIKA_QUERY_BUDGETS', {}).get(url_name)
+
+
+def resolved_url_name(request):
+    """URL name of the view that handled the request, e.g. 'product_list'"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None or not match.url_name:
+        return None
+    if match.app_name == 'bika':
+        return match.url_name
+    return match.view_name
+
+
+def record_view(url_name, recorder, request=None, status_code=None):
+    """Log one request's query stats and add them to the staff report"""
+    budget = get_query_budget(url_name)
+    over_budget = budget is not None and recorder.count > budget
+
+    entry = {
+        'url_name': url_name,
+        'path': request.path if request is not None else None,
+        'method': request.method if request is not None else None,
+        'status': status_code,
+        'queries': recorder.count,
+        'db_time_ms': recorder.duration_ms,
+        'budget': budget,
+        'over_budget': over_budget,
+        'duplicates': recorder.duplicates(),
+    }
+
+    line = json.dumps(entry, sort_keys=True)
+    if over_budget:
+        logger.warning(line)
+    else:
+        logger.info(line)
+
+    try:
+        _update_report(entry)
+    except Exception as e:
+        logger.error(f"Query budget report update failed: {e}")
+
+    return entry
+
+
+def _update_report(entry):
+    # Best-effort aggregate: concurrent requests may drop an update, which
+    # is fine for a diagnostics view. The log file is the full record.
+    report = cache.get(QUERY_BUDGET_REPORT_KEY) or {}
+    stats = report.get(entry['url_name']) or {
+        'requests': 0,
+        'total_queries': 0,
+        'max_queries': 0,
+        'total_db_time_ms': 0.0,
+        'over_budget': 0,
+    }
+    stats['requests'] += 1
+    stats['total_queries'] += entry['queries']
+    stats['max_queries'] = max(stats['max_queries'], entry['queries'])
+    stats['total_db_time_ms'] = round(stats['total_db_time_ms'] + entry['db_time_ms'], 2)
+    stats['over_budget'] += int(entry['over_budget'])
+    stats['budget'] = entry['budget']
+    stats['last_path'] = entry['path']
+    if entry['duplicates']:
+        stats['last_duplicates'] = entry['duplicates']
+    report[entry['url_name']] = stats
+    cache.set(QUERY_BUDGET_REPORT_KEY, report, QUERY_BUDGET_REPORT_TIMEOUT)
+
+
+def get_query_budget_report():
+    """Aggregated per-view stats, worst offenders first"""
+    report = cache.get(QUERY_BUDGET_REPORT_KEY) or {}
+    rows = []
+    for url_name, stats in report.items():
+        rows.append({
+            'url_name': url_name,
+            'avg_queries': round(stats['total_queries'] / stats['requests'], 1),
+            'avg_db_time_ms': round(stats['total_db_time_ms'] / stats['requests'], 2),
+            **stats,
+        })
+    rows.sort(key=lambda row: (row['over_budget'], row['max_queries']), reverse=True)
+    return rows
+
+
+# ==================== TEST HELPER ====================
+
+class QueryBudgetTestMixin:
+    """TestCase mixin that fails when a view exceeds its declared budget"""
+
+    def assertWithinQueryBudget(self, url_name, args=None, kwargs=None,
+                                client=None, method='get', data=None, warm=True):
+        client = client or self.client
+        url = reverse(f'bika:{url_name}', args=args, kwargs=kwargs)
+        budget = get_query_budget(url_name)
+        if budget is None:
+            self.fail(f"No query budget declared for '{url_name}' in BIKA_QUERY_BUDGETS")
+
+        send = getattr(client, method)
+        if warm:
+            # Measure the steady state, not the first request that fills caches
+            send(url, data)
+
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = send(url, data)
+
+        if recorder.count > budget:
+            duplicates = '\n'.join(
+                f"  {item['count']}x {item['fingerprint'][:200]}"
+                for item in recorder.duplicates()
+            )
+            self.fail(
+                f"'{url_name}' ran {recorder.count} queries, budget is {budget}"
+                + (f"\nRepeated queries:\n{duplicates}" if duplicates else '')
+            )
+        return response
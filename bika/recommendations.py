@@ -0,0 +1,91 @@
+# bika/recommendations.py - CO-PURCHASE "RELATED PRODUCTS"
+import numpy as np
+
+from .models import Cart, OrderItem, Product, Wishlist
+from .page_cache import invalidate_page_tags
+
+# How much one basket counts towards "bought together". A basket is an
+# order, or a shopper's current cart plus wishlist.
+ORDER_WEIGHT = 3.0
+CART_WEIGHT = 1.0
+WISHLIST_WEIGHT = 0.5
+
+# Neighbours stored per product (the detail page shows the first 4)
+RELATED_PRODUCTS_K = 12
+
+
+def _baskets():
+    """(basket keys, product ids, weights) of every order, cart and wishlist line"""
+    keys, products, weights = [], [], []
+    for order_id, product_id in OrderItem.objects.exclude(
+        order__status='cancelled'
+    ).values_list('order_id', 'product_id').iterator():
+        keys.append(f'order:{order_id}')
+        products.append(product_id)
+        weights.append(ORDER_WEIGHT)
+    for model, weight in ((Cart, CART_WEIGHT), (Wishlist, WISHLIST_WEIGHT)):
+        for user_id, product_id in model.objects.values_list('user_id', 'product_id').iterator():
+            keys.append(f'user:{user_id}')
+            products.append(product_id)
+            weights.append(weight)
+    return keys, products, weights
+
+
+def co_purchase_neighbours(k=RELATED_PRODUCTS_K):
+    """{product_id: [related product ids, best first]} for every product with baskets
+
+    Builds a sparse basket x product matrix B and scores product pairs by
+    cosine similarity of their columns, S = B'B / (|b_i| |b_j|), so a
+    best-seller does not become everybody's neighbour. Only active
+    products are suggested.
+    """
+    from scipy import sparse
+
+    keys, products, weights = _baskets()
+    if not products:
+        return {}
+    _, rows = np.unique(np.array(keys), return_inverse=True)
+    product_ids, cols = np.unique(np.array(products), return_inverse=True)
+
+    # Duplicate (basket, product) entries are summed
+    baskets = sparse.csr_matrix(
+        (np.array(weights), (rows, cols)), shape=(rows.max() + 1, len(product_ids))
+    )
+    norms = np.sqrt(np.asarray(baskets.multiply(baskets).sum(axis=0))).ravel()
+    baskets = baskets @ sparse.diags(1.0 / norms)
+
+    active = np.isin(product_ids, list(
+        Product.objects.filter(pk__in=product_ids.tolist(), status='active').values_list('pk', flat=True)
+    ))
+    similarity = (baskets.T @ baskets) @ sparse.diags(active.astype(float))
+    similarity = sparse.csr_matrix(similarity)
+    similarity.setdiag(0)
+    similarity.eliminate_zeros()
+
+    neighbours = {}
+    for i, product_id in enumerate(product_ids.tolist()):
+        start, end = similarity.indptr[i], similarity.indptr[i + 1]
+        if start == end:
+            continue
+        scores = similarity.data[start:end]
+        columns = similarity.indices[start:end]
+        # Highest score first, lower product id on ties
+        order = np.lexsort((product_ids[columns], -scores))[:k]
+        neighbours[product_id] = product_ids[columns[order]].tolist()
+    return neighbours
+
+
+def rebuild_related_products(k=RELATED_PRODUCTS_K, batch_size=500):
+    """Store the neighbours of every product, returning how many have some"""
+    neighbours = co_purchase_neighbours(k)
+    changed = []
+    for product in Product.objects.only('pk', 'related_product_ids').iterator():
+        related = neighbours.get(product.pk, [])
+        if product.related_product_ids != related:
+            product.related_product_ids = related
+            changed.append(product)
+    Product.objects.bulk_update(changed, ['related_product_ids'], batch_size=batch_size)
+    if changed:
+        # bulk_update() sends no signals; product pages show the neighbours
+        invalidate_page_tags('product')
+    return len(neighbours)
@@ -0,0 +1,149 @@
+# bika/reservations.py - SHORT-LIVED STOCK HOLDS FOR CHECKOUT
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import HeldStock, StockHold
+
+# Each product's HeldStock row counts the units of all its StockHold rows,
+# expired or not, and changes in the same transaction as they do. A hold
+# is admitted with one conditional UPDATE on that row, so checkout never
+# locks the product row, and every process sees the same counter.
+
+DEFAULT_STOCK_HOLD_MINUTES = 15
+
+
+def _hold_duration():
+    return timedelta(minutes=settings.BIKA_SETTINGS.get('STOCK_HOLD_MINUTES', DEFAULT_STOCK_HOLD_MINUTES))
+
+# ==================== COUNTERS ====================
+
+def reconcile_held_stock(product_ids=None):
+    """Reset counters to the sum of their StockHold rows
+
+    Only needed when holds were removed behind this module's back, e.g.
+    by a cascading user delete. Returns the {product_id: units} it fixed.
+    """
+    with transaction.atomic():
+        counters = HeldStock.objects.select_for_update()
+        if product_ids is None:
+            # Rows deleted behind our back only ever leave a counter too high
+            counters = counters.filter(quantity__gt=0)
+        else:
+            counters = counters.filter(product_id__in=product_ids)
+        current = dict(counters.values_list('product_id', 'quantity'))
+        totals = dict(StockHold.objects.filter(product_id__in=list(current)).order_by().values(
+            'product_id'
+        ).annotate(total=Sum('quantity')).values_list('product_id', 'total'))
+        fixed = {}
+        for product_id, quantity in current.items():
+            total = totals.get(product_id, 0)
+            if total != quantity:
+                HeldStock.objects.filter(product_id=product_id).update(quantity=total)
+                fixed[product_id] = total
+    return fixed
+
+
+def get_held_stock(product_ids):
+    """{product_id: units held by unexpired holds}"""
+    held = dict.fromkeys(product_ids, 0)
+    held.update(StockHold.objects.filter(
+        product_id__in=product_ids, expires_at__gt=timezone.now()
+    ).order_by().values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total'))
+    return held
+
+
+def _release_counters(quantities):
+    for product_id, quantity in quantities.items():
+        HeldStock.objects.filter(product_id=product_id).update(quantity=F('quantity') - quantity)
+
+# ==================== HOLDS ====================
+
+def hold_stock(user, lines):
+    """Hold {product_id: (quantity, stock_quantity)} for the user
+
+    Replaces the user's previous holds. Each product is admitted only if
+    the units already held by everybody plus this quantity fit in its
+    stock. Returns the product ids that could not be held; nothing is
+    held then.
+    """
+    with transaction.atomic():
+        # The new hold must not be measured against the one it replaces,
+        # nor against holds that already ran out
+        _delete_holds(StockHold.objects.filter(user=user))
+        if not lines:
+            return []
+        _delete_holds(StockHold.objects.filter(product_id__in=list(lines), expires_at__lte=timezone.now()))
+        HeldStock.objects.bulk_create([HeldStock(product_id=product_id) for product_id in lines], ignore_conflicts=True)
+
+        admitted = {}
+        short = []
+        for product_id, (quantity, stock) in lines.items():
+            if HeldStock.objects.filter(product_id=product_id, quantity__lte=stock - quantity).update(
+                quantity=F('quantity') + quantity
+            ):
+                admitted[product_id] = quantity
+            else:
+                short.append(product_id)
+        if short:
+            _release_counters(admitted)
+            return short
+
+        expires_at = timezone.now() + _hold_duration()
+        StockHold.objects.bulk_create([
+            StockHold(user=user, product_id=product_id, quantity=quantity, expires_at=expires_at)
+            for product_id, quantity in admitted.items()
+        ])
+    return []
+
+
+def user_holds(user):
+    """{product_id: quantity} of the user's unexpired holds"""
+    return dict(StockHold.objects.filter(user=user, expires_at__gt=timezone.now()).values_list(
+        'product_id', 'quantity'
+    ))
+
+
+def _delete_holds(holds):
+    """Delete the holds and take their units off the counters
+
+    Call inside a transaction. Returns how many holds were deleted.
+    """
+    rows = list(holds.select_for_update().order_by('pk').values_list('pk', 'product_id', 'quantity'))
+    if not rows:
+        return 0
+    StockHold.objects.filter(pk__in=[pk for pk, *_ in rows]).delete()
+    released = {}
+    for _, product_id, quantity in rows:
+        released[product_id] = released.get(product_id, 0) + quantity
+    _release_counters(released)
+    return len(rows)
+
+
+def release_holds(user):
+    """Drop the user's holds, e.g. once they became stock decrements"""
+    with transaction.atomic():
+        _delete_holds(StockHold.objects.filter(user=user))
+
+
+def sweep_expired_holds(batch_size=1000):
+    """Delete expired holds in bulk, returning how many were removed
+
+    Then reconciles every counter, correcting those left behind by holds
+    that were deleted without going through this module.
+    """
+    removed = 0
+    now = timezone.now()
+    while True:
+        with transaction.atomic():
+            deleted = _delete_holds(StockHold.objects.filter(pk__in=list(
+                StockHold.objects.filter(expires_at__lte=now).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )))
+        if not deleted:
+            break
+        removed += deleted
+    reconcile_held_stock()
+    return removed
@@ -0,0 +1,61 @@
+# bika/review_stats.py - DENORMALIZED PRODUCT REVIEW AGGREGATES
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Product, ProductReview
+from .page_cache import schedule_page_invalidation
+
+# ProductReview fields that affect the aggregates
+RATED_REVIEW_FIELDS = ['product', 'product_id', 'rating', 'is_approved']
+
+EMPTY_HISTOGRAM = [0, 0, 0, 0, 0]
+
+
+def compute_review_stats(product_ids):
+    """{product_id: (avg_rating, review_count, histogram)} from approved reviews"""
+    histograms = {pk: list(EMPTY_HISTOGRAM) for pk in product_ids}
+    rows = ProductReview.objects.filter(
+        product_id__in=product_ids, is_approved=True
+    ).order_by().values('product_id', 'rating').annotate(n=Count('id'))
+    for row in rows:
+        if 1 <= row['rating'] <= 5:
+            histograms[row['product_id']][row['rating'] - 1] += row['n']
+
+    stats = {}
+    for pk, histogram in histograms.items():
+        count = sum(histogram)
+        total = sum(stars * n for stars, n in enumerate(histogram, start=1))
+        average = Decimal(total) / count if count else Decimal('0')
+        stats[pk] = (average.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP), count, histogram)
+    return stats
+
+
+def refresh_review_stats(product_ids):
+    """Recompute the aggregates of the given products
+
+    Runs in the caller's transaction (or its own), with the product rows
+    locked first, so concurrent review writes for one product cannot
+    interleave their recounts. Uses QuerySet.update(), which sends no
+    signals - a rating change does not invalidate catalog caches, only
+    the cached product pages that show the stars.
+    """
+    product_ids = sorted({pk for pk in product_ids if pk is not None})
+    if not product_ids:
+        return
+    with transaction.atomic():
+        list(Product.objects.select_for_update().filter(pk__in=product_ids).values_list('pk', flat=True))
+        for pk, (average, count, histogram) in compute_review_stats(product_ids).items():
+            Product.objects.filter(pk=pk).update(
+                avg_rating=average, review_count=count, rating_histogram=histogram
+            )
+        schedule_page_invalidation('product')
+
+
+def rebuild_review_stats(batch_size=500):
+    """Recompute every product, returning the number updated"""
+    product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(product_ids), batch_size):
+        refresh_review_stats(product_ids[start:start + batch_size])
+    return len(product_ids)
@@ -0,0 +1,157 @@
+# bika/search.py - FULL-TEXT PRODUCT SEARCH
+import re
+
+from django.db import connection, DatabaseError, transaction
+from django.db.models import Q
+
+# SQLite FTS5 shadow table, one row per product (rowid = product id).
+# Created by migration 0006 on SQLite only; every other backend uses the
+# icontains fallback below. Signals keep it in sync inside the same
+# transaction as the product write (see bika/signals.py).
+FTS_TABLE = 'bika_product_fts'
+
+# Indexed columns and their bm25() weights - a hit in the name outranks a
+# hit in the tags, which outranks one in the description
+FTS_COLUMNS = [
+    ('name', 10.0),
+    ('tags', 5.0),
+    ('brand', 4.0),
+    ('model', 4.0),
+    ('category', 3.0),
+    ('short_description', 2.0),
+    ('description', 1.0),
+]
+
+# Product fields whose change requires a reindex
+INDEXED_PRODUCT_FIELDS = [
+    'name', 'tags', 'brand', 'model', 'category', 'category_id',
+    'short_description', 'description',
+]
+
+MAX_QUERY_TERMS = 8
+
+_TERM = re.compile(r'\w+', re.UNICODE)
+
+_fts_available = None
+
+
+def fts_available():
+    """True when the FTS5 index exists on the default database"""
+    global _fts_available
+    if _fts_available:
+        return True
+    if connection.vendor != 'sqlite':
+        return False
+    try:
+        # Only a positive answer is remembered: the table appears once
+        # migrations have run
+        _fts_available = FTS_TABLE in connection.introspection.table_names()
+    except DatabaseError:
+        return False
+    return _fts_available
+
+# ==================== QUERYING ====================
+
+def build_match_query(query):
+    """Turn user input into an FTS5 MATCH expression
+
+    Every term must match and is treated as a prefix, so "man tro" finds
+    "Fresh Mango (tropical)". Terms are quoted, which keeps FTS5 operators
+    typed by the user (AND, NEAR, *, ...) from being interpreted.
+    """
+    terms = _TERM.findall(query.lower())[:MAX_QUERY_TERMS]
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def icontains_filter(query):
+    """LIKE-based filter used where the FTS index is unavailable"""
+    return (
+        Q(name__icontains=query) |
+        Q(description__icontains=query) |
+        Q(short_description__icontains=query) |
+        Q(tags__icontains=query) |
+        Q(category__name__icontains=query) |
+        Q(brand__icontains=query) |
+        Q(model__icontains=query)
+    )
+
+
+def search_products(queryset, query):
+    """Filter a Product queryset by a search query
+
+    With the FTS index the results get a 'search_rank' column (lower is
+    better), so callers can order_by('search_rank') for relevance.
+    Returns (queryset, ranked).
+    """
+    match = build_match_query(query)
+    if not match:
+        return queryset.none(), False
+
+    if not fts_available():
+        return queryset.filter(icontains_filter(query)), False
+
+    weights = ', '.join(str(weight) for _, weight in FTS_COLUMNS)
+    queryset = queryset.extra(
+        select={'search_rank': f'bm25({FTS_TABLE}, {weights})'},
+        tables=[FTS_TABLE],
+        where=[
+            f'{FTS_TABLE}.rowid = bika_product.id',
+            f'{FTS_TABLE} MATCH %s',
+        ],
+        params=[match],
+    )
+    return queryset, True
+
+# ==================== INDEXING ====================
+
+_INSERT_SQL = (
+    f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(name for name, _ in FTS_COLUMNS)}) "
+    "SELECT p.id, p.name, p.tags, p.brand, p.model, COALESCE(c.name, ''), "
+    "p.short_description, p.description "
+    "FROM bika_product p LEFT JOIN bika_productcategory c ON c.id = p.category_id"
+)
+
+
+def _reindex(where='', params=()):
+    with connection.cursor() as cursor:
+        if where:
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT p.id FROM bika_product p WHERE {where})",
+                params
+            )
+            cursor.execute(f"{_INSERT_SQL} WHERE {where}", params)
+        else:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(_INSERT_SQL)
+
+
+def index_product(product_id):
+    """(Re)index one product. Inactive products are indexed too - status is
+    filtered by the ORM, so bulk status changes need no reindex."""
+    if fts_available():
+        _reindex('p.id = %s', [product_id])
+
+
+def remove_product(product_id):
+    if fts_available():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [product_id])
+
+
+def index_category(category_id):
+    """Reindex every product in a category (its name is indexed)"""
+    if fts_available():
+        _reindex('p.category_id = %s', [category_id])
+
+
+def rebuild_index():
+    """Rebuild the whole index and return the number of indexed products"""
+    if not fts_available():
+        return 0
+    with transaction.atomic():
+        _reindex()
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+            cursor.execute(f"SELECT COUNT(*) FROM {FTS_TABLE}")
+            return cursor.fetchone()[0]
+
@@ -0,0 +1,238 @@
+# bika/sensor_devices.py - SENSOR DEVICE REGISTRY AND HEARTBEATS
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from .models import CustomUser, Notification, SensorDevice
+from .user_counters import schedule_counter_refresh
+
+logger = logging.getLogger(__name__)
+
+DeviceIdentity = namedtuple('DeviceIdentity', 'pk device_key product_id fruit_batch_id location_id')
+
+# Resolved devices are kept in an in-process LRU, tagged with the
+# registry version; any SensorDevice change bumps the version in the
+# shared cache, which drops every process's entries at once.
+DEVICE_REGISTRY_VERSION_KEY = 'bika:sensor_device_version'
+DEFAULT_SENSOR_DEVICE_CACHE_SIZE = 1024
+
+# Heartbeats are buffered in memory and written at most this many
+# seconds later, like product view counts (see bika/view_counter.py)
+DEFAULT_SENSOR_HEARTBEAT_FLUSH_INTERVAL = 30
+DEFAULT_SENSOR_DEVICE_OFFLINE_MINUTES = 15
+
+# Devices per UPDATE, keeping the CASE under SQLite's parameter limit
+HEARTBEAT_WRITE_CHUNK = 300
+
+_devices = OrderedDict()
+_devices_lock = threading.Lock()
+
+_heartbeats = {}
+_heartbeats_lock = threading.Lock()
+_timer = None
+
+
+def _setting(name, default):
+    return settings.BIKA_SETTINGS.get(name, default)
+
+# ==================== REGISTRY ====================
+
+def get_registry_version():
+    version = cache.get(DEVICE_REGISTRY_VERSION_KEY)
+    if version is None:
+        cache.add(DEVICE_REGISTRY_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(DEVICE_REGISTRY_VERSION_KEY)
+    return version
+
+
+def bump_registry_version():
+    cache.set(DEVICE_REGISTRY_VERSION_KEY, int(time.time() * 1000), None)
+
+
+def schedule_registry_version_bump():
+    """Bump once the current transaction commits"""
+    transaction.on_commit(bump_registry_version)
+
+
+def resolve_devices(device_keys):
+    """{device_key: DeviceIdentity or None} for active devices
+
+    Costs one cache read for the registry version, plus one query for
+    the keys that are not in this process's LRU. Unknown keys are
+    remembered too, so a misconfigured device cannot force a lookup per
+    reading.
+    """
+    if not device_keys:
+        return {}
+    version = get_registry_version()
+    resolved = {}
+    missing = []
+    with _devices_lock:
+        for key in device_keys:
+            entry = _devices.get(key)
+            if entry is not None and entry[0] == version:
+                _devices.move_to_end(key)
+                resolved[key] = entry[1]
+            else:
+                missing.append(key)
+    if not missing:
+        return resolved
+
+    found = {
+        row[1]: DeviceIdentity(*row)
+        for row in SensorDevice.objects.filter(device_key__in=missing, is_active=True).values_list(
+            'pk', 'device_key', 'product_id', 'fruit_batch_id', 'location_id'
+        )
+    }
+    size = _setting('SENSOR_DEVICE_CACHE_SIZE', DEFAULT_SENSOR_DEVICE_CACHE_SIZE)
+    with _devices_lock:
+        for key in missing:
+            resolved[key] = found.get(key)
+            _devices[key] = (version, resolved[key])
+            _devices.move_to_end(key)
+        while len(_devices) > size:
+            _devices.popitem(last=False)
+    return resolved
+
+
+def resolve_device(device_key):
+    return resolve_devices([device_key])[device_key]
+
+
+def forget_devices(device_keys):
+    """Drop the keys from this process's LRU, e.g. after a write showed them stale"""
+    with _devices_lock:
+        for key in device_keys:
+            _devices.pop(key, None)
+
+
+def clear_device_cache():
+    with _devices_lock:
+        _devices.clear()
+
+# ==================== HEARTBEATS ====================
+
+def _flush_interval():
+    return _setting('SENSOR_HEARTBEAT_FLUSH_INTERVAL', DEFAULT_SENSOR_HEARTBEAT_FLUSH_INTERVAL)
+
+
+def _schedule_flush(interval):
+    """Start the flush timer unless one is running (call with _heartbeats_lock held)"""
+    global _timer
+    if _timer is None:
+        _timer = threading.Timer(interval, _flush_in_background)
+        _timer.daemon = True
+        _timer.start()
+
+
+def _flush_in_background():
+    try:
+        flush_heartbeats()
+    finally:
+        # The timer thread has its own connection
+        connection.close()
+
+
+def write_heartbeats(seen):
+    """Set last_seen_at from {device_pk: datetime}, clearing offline alerts"""
+    pks = list(seen)
+    with transaction.atomic():
+        for start in range(0, len(pks), HEARTBEAT_WRITE_CHUNK):
+            chunk = pks[start:start + HEARTBEAT_WRITE_CHUNK]
+            SensorDevice.objects.filter(pk__in=chunk).update(
+                last_seen_at=Case(
+                    *[When(pk=pk, then=Value(seen[pk])) for pk in chunk],
+                    output_field=DateTimeField()
+                ),
+                offline_alerted_at=None,
+            )
+
+
+def record_heartbeats(device_pks, seen_at=None):
+    """Note that the devices just sent readings"""
+    seen_at = seen_at or timezone.now()
+    interval = _flush_interval()
+    if interval <= 0:
+        write_heartbeats({pk: seen_at for pk in device_pks})
+        return
+    with _heartbeats_lock:
+        for pk in device_pks:
+            _heartbeats[pk] = seen_at
+        _schedule_flush(interval)
+
+
+def flush_heartbeats():
+    """Write every buffered heartbeat, returning how many devices were written"""
+    global _timer
+    with _heartbeats_lock:
+        seen = dict(_heartbeats)
+        _heartbeats.clear()
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+    if not seen:
+        return 0
+
+    try:
+        write_heartbeats(seen)
+    except DatabaseError:
+        # Keep them for the next attempt, unless newer ones arrived since
+        logger.exception("Could not flush %d sensor heartbeats", len(seen))
+        with _heartbeats_lock:
+            for pk, seen_at in seen.items():
+                _heartbeats.setdefault(pk, seen_at)
+            _schedule_flush(max(_flush_interval(), 1))
+        return 0
+    return len(seen)
+
+
+def pending_heartbeats():
+    with _heartbeats_lock:
+        return dict(_heartbeats)
+
+# ==================== OFFLINE SWEEP ====================
+
+def sweep_offline_devices(now=None):
+    """Alert admins about devices that stopped reporting, returning how many
+
+    Walks the partial index of devices not yet alerted, so the cost is
+    the number of newly silent devices, not the size of the registry.
+    Each device is alerted once until it reports again.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(minutes=_setting('SENSOR_DEVICE_OFFLINE_MINUTES', DEFAULT_SENSOR_DEVICE_OFFLINE_MINUTES))
+    silent = list(SensorDevice.objects.filter(
+        is_active=True, offline_alerted_at__isnull=True, last_seen_at__lt=cutoff
+    ).values_list('pk', 'name', 'device_key', 'last_seen_at'))
+    if not silent:
+        return 0
+
+    admins = list(CustomUser.objects.filter(user_type='admin', is_active=True).values_list('pk', flat=True))
+    with transaction.atomic():
+        SensorDevice.objects.filter(pk__in=[pk for pk, *_ in silent]).update(offline_alerted_at=now)
+        Notification.objects.bulk_create([
+            Notification(
+                user_id=admin_id,
+                title=f"Sensor offline: {name}",
+                message=f"No readings from {name} ({device_key}) since {last_seen_at:%Y-%m-%d %H:%M}.",
+                notification_type='system_alert',
+                related_object_type='sensor_device',
+                related_object_id=pk
+            )
+            for pk, name, device_key, last_seen_at in silent for admin_id in admins
+        ])
+        # bulk_create() sends no post_save
+        schedule_counter_refresh(admins, 'notifications')
+    return len(silent)
+
+
+atexit.register(flush_heartbeats)
@@ -0,0 +1,231 @@
+# bika/sensor_ingest.py - BATCH SENSOR READING INGESTION
+import json
+import math
+
+from django.db import IntegrityError, connection, transaction
+
+from .models import FruitBatch, Product, ProductAlert, RealTimeSensorData, StorageLocation
+from .sensor_devices import forget_devices, record_heartbeats, resolve_devices
+from .user_counters import schedule_counter_refresh
+
+# Readings accepted per request; larger uploads must be split
+MAX_SENSOR_BATCH = 5000
+
+REQUIRED_FIELDS = ('sensor_type', 'value', 'unit')
+
+# Outside this range (°C) a temperature reading raises an alert
+SAFE_TEMPERATURE_RANGE = (0, 25)
+
+
+class SensorBatchError(ValueError):
+    """A batch body that cannot be read at all"""
+
+
+def is_temperature_anomaly(value):
+    low, high = SAFE_TEMPERATURE_RANGE
+    return value < low or value > high
+
+# ==================== PARSING ====================
+
+def parse_readings(body, ndjson=False):
+    """Readings of a JSON array, a single JSON object or NDJSON body
+
+    Returns a list with one dict per reading, or a str error for a
+    reading that is not a JSON object.
+    """
+    text = body.decode('utf-8') if isinstance(body, bytes) else body
+    if not ndjson:
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            # More than one line of JSON is NDJSON sent without its content type
+            if '\n' not in text.strip():
+                raise SensorBatchError('Invalid JSON')
+        else:
+            readings = data if isinstance(data, list) else [data]
+            return [r if isinstance(r, dict) else 'Reading must be a JSON object' for r in _limit(readings)]
+
+    readings = []
+    for line in _limit([line for line in text.splitlines() if line.strip()]):
+        try:
+            reading = json.loads(line)
+        except json.JSONDecodeError:
+            reading = 'Invalid JSON'
+        readings.append(reading if isinstance(reading, (dict, str)) else 'Reading must be a JSON object')
+    return readings
+
+
+def _limit(readings):
+    if len(readings) > MAX_SENSOR_BATCH:
+        raise SensorBatchError(f'At most {MAX_SENSOR_BATCH} readings per request')
+    return readings
+
+# ==================== INGESTION ====================
+
+def _validate(reading):
+    """(sensor_type, value, unit) of a reading, or a str error"""
+    if isinstance(reading, str):
+        return reading
+    for field in REQUIRED_FIELDS:
+        if field not in reading:
+            return f'Missing field: {field}'
+    try:
+        value = float(reading['value'])
+    except (TypeError, ValueError):
+        return 'value must be a number'
+    if not math.isfinite(value):
+        return 'value must be a number'
+    return str(reading['sensor_type']), value, str(reading['unit'])
+
+
+def _location_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def resolve_references(readings):
+    """{barcode: product id}, {batch_number: batch id}, {location id: id}
+
+    One IN query per kind for the whole batch, instead of up to three
+    lookups per reading. Readings sent by a registered device need none.
+    """
+    barcodes, batch_numbers, location_ids = set(), set(), set()
+    for reading in readings:
+        if isinstance(reading, dict) and not reading.get('device_key'):
+            if reading.get('product_barcode'):
+                barcodes.add(str(reading['product_barcode']))
+            if reading.get('batch_number'):
+                batch_numbers.add(str(reading['batch_number']))
+            if _location_id(reading.get('location_id')) is not None:
+                location_ids.add(_location_id(reading['location_id']))
+
+    products = {}
+    if barcodes:
+        products = dict(Product.objects.filter(barcode__in=barcodes).values_list('barcode', 'pk'))
+    batches = {}
+    if batch_numbers:
+        batches = dict(FruitBatch.objects.filter(batch_number__in=batch_numbers).values_list('batch_number', 'pk'))
+    locations = set()
+    if location_ids:
+        locations = set(StorageLocation.objects.filter(pk__in=location_ids).values_list('pk', flat=True))
+    return products, batches, locations
+
+
+def _build_rows(readings, devices, products, batches, locations):
+    """(results, [(result, RealTimeSensorData)], worst anomaly per product, device pks seen)"""
+    results = []
+    rows = []
+    worst = {}
+    seen = set()
+    for index, reading in enumerate(readings):
+        valid = _validate(reading)
+        if isinstance(valid, str):
+            results.append({'index': index, 'status': 'error', 'error': valid})
+            continue
+        sensor_type, value, unit = valid
+
+        unresolved = []
+        if reading.get('device_key'):
+            device = devices.get(str(reading['device_key']))
+            if device is None:
+                results.append({'index': index, 'status': 'error', 'error': 'Unknown device'})
+                continue
+            seen.add(device.pk)
+            product_id, batch_id, location_id = device.product_id, device.fruit_batch_id, device.location_id
+        else:
+            product_id = products.get(str(reading.get('product_barcode') or ''))
+            if reading.get('product_barcode') and product_id is None:
+                unresolved.append('product_barcode')
+            batch_id = batches.get(str(reading.get('batch_number') or ''))
+            if reading.get('batch_number') and batch_id is None:
+                unresolved.append('batch_number')
+            location_id = _location_id(reading.get('location_id'))
+            if location_id not in locations:
+                if reading.get('location_id'):
+                    unresolved.append('location_id')
+                location_id = None
+
+        result = {'index': index, 'status': 'created'}
+        if unresolved:
+            result['unresolved'] = unresolved
+        results.append(result)
+        rows.append((result, RealTimeSensorData(
+            product_id=product_id, fruit_batch_id=batch_id, location_id=location_id,
+            sensor_type=sensor_type, value=value, unit=unit,
+        )))
+
+        if product_id is not None and sensor_type == 'temperature' and is_temperature_anomaly(value):
+            distance = abs(value - sum(SAFE_TEMPERATURE_RANGE) / 2)
+            if product_id not in worst or distance > worst[product_id][0]:
+                worst[product_id] = (distance, value, unit)
+    return results, rows, worst, seen
+
+
+def ingest_readings(readings, device_key=None):
+    """Store a batch of readings, returning one result dict per reading
+
+    A reading's `device_key` (or the request's, for readings without
+    one) attaches it to what that registered device measures; otherwise
+    its product_barcode, batch_number and location_id are looked up.
+    Valid readings are written with one bulk_create(); each result is
+    {'index', 'status': 'created', 'id'} (plus 'unresolved' references
+    that matched nothing, stored as empty like the single-reading API)
+    or {'index', 'status': 'error', 'error'}. A product whose readings
+    include temperature anomalies gets one alert for the worst of them.
+
+    A device identity can outlive what it points at until another
+    process's registry bump arrives; the write then fails a foreign key,
+    and the batch is resolved again from the database and retried once.
+    """
+    if device_key:
+        readings = [
+            {**reading, 'device_key': reading.get('device_key') or device_key}
+            if isinstance(reading, dict) else reading
+            for reading in readings
+        ]
+    device_keys = {
+        str(reading['device_key']) for reading in readings
+        if isinstance(reading, dict) and reading.get('device_key')
+    }
+    retried = False
+    while True:
+        results, rows, worst, seen = _build_rows(
+            readings, resolve_devices(device_keys), *resolve_references(readings)
+        )
+        try:
+            # Outermost, this block's commit is where deferred foreign
+            # keys are checked; nested, the caller's transaction is
+            # broken and there is nothing to retry in
+            with transaction.atomic(savepoint=False):
+                created = RealTimeSensorData.objects.bulk_create([reading for _, reading in rows])
+        except IntegrityError:
+            if retried or connection.in_atomic_block:
+                raise
+            retried = True
+            forget_devices(device_keys)
+            continue
+        break
+    for (result, _), reading in zip(rows, created):
+        result['id'] = reading.pk
+
+    if seen:
+        record_heartbeats(seen)
+
+    if worst:
+        ProductAlert.objects.bulk_create([
+            ProductAlert(
+                product_id=product_id,
+                alert_type='temperature_anomaly',
+                severity='high',
+                message=f'Temperature anomaly detected: {value}{unit}',
+                detected_by='sensor_system'
+            )
+            for product_id, (_, value, unit) in worst.items()
+        ])
+        # bulk_create() sends no post_save, so refresh the vendors' alert badges
+        schedule_counter_refresh(
+            list(Product.objects.filter(pk__in=worst).values_list('vendor_id', flat=True)), 'alerts'
+        )
+    return results
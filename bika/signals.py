@@ -0,0 +1,207 @@
+# bika/signals.py - MODEL SIGNAL HANDLERS
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import (
+    SiteInfo, Service, ProductCategory, Product, CustomUser,
+    Cart, Wishlist, Notification, Order, ProductAlert, ProductReview, ProductImage,
+    FAQ, Testimonial, SensorDevice, StorageLocation, FruitBatch
+)
+from .site_context import schedule_global_context_invalidation
+from .user_counters import schedule_counter_refresh
+from . import search
+from .autocomplete import schedule_autocomplete_change, SUGGESTED_PRODUCT_FIELDS
+from .review_stats import refresh_review_stats, RATED_REVIEW_FIELDS
+from .thumbnails import schedule_derivatives, schedule_derivative_cleanup
+from .page_cache import schedule_page_invalidation, page_tag
+from .conditional import schedule_product_version_bump
+from .anonymous_cart import merge_anonymous_cart
+from .sensor_devices import schedule_registry_version_bump
+
+# ==================== GLOBAL TEMPLATE CONTEXT ====================
+
+def _only_updates(kwargs, fields):
+    """True for a save(update_fields=...) limited to the given fields"""
+    update_fields = kwargs.get('update_fields')
+    return bool(update_fields) and set(update_fields) <= set(fields)
+
+
+@receiver([post_save, post_delete], sender=SiteInfo)
+@receiver([post_save, post_delete], sender=Service)
+@receiver([post_save, post_delete], sender=ProductCategory)
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_global_context_on_change(sender, **kwargs):
+    """Drop the cached global context when its source data changes"""
+    if sender is Product and _only_updates(kwargs, ['views_count']):
+        return
+    schedule_global_context_invalidation()
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def invalidate_global_context_on_user_change(sender, **kwargs):
+    """Keep the vendor count fresh without reacting to every login"""
+    if _only_updates(kwargs, ['last_login']):
+        return
+    schedule_global_context_invalidation()
+
+# ==================== USER HEADER COUNTERS ====================
+
+@receiver([post_save, post_delete], sender=Cart)
+def refresh_cart_counters(sender, instance, **kwargs):
+    schedule_counter_refresh(instance.user_id, 'cart')
+
+
+@receiver([post_save, post_delete], sender=Wishlist)
+def refresh_wishlist_counters(sender, instance, **kwargs):
+    schedule_counter_refresh(instance.user_id, 'wishlist')
+
+
+@receiver([post_save, post_delete], sender=Notification)
+def refresh_notification_counters(sender, instance, **kwargs):
+    schedule_counter_refresh(instance.user_id, 'notifications')
+
+
+@receiver([post_save, post_delete], sender=Order)
+def refresh_order_counters(sender, instance, **kwargs):
+    schedule_counter_refresh(instance.user_id, 'orders')
+
+
+@receiver([post_save, post_delete], sender=ProductAlert)
+def refresh_alert_counters(sender, instance, **kwargs):
+    vendor_id = Product.objects.filter(
+        pk=instance.product_id
+    ).values_list('vendor_id', flat=True).first()
+    schedule_counter_refresh(vendor_id, 'alerts')
+
+
+@receiver(post_save, sender=Product)
+def refresh_cart_counters_on_price_change(sender, instance, created, **kwargs):
+    """Cart totals depend on the current product price"""
+    if created or _only_updates(kwargs, ['views_count']):
+        return
+    user_ids = Cart.objects.filter(product=instance).values_list('user_id', flat=True)
+    schedule_counter_refresh(list(user_ids), 'cart')
+
+# ==================== SEARCH INDEX ====================
+# The FTS table lives in the same database, so it is updated inside the
+# product's own transaction and rolls back with it.
+
+@receiver(post_save, sender=Product)
+def index_product_for_search(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if update_fields and not set(update_fields) & set(search.INDEXED_PRODUCT_FIELDS):
+        return
+    search.index_product(instance.pk)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_search(sender, instance, **kwargs):
+    search.remove_product(instance.pk)
+
+
+@receiver(post_save, sender=ProductCategory)
+def reindex_category_for_search(sender, instance, created, **kwargs):
+    if not created:
+        search.index_category(instance.pk)
+
+# ==================== AUTOCOMPLETE ====================
+
+@receiver([post_save, post_delete], sender=Product)
+def update_product_suggestions(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if update_fields and not set(update_fields) & set(SUGGESTED_PRODUCT_FIELDS):
+        return
+    schedule_autocomplete_change('product', instance.pk)
+
+
+@receiver([post_save, post_delete], sender=ProductCategory)
+def update_category_suggestions(sender, instance, **kwargs):
+    schedule_autocomplete_change('category', instance.pk)
+
+# ==================== REVIEW AGGREGATES ====================
+
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=ProductReview)
+def refresh_product_review_stats(sender, instance, **kwargs):
+    """Recount the product's ratings in the same transaction as the review"""
+    update_fields = kwargs.get('update_fields')
+    if update_fields and not set(update_fields) & set(RATED_REVIEW_FIELDS):
+        return
+    refresh_review_stats([instance.product_id])
+
+# ==================== PRIMARY IMAGE ====================
+
+@receiver(post_delete, sender=ProductImage)
+def resync_primary_image(sender, instance, **kwargs):
+    """Also runs for QuerySet.delete(), which SET_NULLs the pointer first"""
+    ProductImage.sync_primary_image(instance.product_id)
+
+# ==================== IMAGE DERIVATIVES ====================
+
+@receiver(post_save, sender=ProductImage)
+def generate_image_derivatives(sender, instance, **kwargs):
+    """Thumbnails and WebP variants are built off the request path"""
+    update_fields = kwargs.get('update_fields')
+    if update_fields and 'image' not in update_fields:
+        return
+    schedule_derivatives(instance.image.name)
+
+
+@receiver(post_delete, sender=ProductImage)
+def delete_image_derivatives(sender, instance, **kwargs):
+    schedule_derivative_cleanup(instance.image.name)
+
+# ==================== PAGE CACHE ====================
+
+@receiver([post_save, post_delete], sender=SiteInfo)
+@receiver([post_save, post_delete], sender=Service)
+@receiver([post_save, post_delete], sender=ProductCategory)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=FAQ)
+@receiver([post_save, post_delete], sender=Testimonial)
+def invalidate_cached_pages(sender, **kwargs):
+    """Retire the cached pages that render the changed model"""
+    if sender is Product and _only_updates(kwargs, ['views_count']):
+        return
+    schedule_page_invalidation(page_tag(sender))
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def invalidate_cached_product_pages(sender, **kwargs):
+    """Product cards show the primary image"""
+    schedule_page_invalidation(page_tag(Product))
+
+# ==================== CONDITIONAL GET ====================
+
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=ProductReview)
+def bump_product_version(sender, instance, **kwargs):
+    """Images and reviews are part of the product page and API ETags"""
+    schedule_product_version_bump(instance.product_id)
+
+# ==================== ANONYMOUS CART ====================
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    """Carry the signed-out cart over to the account"""
+    if request is not None and merge_anonymous_cart(request, user):
+        # bulk_create() sends no post_save
+        schedule_counter_refresh(user.pk, 'cart')
+
+# ==================== SENSOR DEVICES ====================
+
+@receiver([post_save, post_delete], sender=SensorDevice)
+def bump_sensor_device_registry(sender, **kwargs):
+    """Drop resolved device identities cached by every process"""
+    if _only_updates(kwargs, {'last_seen_at', 'offline_alerted_at'}):
+        return
+    schedule_registry_version_bump()
+
+
+@receiver(post_delete, sender=StorageLocation)
+@receiver(post_delete, sender=FruitBatch)
+@receiver(post_delete, sender=Product)
+def bump_sensor_device_registry_on_target_delete(sender, **kwargs):
+    """Deleting what a device measures nulls its FK with an UPDATE that sends no post_save"""
+    schedule_registry_version_bump()
@@ -0,0 +1,177 @@
+# bika/site_context.py - CACHED GLOBAL TEMPLATE CONTEXT
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+
+from .models import SiteInfo, Service, ProductCategory, Product, CustomUser
+
+GLOBAL_CONTEXT_VERSION_KEY = 'bika:global_context:version'
+GLOBAL_CONTEXT_KEY = 'bika:global_context:v{version}'
+
+# Safety net for data we do not watch with signals (e.g. vendor sign-ups via
+# bulk updates). Signal invalidation is what keeps the snapshot fresh.
+DEFAULT_GLOBAL_CONTEXT_TIMEOUT = 60 * 60
+# A snapshot built with fallbacks for failed queries is only kept this long,
+# so a transient database error does not serve defaults for the full hour
+DEFAULT_GLOBAL_CONTEXT_RETRY_TIMEOUT = 30
+
+DEFAULT_SITE_INFO = {
+    'name': "Bika",
+    'tagline': "AI-Powered Fruit Quality Monitoring & E-commerce Platform",
+    'description': "Your Success Is Our Business - Bika provides exceptional services to help your business grow.",
+    'email': "contact@bika.com",
+    'phone': "+255 123 456 789",
+    'address': "Dar es Salaam, Tanzania",
+    'facebook_url': "https://facebook.com/bika",
+    'twitter_url': "https://twitter.com/bika",
+    'instagram_url': "https://instagram.com/bika",
+    'linkedin_url': "https://linkedin.com/company/bika",
+}
+
+DEFAULT_META_DESCRIPTION = (
+    "Bika is an AI-powered platform for fruit quality monitoring and e-commerce. "
+    "We help businesses optimize storage, predict quality, and increase sales."
+)
+DEFAULT_META_TITLE = "Bika - AI-Powered Fruit Quality Monitoring & E-commerce Platform"
+
+# Keys produced by build_global_context()
+GLOBAL_CONTEXT_KEYS = (
+    'site_info', 'site_name', 'site_email', 'site_phone', 'site_address',
+    'featured_services', 'product_categories', 'featured_products_header',
+    'total_products', 'total_categories', 'total_vendors',
+    'meta_description', 'meta_title',
+    'social_facebook', 'social_twitter', 'social_instagram', 'social_linkedin',
+)
+
+
+def get_global_context_version():
+    """Current version of the global context snapshot"""
+    version = cache.get(GLOBAL_CONTEXT_VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(GLOBAL_CONTEXT_VERSION_KEY, version, None)
+    return version
+
+
+def invalidate_global_context():
+    """Bump the snapshot version so the next render rebuilds it"""
+    try:
+        cache.incr(GLOBAL_CONTEXT_VERSION_KEY)
+    except ValueError:
+        # Key missing (cold cache or evicted) - start a fresh version line
+        cache.set(GLOBAL_CONTEXT_VERSION_KEY, 2, None)
+
+
+def schedule_global_context_invalidation():
+    """Invalidate once the current transaction commits"""
+    transaction.on_commit(invalidate_global_context)
+
+
+def get_global_context():
+    """Return the cached global context, building it on a miss"""
+    key = GLOBAL_CONTEXT_KEY.format(version=get_global_context_version())
+    context = cache.get(key)
+    if context is None:
+        context, complete = _build_global_context()
+        if complete:
+            timeout = settings.BIKA_SETTINGS.get(
+                'GLOBAL_CONTEXT_TIMEOUT', DEFAULT_GLOBAL_CONTEXT_TIMEOUT
+            )
+        else:
+            timeout = settings.BIKA_SETTINGS.get(
+                'GLOBAL_CONTEXT_RETRY_TIMEOUT', DEFAULT_GLOBAL_CONTEXT_RETRY_TIMEOUT
+            )
+        cache.set(key, context, timeout)
+    return context
+
+
+def get_site_info():
+    """Cached SiteInfo instance (or None if the database is not ready)"""
+    return get_global_context()['site_info']
+
+
+def build_global_context():
+    """Query everything that is shared by all visitors"""
+    return _build_global_context()[0]
+
+
+def _build_global_context():
+    """(context, complete) - complete is False when a section fell back to defaults"""
+    context = {}
+    complete = True
+
+    # 1. Site Information
+    try:
+        site_info_obj = SiteInfo.objects.first()
+        if not site_info_obj:
+            # Create default site info if it doesn't exist
+            site_info_obj = SiteInfo.objects.create(**DEFAULT_SITE_INFO)
+        context['site_info'] = site_info_obj
+        context['site_name'] = site_info_obj.name
+        context['site_email'] = site_info_obj.email
+        context['site_phone'] = site_info_obj.phone
+        context['site_address'] = site_info_obj.address
+    except DatabaseError:
+        # Database not ready (tables not created yet)
+        complete = False
+        site_info_obj = None
+        context['site_info'] = None
+        context['site_name'] = DEFAULT_SITE_INFO['name']
+        context['site_email'] = DEFAULT_SITE_INFO['email']
+        context['site_phone'] = DEFAULT_SITE_INFO['phone']
+        context['site_address'] = DEFAULT_SITE_INFO['address']
+
+    # 2. Featured Services (for navigation dropdown)
+    try:
+        context['featured_services'] = list(Service.objects.filter(
+            is_active=True
+        ).order_by('display_order')[:6])
+    except DatabaseError:
+        complete = False
+        context['featured_services'] = []
+
+    # 3. Product Categories (for navigation)
+    try:
+        context['product_categories'] = list(ProductCategory.objects.filter(
+            is_active=True,
+            parent__isnull=True  # Only top-level categories
+        ).order_by('display_order')[:8])
+    except DatabaseError:
+        complete = False
+        context['product_categories'] = []
+
+    # 4. Featured Products (for mini display in header)
+    try:
+        context['featured_products_header'] = list(Product.objects.filter(
+            status='active',
+            is_featured=True
+        ).select_related('category', 'vendor')[:3])
+    except DatabaseError:
+        complete = False
+        context['featured_products_header'] = []
+
+    # 5. Site Statistics (for footer)
+    try:
+        context['total_products'] = Product.objects.filter(status='active').count()
+        context['total_categories'] = ProductCategory.objects.filter(is_active=True).count()
+        context['total_vendors'] = CustomUser.objects.filter(
+            user_type='vendor',
+            is_active=True
+        ).count()
+    except DatabaseError:
+        complete = False
+        context['total_products'] = 0
+        context['total_categories'] = 0
+        context['total_vendors'] = 0
+
+    # 6. Meta Information
+    context['meta_description'] = getattr(site_info_obj, 'meta_description', DEFAULT_META_DESCRIPTION)
+    context['meta_title'] = getattr(site_info_obj, 'meta_title', DEFAULT_META_TITLE)
+
+    # 7. Social Media URLs
+    context['social_facebook'] = getattr(site_info_obj, 'facebook_url', '')
+    context['social_twitter'] = getattr(site_info_obj, 'twitter_url', '')
+    context['social_instagram'] = getattr(site_info_obj, 'instagram_url', '')
+    context['social_linkedin'] = getattr(site_info_obj, 'linkedin_url', '')
+
+    return context, complete
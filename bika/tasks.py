@@ -0,0 +1,260 @@
+# bika/tasks.py - DURABLE BACKGROUND TASKS
+import logging
+import random
+import socket
+import threading
+import traceback
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+# Tasks are rows in the database, so they are written in the same
+# transaction as the data they are about and survive restarts without
+# a broker. Views enqueue them; `manage.py run_tasks` runs them.
+DEFAULT_TASK_MAX_ATTEMPTS = 5
+DEFAULT_TASK_VISIBILITY_TIMEOUT = 60 * 5
+DEFAULT_TASK_RETRY_BACKOFF = 30
+MAX_TASK_RETRY_DELAY = 60 * 60
+
+TASKS = {}
+
+
+def _setting(name, default):
+    return settings.BIKA_SETTINGS.get(name, default)
+
+# ==================== REGISTRY ====================
+
+def task(func=None, *, name=None, max_attempts=None):
+    """Register a function as a task: @task or @task(name=..., max_attempts=...)
+
+    Its arguments must be JSON serializable - pass ids, not model instances.
+    """
+    def register(func):
+        func.task_name = name or func.__name__
+        func.max_attempts = max_attempts
+        TASKS[func.task_name] = func
+        return func
+    return register(func) if func is not None else register
+
+
+def enqueue(func, *args, run_at=None, **kwargs):
+    """Queue a registered task, returning its Task row
+
+    The row is part of the caller's transaction: a rolled back request
+    leaves no task behind, and a committed one cannot lose it.
+    """
+    name = getattr(func, 'task_name', func)
+    if name not in TASKS:
+        raise KeyError(f'Unknown task: {name}')
+    return Task.objects.create(
+        name=name,
+        args=list(args),
+        kwargs=kwargs,
+        run_at=run_at or timezone.now(),
+        max_attempts=TASKS[name].max_attempts or _setting('TASK_MAX_ATTEMPTS', DEFAULT_TASK_MAX_ATTEMPTS),
+    )
+
+# ==================== WORKER ====================
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter after the given number of attempts"""
+    delay = _setting('TASK_RETRY_BACKOFF', DEFAULT_TASK_RETRY_BACKOFF) * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, MAX_TASK_RETRY_DELAY) * random.uniform(0.8, 1.2))
+
+
+def claim_tasks(worker_id, limit):
+    """Claim up to `limit` due tasks for the worker
+
+    A claim hides the task for TASK_VISIBILITY_TIMEOUT seconds by moving
+    its run_at forward, with one conditional UPDATE, so concurrent workers
+    never run the same task and a crashed worker's tasks come back; while
+    the task runs, run_task() keeps moving it forward. Each claim counts
+    as an attempt: a task that came back after its last one (it crashed
+    or hung its worker every time) is failed, not reclaimed.
+    """
+    now = timezone.now()
+    Task.objects.filter(status='queued', run_at__lte=now, attempts__gte=F('max_attempts')).update(
+        status='failed', claimed_by='', finished_at=now,
+        last_error='Its worker stopped renewing the claim on every attempt',
+    )
+    due = list(Task.objects.filter(status='queued', run_at__lte=now).order_by(
+        'run_at'
+    ).values_list('pk', flat=True)[:limit])
+    if not due:
+        return []
+    claim = f'{worker_id}:{uuid.uuid4().hex[:12]}'
+    timeout = _setting('TASK_VISIBILITY_TIMEOUT', DEFAULT_TASK_VISIBILITY_TIMEOUT)
+    Task.objects.filter(pk__in=due, status='queued', run_at__lte=now).update(
+        claimed_by=claim,
+        run_at=now + timedelta(seconds=timeout),
+        attempts=F('attempts') + 1,
+    )
+    return list(Task.objects.filter(claimed_by=claim))
+
+
+def _renew_claim(owned, timeout, stop):
+    try:
+        while not stop.wait(timeout / 3):
+            if not owned.update(run_at=timezone.now() + timedelta(seconds=timeout)):
+                break  # Claim lost; the outcome update will find nothing either
+    finally:
+        connection.close()
+
+
+@contextmanager
+def _claim_kept(owned):
+    """Keep the claimed task hidden from other workers while the block runs
+
+    A thread pushes run_at a visibility timeout ahead every third of one,
+    so a task that outlives the timeout (model training) is neither
+    reclaimed by another worker nor failed as hung.
+    """
+    stop = threading.Event()
+    timeout = _setting('TASK_VISIBILITY_TIMEOUT', DEFAULT_TASK_VISIBILITY_TIMEOUT)
+    renewer = threading.Thread(target=_renew_claim, args=(owned, timeout, stop), daemon=True)
+    renewer.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        renewer.join()
+
+
+def run_task(task_row):
+    """Run a claimed task and record the outcome, returning True on success"""
+    owned = Task.objects.filter(pk=task_row.pk, claimed_by=task_row.claimed_by)
+    func = TASKS.get(task_row.name)
+    try:
+        if func is None:
+            raise KeyError(f'Unknown task: {task_row.name}')
+        with _claim_kept(owned):
+            func(*task_row.args, **task_row.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Task %s #%s failed (attempt %s)', task_row.name, task_row.pk, task_row.attempts)
+        if func is None or task_row.attempts >= task_row.max_attempts:
+            owned.update(status='failed', last_error=error, claimed_by='', finished_at=timezone.now())
+        else:
+            owned.update(
+                run_at=timezone.now() + retry_delay(task_row.attempts), last_error=error, claimed_by=''
+            )
+        return False
+    owned.update(status='done', claimed_by='', finished_at=timezone.now())
+    return True
+
+
+def run_due_tasks(worker_id=None, limit=100, executor=None):
+    """Claim and run one batch of due tasks, returning how many were run
+
+    With an executor (a thread pool) the batch runs concurrently; each
+    thread uses its own database connection.
+    """
+    worker_id = worker_id or f'{socket.gethostname()}:{threading.get_ident()}'
+    claimed = claim_tasks(worker_id, limit)
+    if executor is None:
+        for task_row in claimed:
+            run_task(task_row)
+    else:
+        list(executor.map(_run_in_thread, claimed))
+    return len(claimed)
+
+
+def _run_in_thread(task_row):
+    close_old_connections()
+    try:
+        return run_task(task_row)
+    finally:
+        close_old_connections()
+
+
+def purge_finished_tasks(days=7):
+    """Delete tasks that succeeded more than `days` ago; failed ones are kept"""
+    return Task.objects.filter(
+        status='done', finished_at__lt=timezone.now() - timedelta(days=days)
+    ).delete()[0]
+
+# ==================== TASKS ====================
+
+@task
+def send_contact_email(contact_message_id):
+    """Email the site inbox about a contact form message"""
+    from django.core.mail import send_mail
+    from .models import ContactMessage
+
+    contact_message = ContactMessage.objects.filter(pk=contact_message_id).first()
+    if contact_message is None:
+        return
+    send_mail(
+        f'New Contact Message: {contact_message.subject}',
+        f'''
+        Name: {contact_message.name}
+        Email: {contact_message.email}
+        Phone: {contact_message.phone}
+
+        Message:
+        {contact_message.message}
+        ''',
+        settings.DEFAULT_FROM_EMAIL,
+        [settings.DEFAULT_FROM_EMAIL],
+    )
+
+
+@task
+def notify_product_alert(alert_id):
+    """Fan a product alert out to admins, its vendor and store managers"""
+    from .models import ProductAlert
+    from .notification import send_alert_notifications
+
+    alert = ProductAlert.objects.select_related('product__vendor').filter(pk=alert_id).first()
+    if alert is not None:
+        send_alert_notifications(alert)
+
+
+@task
+def process_payment_webhook(event_id):
+    """Apply a recorded payment webhook (see bika/payment_webhooks.py)"""
+    from .models import PaymentWebhookEvent
+    from .payment_webhooks import apply_webhook_event
+
+    event = PaymentWebhookEvent.objects.filter(pk=event_id).first()
+    if event is not None:
+        apply_webhook_event(event)
+
+
+@task(max_attempts=1)
+def train_fruit_model(dataset_name, model_type, user_id):
+    """Train the fruit quality model on an uploaded dataset and tell the user
+
+    Not retried: training is slow, and fails the same way on the same file.
+    """
+    from django.core.files.storage import default_storage
+    from .models import Notification
+    from .views import fruit_ai_service
+
+    try:
+        with default_storage.open(dataset_name) as dataset:
+            result = fruit_ai_service.train_fruit_quality_model(dataset, model_type)
+    except Exception as e:
+        result = {'success': False, 'error': str(e)}
+    finally:
+        default_storage.delete(dataset_name)
+
+    if result.get('success'):
+        title, message = 'Model training finished', result.get('message', 'Training complete')
+    else:
+        title, message = 'Model training failed', result.get('error', 'Training failed')
+    Notification.objects.create(
+        user_id=user_id,
+        title=title,
+        message=f'{model_type}: {message}',
+        notification_type='system_alert',
+    )
@@ -0,0 +1,24 @@
+from django import template
+from django.utils.html import format_html
+
+from bika.thumbnails import derivative_url, fallback_format
+
+register = template.Library()
+
+@register.simple_tag
+def product_picture(image, size='card', alt='', css_class=''):
+    """<picture> for a ProductImage: WebP derivative, then the JPEG/PNG
+    derivative, then the original upload while derivatives are pending"""
+    if not image or not image.image:
+        return ''
+    name = image.image.name
+    fallback = derivative_url(image, size, fallback_format(name)) or image.image.url
+    webp = derivative_url(image, size, 'webp')
+    alt = alt or image.alt_text
+    if webp:
+        return format_html(
+            '<picture><source srcset="{}" type="image/webp">'
+            '<img src="{}" alt="{}" class="{}" loading="lazy"></picture>',
+            webp, fallback, alt, css_class
+        )
+    return format_html('<img src="{}" alt="{}" class="{}" loading="lazy">', fallback, alt, css_class)
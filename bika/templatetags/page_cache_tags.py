@@ -0,0 +1,20 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from bika.page_cache import HOLE_MARKER, render_page_hole
+
+register = template.Library()
+
+@register.simple_tag(takes_context=True)
+def page_hole(context, name):
+    """Per-visitor fragment (see PAGE_HOLES in bika/page_cache.py)
+
+    Pages rendered for the shared page cache get a marker that is filled in
+    on every response; other pages render the fragment directly.
+    """
+    request = context.get('request')
+    if request is None:
+        return ''
+    if getattr(request, '_bika_page_cache', False):
+        return mark_safe(HOLE_MARKER.format(name=name))
+    return mark_safe(render_page_hole(name, request))
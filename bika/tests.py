@@ -1,3 +1,1643 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+
+from django.core import mail
+from django.core.cache import cache
+from django.http import QueryDict
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.files.storage import default_storage
+from django.template import Context, Template
+from django.db import DatabaseError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    CustomUser, ProductCategory, Product, ProductImage, ProductReview, Cart, Service, SiteInfo, FAQ,
+    Order, OrderItem, HeldStock, StockHold, Task, ProductAlert, Notification, Payment, PaymentGatewaySettings,
+    PaymentWebhookEvent, FruitType, FruitBatch, StorageLocation, RealTimeSensorData, SensorDevice
+)
+from .query_budget import QueryBudgetTestMixin, QueryRecorder, fingerprint
+from .search import search_products, build_match_query
+from .autocomplete import AutocompleteIndex, suggest
+from .pagination import CursorPaginator, PRODUCT_SORTS
+from .facets import parse_filters, get_facets
+from .thumbnails import generate_derivatives, derivative_name
+from .view_counter import count_product_view, flush_view_counts, pending_view_counts
+from .page_cache import CSRF_PLACEHOLDER, get_tag_versions
+from .recommendations import co_purchase_neighbours
+from .cart_pricing import cart_totals
+from .user_counters import get_user_counters
+from .site_context import get_global_context
+from .checks import check_shared_cache
+from .orders import OrderError, decrement_stock, place_order
+from .reservations import get_held_stock, hold_stock, sweep_expired_holds
+from .gateway_transport import GatewayUnavailable, get_transport
+from .payment_gateways import MpesaGateway
+from .payment_reconciliation import query_statuses, reconcile_pending_payments
+from .sensor_devices import (
+    clear_device_cache, flush_heartbeats, pending_heartbeats, resolve_device, sweep_offline_devices
+)
+from .sensor_ingest import ingest_readings
+from .tasks import TASKS, claim_tasks, enqueue, notify_product_alert, run_due_tasks, run_task, task
+
+
+def seed_catalog(products=30):
+    """Catalog large enough that per-row queries show up in the counts"""
+    vendor = CustomUser.objects.create_user(
+        'vendor', 'vendor@example.com', 'password', user_type='vendor'
+    )
+    customer = CustomUser.objects.create_user(
+        'customer', 'customer@example.com', 'password', user_type='customer'
+    )
+    categories = [
+        ProductCategory.objects.create(name=f'Category {i}', slug=f'category-{i}')
+        for i in range(4)
+    ]
+    for i in range(products):
+        product = Product.objects.create(
+            name=f'Fresh Mango {i}', slug=f'mango-{i}', sku=f'SKU-{i}', barcode=f'BC-{i}',
+            description='Sweet and juicy', category=categories[i % 4],
+            price=Decimal('1000') + i, stock_quantity=50, status='active',
+            is_featured=i < 8, vendor=vendor, brand=['Acme', 'Zed'][i % 2],
+            tags='mango,tropical',
+        )
+        ProductImage.objects.create(product=product, image=f'products/mango-{i}.jpg', is_primary=True)
+        if i < 5:
+            Cart.objects.create(user=customer, product=product, quantity=2)
+    Service.objects.create(name='Cold Storage', slug='cold-storage', description='Storage', icon='box')
+    SiteInfo.objects.create(name='Bika')
+    return vendor, customer
+
+
+class GlobalContextTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(BIKA_SETTINGS={**settings.BIKA_SETTINGS, 'GLOBAL_CONTEXT_RETRY_TIMEOUT': 0})
+    def test_fallback_snapshot_is_not_kept(self):
+        Service.objects.create(name='Cold Storage', slug='cold-storage', description='Storage', icon='box')
+        with mock.patch.object(Service.objects, 'filter', side_effect=DatabaseError('gone away')):
+            self.assertEqual(get_global_context()['featured_services'], [])
+        self.assertEqual(len(get_global_context()['featured_services']), 1)
+
+
+class SharedCacheCheckTests(TestCase):
+
+    def test_process_local_cache_fails_the_deploy_check(self):
+        self.assertEqual([e.id for e in check_shared_cache(None)], ['bika.E001'])
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'bika_cache'}}
+        with self.settings(CACHES=shared):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_workers_warn_about_a_process_local_cache(self):
+        stderr = StringIO()
+        call_command('run_tasks', '--once', stdout=StringIO(), stderr=stderr)
+        self.assertIn('local to this process', stderr.getvalue())
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'bika_cache'}}
+        with self.settings(CACHES=shared):
+            stderr = StringIO()
+            call_command('sweep_sensor_devices', stdout=StringIO(), stderr=stderr)
+        self.assertEqual(stderr.getvalue(), '')
+
+
+class UserCounterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.customer = seed_catalog(products=1)
+        cls.admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def run_action(self, model, action, pks, filters):
+        url = reverse(f'admin:bika_{model}_changelist')
+        # From a changelist filtered on the field the action changes
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f'{url}?{filters}', {'action': action, '_selected_action': pks}, follow=True)
+
+    def test_admin_actions_refresh_counters_of_filtered_rows(self):
+        order = Order.objects.create(
+            user=self.customer, total_amount=Decimal('1000'), shipping_address='Dar', billing_address='Dar'
+        )
+        alert = ProductAlert.objects.create(
+            product=Product.objects.get(), alert_type='stock_low', severity='low', message='Low', detected_by='system'
+        )
+        notification = Notification.objects.create(
+            user=self.customer, title='Hi', message='Hi', notification_type='system_alert'
+        )
+        counters = get_user_counters(self.customer)
+        self.assertEqual((counters['pending_orders'], counters['unread_notifications_count']), (1, 1))
+        self.assertEqual(get_user_counters(self.vendor)['unresolved_alerts'], 1)
+
+        response = self.run_action('order', 'confirm_orders', [order.pk], 'status__exact=pending')
+        self.assertContains(response, '1 orders confirmed.')
+        self.run_action('productalert', 'mark_resolved', [alert.pk], 'is_resolved__exact=0')
+        self.run_action('notification', 'mark_read', [notification.pk], 'is_read__exact=0')
+        counters = get_user_counters(self.customer)
+        self.assertEqual((counters['pending_orders'], counters['unread_notifications_count']), (0, 0))
+        self.assertEqual(get_user_counters(self.vendor)['unresolved_alerts'], 0)
+
+
+class QueryFingerprintTests(TestCase):
+
+    def test_literals_are_normalized(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM "bika_product" WHERE "id" = 12 AND "name" = \'x\''),
+            fingerprint('SELECT * FROM "bika_product" WHERE "id" = 7 AND "name" = \'y\''),
+        )
+
+    def test_in_lists_collapse(self):
+        self.assertEqual(
+            fingerprint('SELECT 1 WHERE "id" IN (%s, %s, %s)'),
+            'SELECT ? WHERE "id" IN (...)',
+        )
+
+    def test_recorder_counts_duplicates(self):
+        recorder = QueryRecorder()
+        with recorder.record():
+            for _ in range(3):
+                list(Product.objects.filter(pk=1))
+        self.assertEqual(recorder.count, 3)
+        self.assertEqual(recorder.duplicates()[0]['count'], 3)
+
+
+class ProductSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.customer = seed_catalog(products=3)
+        category = ProductCategory.objects.get(slug='category-0')
+        cls.pineapple = Product.objects.create(
+            name='Golden Pineapple', slug='golden-pineapple', sku='PINE-1',
+            description='Sweet', category=category, price=Decimal('2500'),
+            status='active', vendor=cls.vendor,
+        )
+        cls.kiwi = Product.objects.create(
+            name='Kiwi', slug='kiwi', sku='KIWI-1', description='Hints of pineapple',
+            category=category, price=Decimal('1500'), status='active', vendor=cls.vendor,
+        )
+
+    def search(self, query):
+        products, _ = search_products(Product.objects.filter(status='active'), query)
+        return list(products.order_by('search_rank').values_list('name', flat=True))
+
+    def test_match_query_quotes_terms(self):
+        self.assertEqual(build_match_query('Mango AND "juicy*'), '"mango"* "and"* "juicy"*')
+
+    def test_prefix_match_ranks_name_above_description(self):
+        self.assertEqual(self.search('pinea'), ['Golden Pineapple', 'Kiwi'])
+
+    def test_index_follows_product_changes(self):
+        self.kiwi.name = 'Kiwi Passion'
+        self.kiwi.save()
+        self.assertEqual(self.search('passion'), ['Kiwi Passion'])
+
+        self.pineapple.delete()
+        self.assertEqual(self.search('pineapple'), ['Kiwi Passion'])
+
+    def test_category_rename_is_indexed(self):
+        category = self.pineapple.category
+        category.name = 'Tropical Imports'
+        category.save()
+        self.assertIn('Golden Pineapple', self.search('imports'))
+
+
+class AutocompleteIndexTests(TestCase):
+
+    def setUp(self):
+        self.index = AutocompleteIndex()
+        self.index.add_product(1, 'Fresh Mango', 'fresh-mango', 'Acme', 'tropical,sweet')
+        self.index.add_product(2, 'Mango Juice', 'mango-juice', 'Acme', 'drinks')
+        self.index.add_category(1, 'Tropical Fruits', 'tropical-fruits')
+
+    def texts(self, query):
+        entries, _ = self.index.search(query)
+        return [entry['text'] for entry in entries]
+
+    def test_prefix_matches_any_word_start(self):
+        self.assertEqual(self.texts('man'), ['Mango Juice', 'Fresh Mango'])
+
+    def test_categories_rank_before_tags(self):
+        self.assertEqual(self.texts('trop'), ['Tropical Fruits', 'tropical'])
+
+    def test_typo_is_corrected(self):
+        entries, corrected = self.index.search('mangi')
+        self.assertEqual(corrected, 'mango')
+        self.assertIn('Fresh Mango', [entry['text'] for entry in entries])
+
+    def test_shared_terms_are_reference_counted(self):
+        self.index.remove_product(1)
+        self.assertEqual(self.texts('acme'), ['Acme'])
+        self.index.remove_product(2)
+        self.assertEqual(self.texts('acme'), [])
+
+
+class AutocompleteSyncTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.customer = seed_catalog(products=3)
+
+    def setUp(self):
+        cache.clear()
+
+    def texts(self, query):
+        return [item['text'] for item in suggest(query)['suggestions']]
+
+    def test_product_changes_reach_the_index(self):
+        self.assertEqual(self.texts('fresh'), ['Fresh Mango 0', 'Fresh Mango 1', 'Fresh Mango 2'])
+
+        product = Product.objects.get(slug='mango-1')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = 'Papaya'
+            product.save()
+        self.assertEqual(self.texts('papa'), ['Papaya'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertEqual(self.texts('papa'), [])
+
+
+class CursorPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.customer = seed_catalog()
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, ordering, per_page=7):
+        paginator = CursorPaginator(Product.objects.all(), ordering, per_page)
+        page = paginator.get_page()
+        pages = [page]
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            pages.append(page)
+        return paginator, pages
+
+    def test_cursors_visit_every_product_once_in_order(self):
+        for sort_by, ordering in PRODUCT_SORTS.items():
+            with self.subTest(sort_by=sort_by):
+                _, pages = self.walk(ordering)
+                seen = [product.pk for page in pages for product in page]
+                expected = list(
+                    Product.objects.order_by(*ordering).values_list('pk', flat=True)
+                )
+                self.assertEqual(seen, expected)
+
+    def test_previous_cursor_returns_previous_page(self):
+        paginator, pages = self.walk(PRODUCT_SORTS['price_low'])
+        self.assertFalse(pages[0].has_previous())
+        back = paginator.get_page(pages[2].previous_cursor)
+        self.assertEqual(list(back), list(pages[1]))
+        self.assertTrue(back.has_previous())
+        self.assertTrue(back.has_next())
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        paginator, pages = self.walk(PRODUCT_SORTS['name'])
+        other = CursorPaginator(Product.objects.all(), PRODUCT_SORTS['price_low'], 7)
+        for cursor in ['garbage', pages[1].next_cursor]:
+            with self.subTest(cursor=cursor):
+                page = other.get_page(cursor)
+                self.assertFalse(page.has_previous())
+
+    def test_listing_follows_next_cursor(self):
+        response = self.client.get(reverse('bika:product_list'), {'sort': 'price_low'})
+        first = response.context['products']
+        self.assertEqual(response.context['total_products'], 30)
+        response = self.client.get(
+            reverse('bika:product_list'), {'sort': 'price_low', 'cursor': first.next_cursor}
+        )
+        self.assertEqual(response.context['products'][0].name, 'Fresh Mango 12')
+
+    def test_page_links_still_work(self):
+        response = self.client.get(reverse('bika:product_list'), {'sort': 'price_low', 'page': 2})
+        self.assertEqual(response.context['products'].number, 2)
+        self.assertEqual(response.context['products'][0].name, 'Fresh Mango 12')
+
+
+class FacetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.customer = seed_catalog(products=8)
+        parent = ProductCategory.objects.get(slug='category-1')
+        child = ProductCategory.objects.create(name='Sub', slug='sub', parent=parent)
+        Product.objects.create(
+            name='Used Papaya', slug='papaya', sku='SKU-P', description='Ripe', category=child,
+            price=Decimal('25000'), status='active', vendor=cls.vendor, brand='Zed',
+            condition='used_good',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def facets(self, query=''):
+        return get_facets(parse_filters(QueryDict(query)))
+
+    def counts(self, items, key='value'):
+        return {item[key]: item['count'] for item in items}
+
+    def test_counts_for_unfiltered_listing(self):
+        facets = self.facets()
+        self.assertEqual(facets['total'], 9)
+        self.assertEqual(self.counts(facets['brands']), {'Zed': 5, 'Acme': 4})
+        self.assertEqual(self.counts(facets['conditions']), {'new': 8, 'used_good': 1})
+        self.assertEqual(self.counts(facets['price_buckets'])['20k-100k'], 1)
+
+    def test_subcategories_roll_up(self):
+        categories = {category['slug']: category['product_count'] for category in self.facets()['categories']}
+        self.assertEqual(categories, {'category-0': 2, 'category-1': 3, 'category-2': 2, 'category-3': 2})
+
+    def test_facet_ignores_its_own_selection(self):
+        facets = self.facets('brand=Acme')
+        self.assertEqual(facets['total'], 4)
+        self.assertEqual(self.counts(facets['brands']), {'Zed': 5, 'Acme': 4})
+        self.assertEqual(self.counts(facets['conditions']), {'new': 4})
+
+    def test_signature_ignores_parameter_order_and_case(self):
+        self.assertEqual(
+            parse_filters(QueryDict('q=Fresh++Mango&brand=Zed&brand=Acme')),
+            parse_filters(QueryDict('brand=Acme&brand=Zed&q=fresh mango')),
+        )
+
+    def test_one_query_then_cached(self):
+        self.facets()  # category tree
+        with self.assertNumQueries(1):
+            self.facets('condition=new')
+        with self.assertNumQueries(0):
+            self.facets('condition=new')
+
+    def test_catalog_change_refreshes_counts(self):
+        self.assertEqual(self.facets()['total'], 9)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(slug='papaya').get().delete()
+        self.assertEqual(self.facets()['total'], 8)
+
+    def test_listing_applies_facet_filters(self):
+        response = self.client.get(reverse('bika:product_list'), {'condition': 'used_good'})
+        self.assertEqual([product.name for product in response.context['products']], ['Used Papaya'])
+
+
+class ReviewStatsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.customer = seed_catalog(products=2)
+        cls.product = Product.objects.get(slug='mango-0')
+        cls.reviewers = [
+            CustomUser.objects.create_user(f'reviewer{i}', f'r{i}@example.com', 'password')
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def review(self, user, rating, approved=True):
+        return ProductReview.objects.create(
+            product=self.product, user=user, rating=rating, title='t', comment='c',
+            is_approved=approved,
+        )
+
+    def assertStats(self, avg_rating, review_count, histogram):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.avg_rating, Decimal(avg_rating))
+        self.assertEqual(self.product.review_count, review_count)
+        self.assertEqual(self.product.rating_histogram, histogram)
+
+    def test_approved_reviews_are_aggregated(self):
+        self.review(self.reviewers[0], 5)
+        self.review(self.reviewers[1], 4)
+        self.review(self.reviewers[2], 1, approved=False)
+        self.assertStats('4.50', 2, [0, 0, 0, 1, 1])
+
+    def test_delete_and_unapprove_update_stats(self):
+        first = self.review(self.reviewers[0], 5)
+        second = self.review(self.reviewers[1], 2)
+        first.delete()
+        self.assertStats('2.00', 1, [0, 1, 0, 0, 0])
+        second.is_approved = False
+        second.save(update_fields=['is_approved'])
+        self.assertStats('0.00', 0, [0, 0, 0, 0, 0])
+
+    def test_admin_actions_update_stats(self):
+        reviews = [self.review(user, 3, approved=False) for user in self.reviewers]
+        admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        url = reverse('admin:bika_productreview_changelist')
+        # From a changelist filtered on the field the action changes
+        self.client.post(f'{url}?is_approved__exact=0', {
+            'action': 'approve_reviews', '_selected_action': [r.pk for r in reviews],
+        })
+        self.assertStats('3.00', 3, [0, 0, 3, 0, 0])
+        self.client.post(f'{url}?is_approved__exact=1', {
+            'action': 'disapprove_reviews', '_selected_action': [reviews[0].pk],
+        })
+        self.assertStats('3.00', 2, [0, 0, 2, 0, 0])
+
+    def test_listing_sorts_and_filters_by_rating(self):
+        self.review(self.reviewers[0], 4)
+        response = self.client.get(reverse('bika:product_list'), {'sort': 'rating'})
+        self.assertEqual(response.context['products'][0], self.product)
+        response = self.client.get(reverse('bika:product_list'), {'rating': '4'})
+        self.assertEqual(list(response.context['products']), [self.product])
+
+
+@override_settings(BIKA_SETTINGS={**settings.BIKA_SETTINGS, 'VIEW_COUNT_FLUSH_INTERVAL': 60})
+class ViewCounterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.customer = seed_catalog(products=2)
+
+    def tearDown(self):
+        flush_view_counts()
+
+    def test_views_are_buffered_then_written_together(self):
+        product = Product.objects.get(slug='mango-0')
+        for _ in range(3):
+            self.client.get(reverse('bika:product_detail', kwargs={'slug': 'mango-0'}))
+        count_product_view(Product.objects.get(slug='mango-1').pk)
+
+        product.refresh_from_db()
+        self.assertEqual(product.views_count, 0)
+        self.assertEqual(pending_view_counts()[product.pk], 3)
+
+        # One UPDATE per distinct increment, inside one transaction
+        with self.assertNumQueries(4):
+            self.assertEqual(flush_view_counts(), 4)
+        updated_at = product.updated_at
+        product.refresh_from_db()
+        self.assertEqual(product.views_count, 3)
+        self.assertEqual(product.updated_at, updated_at)
+        self.assertEqual(pending_view_counts(), {})
+
+    def test_zero_interval_writes_through(self):
+        product = Product.objects.get(slug='mango-0')
+        with self.settings(BIKA_SETTINGS={**settings.BIKA_SETTINGS, 'VIEW_COUNT_FLUSH_INTERVAL': 0}):
+            count_product_view(product.pk)
+        product.refresh_from_db()
+        self.assertEqual(product.views_count, 1)
+
+
+class PrimaryImageTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.customer = seed_catalog(products=1)
+        cls.product = Product.objects.get(slug='mango-0')
+
+    def primary(self):
+        self.product.refresh_from_db()
+        return self.product.primary_image
+
+    def add_image(self, name, **kwargs):
+        return ProductImage.objects.create(product=self.product, image=f'products/{name}.jpg', **kwargs)
+
+    def test_pointer_follows_the_flagged_image(self):
+        first = self.primary()
+        second = self.add_image('second', is_primary=True)
+        self.assertEqual(self.primary(), second)
+        first.refresh_from_db()
+        self.assertFalse(first.is_primary)
+
+    def test_delete_falls_back_to_first_image(self):
+        first = self.primary()
+        later = self.add_image('later', display_order=5)
+        early = self.add_image('early', display_order=1)
+        first.delete()
+        self.assertEqual(self.primary(), early)
+        early.delete()
+        later.delete()
+        self.assertIsNone(self.primary())
+
+    def test_bulk_delete_keeps_a_remaining_image(self):
+        first = self.primary()
+        later = self.add_image('later', display_order=5)
+        ProductImage.objects.filter(pk=first.pk).delete()
+        self.assertEqual(self.primary(), later)
+
+    def test_cards_render_in_one_query(self):
+        with self.assertNumQueries(1):
+            urls = [product.primary_image.image.url for product in Product.objects.cards()]
+        self.assertEqual(urls, ['/media/products/mango-0.jpg'])
+
+
+class ThumbnailTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.enterContext(self.settings(MEDIA_ROOT=self.media_root))
+
+        buffer = BytesIO()
+        Image.new('RGB', (1600, 900), 'orange').save(buffer, 'JPEG')
+        self.name = default_storage.save('products/mango.jpg', ContentFile(buffer.getvalue()))
+
+    def test_sizes_and_formats_are_written_next_to_the_original(self):
+        self.assertEqual(generate_derivatives(self.name), 6)
+        with default_storage.open(derivative_name(self.name, 'card', 'webp')) as f:
+            self.assertEqual(Image.open(f).size, (400, 400))
+        with default_storage.open(derivative_name(self.name, 'large', 'jpg')) as f:
+            self.assertEqual(Image.open(f).size, (1200, 675))
+        # Already cached
+        self.assertEqual(generate_derivatives(self.name), 0)
+
+    def test_picture_tag_prefers_webp_and_falls_back_to_original(self):
+        seed_catalog(products=1)
+        image = ProductImage.objects.create(product=Product.objects.get(), image=self.name, alt_text='Mango')
+        template = Template("{% load image_tags %}{% product_picture image 'card' %}")
+        html = template.render(Context({'image': image}))
+        self.assertIn('/media/products/mango.jpg', html)
+        self.assertNotIn('webp', html)
+
+        generate_derivatives(self.name)
+        image.refresh_from_db()
+        with mock.patch.object(default_storage, 'exists') as exists:
+            html = template.render(Context({'image': image}))
+        exists.assert_not_called()
+        self.assertIn('srcset="/media/products/mango.jpg.card.webp"', html)
+        self.assertIn('src="/media/products/mango.jpg.card.jpg"', html)
+
+    def test_sources_with_the_same_stem_keep_their_own_derivatives(self):
+        buffer = BytesIO()
+        Image.new('RGBA', (300, 300), (0, 0, 0, 0)).save(buffer, 'PNG')
+        png = default_storage.save('products/mango.png', ContentFile(buffer.getvalue()))
+        generate_derivatives(self.name)
+        self.assertEqual(generate_derivatives(png), 6)
+        with default_storage.open(derivative_name(self.name, 'card', 'webp')) as f:
+            self.assertEqual(Image.open(f).mode, 'RGB')
+
+    def test_deleted_images_take_their_derivatives_along(self):
+        seed_catalog(products=1)
+        image = ProductImage.objects.create(product=Product.objects.get(), image=self.name)
+        generate_derivatives(self.name)
+        with self.captureOnCommitCallbacks() as callbacks:
+            image.delete()
+        with mock.patch('bika.thumbnails._executor.submit', side_effect=lambda func, name: func(name)), \
+                mock.patch('bika.thumbnails.connection'):
+            for callback in callbacks:
+                callback()
+        self.assertFalse(default_storage.exists(derivative_name(self.name, 'card', 'webp')))
+
+    def test_backfill_command_uses_worker_processes(self):
+        seed_catalog(products=1)
+        ProductImage.objects.create(product=Product.objects.get(), image=self.name)
+        ProductImage.objects.filter(image='products/mango-0.jpg').delete()
+        out = StringIO()
+        call_command('generate_thumbnails', workers=2, stdout=out)
+        self.assertIn('Wrote 6 derivatives for 1 images (0 failed)', out.getvalue())
+        self.assertTrue(default_storage.exists(derivative_name(self.name, 'thumb', 'webp')))
+
+
+class PageCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.customer = seed_catalog(products=3)
+        FAQ.objects.create(question='Do you deliver?', answer='Yes')
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url_name, **kwargs):
+        return self.client.get(reverse(f'bika:{url_name}'), **kwargs)
+
+    def test_anonymous_pages_are_served_from_cache(self):
+        first = self.get('product_list')
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            second = self.get('product_list')
+        self.assertEqual(second['X-Page-Cache'], 'hit')
+        self.assertContains(second, 'Fresh Mango 2')
+
+    def test_query_string_is_normalized(self):
+        self.get('product_list', data={'sort': 'name', 'brand': 'Acme'})
+        response = self.client.get(reverse('bika:product_list') + '?brand=Acme&utm_source=x&sort=name')
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        response = self.get('product_list', data={'sort': 'name', 'brand': 'Zed'})
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+
+    def test_ignored_params_do_not_leak_into_the_shared_page(self):
+        response = self.get('product_list', data={'sort': 'name', 'utm_source': 'spring-promo-x1'})
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'sort=name')
+        self.assertNotContains(response, 'spring-promo-x1')
+        self.assertNotContains(self.get('product_list', data={'sort': 'name'}), 'spring-promo-x1')
+
+    def test_saving_a_tagged_model_invalidates_dependent_pages(self):
+        self.get('faq')
+        self.get('product_list')
+        with self.captureOnCommitCallbacks(execute=True):
+            FAQ.objects.create(question='Is it fresh?', answer='Always')
+        self.assertEqual(self.get('faq')['X-Page-Cache'], 'miss')
+        # The product list does not render FAQs
+        self.assertEqual(self.get('product_list')['X-Page-Cache'], 'hit')
+
+        product = Product.objects.get(slug='mango-0')
+        product.name = 'Ripe Mango'
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        response = self.get('product_list')
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Ripe Mango')
+
+    def test_logged_in_users_bypass_the_cache(self):
+        self.get('product_list')
+        self.client.force_login(self.customer)
+        response = self.get('product_list')
+        self.assertFalse(response.has_header('X-Page-Cache'))
+        self.assertContains(response, 'badge rounded-pill bg-danger')
+
+    def test_holes_are_filled_per_visitor(self):
+        self.get('product_list')
+        response = self.get('product_list')
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertNotContains(response, CSRF_PLACEHOLDER)
+        self.assertNotContains(response, '<!--bika:page-hole:')
+        self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+
+
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.customer = seed_catalog(products=2)
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        flush_view_counts()
+
+    def test_barcode_api_answers_304_from_a_narrow_lookup(self):
+        url = reverse('bika:api_product_detail', kwargs={'barcode': 'BC-1'})
+        first = self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_barcode_api_does_not_validate_by_date(self):
+        # A stock decrement does not move updated_at
+        url = reverse('bika:api_product_detail', kwargs={'barcode': 'BC-1'})
+        first = self.client.get(url)
+        self.assertFalse(first.has_header('Last-Modified'))
+        Product.objects.filter(barcode='BC-1').update(stock_quantity=0)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE='Wed, 21 Oct 2099 07:28:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+    def test_bulk_updates_and_review_changes_change_the_etag(self):
+        url = reverse('bika:api_product_detail', kwargs={'barcode': 'BC-1'})
+        etag = self.client.get(url)['ETag']
+        Product.objects.filter(barcode='BC-1').update(stock_quantity=0)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            # Pending review: the aggregates stay the same, the version moves
+            ProductReview.objects.create(
+                product=Product.objects.get(barcode='BC-1'), user=self.customer,
+                rating=5, title='t', comment='c',
+            )
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_product_page_revalidation_still_counts_the_view(self):
+        url = reverse('bika:product_detail', kwargs={'slug': 'mango-1'})
+        self.client.get(url)  # sets the CSRF cookie, which is part of the ETag
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        flush_view_counts()
+        self.assertEqual(Product.objects.get(slug='mango-1').views_count, 3)
+
+        self.client.force_login(self.customer)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class RelatedProductsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.customer = seed_catalog(products=6)
+        cls.products = {p.slug: p for p in Product.objects.all()}
+        for number, (status, slugs) in enumerate([
+            ('delivered', ['mango-0', 'mango-5']),
+            ('pending', ['mango-0', 'mango-5']),
+            ('cancelled', ['mango-1', 'mango-5']),
+        ]):
+            order = Order.objects.create(
+                user=cls.customer, order_number=f'ORD-{number}', total_amount=0, status=status,
+                shipping_address='x', billing_address='x',
+            )
+            for slug in slugs:
+                OrderItem.objects.create(order=order, product=cls.products[slug], quantity=1, price=1)
+
+    def pk(self, slug):
+        return self.products[slug].pk
+
+    def test_neighbours_rank_orders_above_carts_and_skip_cancelled_orders(self):
+        neighbours = co_purchase_neighbours()
+        self.assertEqual(neighbours[self.pk('mango-5')], [self.pk('mango-0')])
+        self.assertEqual(neighbours[self.pk('mango-0')][0], self.pk('mango-5'))
+        self.assertEqual(
+            set(neighbours[self.pk('mango-0')][1:]),
+            {self.pk(f'mango-{i}') for i in range(1, 5)}
+        )
+
+    def test_inactive_products_are_not_suggested(self):
+        Product.objects.filter(slug='mango-5').update(status='draft')
+        self.assertNotIn(self.pk('mango-5'), co_purchase_neighbours()[self.pk('mango-0')])
+
+    def test_detail_page_serves_stored_neighbours_then_category(self):
+        call_command('build_related_products', stdout=StringIO())
+        product = Product.objects.get(slug='mango-5')
+        with self.assertNumQueries(1):
+            self.assertEqual([p.slug for p in product.get_related_products(1)], ['mango-0'])
+
+        response = self.client.get(reverse('bika:product_detail', kwargs={'slug': 'mango-5'}))
+        related = [p.slug for p in response.context['related_products']]
+        self.assertEqual(related[0], 'mango-0')
+        # Topped up from mango-5's category (category-1)
+        self.assertEqual(related[1:], ['mango-1'])
+        flush_view_counts()
+
+    def test_inactive_stored_neighbour_is_replaced_by_the_next_one(self):
+        product = Product.objects.get(slug='mango-0')
+        product.related_product_ids = [self.pk('mango-5'), self.pk('mango-1'), self.pk('mango-2')]
+        product.save(update_fields=['related_product_ids'])
+        Product.objects.filter(slug='mango-5').update(status='draft')
+        self.assertEqual([p.slug for p in product.get_related_products(1)], ['mango-1'])
+
+
+class CartPricingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Five cart lines of 2 x (1000..1004) TZS
+        cls.vendor, cls.customer = seed_catalog(products=5)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_totals_come_from_one_aggregate(self):
+        with self.assertNumQueries(1):
+            totals = cart_totals(self.customer.pk)
+        self.assertEqual((totals.count, totals.quantity), (5, 10))
+        self.assertEqual(totals.subtotal, Decimal('10020.00'))
+        self.assertEqual(totals.tax_amount, Decimal('1803.60'))
+        self.assertEqual(totals.shipping_cost, Decimal('5000.00'))
+        self.assertEqual(totals.total, Decimal('16823.60'))
+
+    def test_shipping_is_free_above_the_threshold(self):
+        with self.settings(BIKA_SETTINGS={**settings.BIKA_SETTINGS, 'FREE_SHIPPING_THRESHOLD': 10000}):
+            self.assertEqual(cart_totals(self.customer.pk).shipping_cost, Decimal('0'))
+        self.assertEqual(cart_totals(self.vendor.pk).shipping_cost, Decimal('0'))
+
+    def test_cart_endpoints_return_shared_totals(self):
+        self.client.force_login(self.customer)
+        product = Product.objects.get(slug='mango-0')
+        response = self.client.post(reverse('bika:update_cart', args=[product.pk]), {'quantity': 3})
+        self.assertEqual(response.json()['subtotal'], '11020.00')
+        self.assertEqual(response.json()['item_total'], '3000.00')
+
+        response = self.client.post(
+            reverse('bika:remove_from_cart', args=[product.pk]),
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertEqual(response.json()['cart_count'], 4)
+        self.assertEqual(response.json()['subtotal'], 8020.0)
+
+
+class AnonymousCartTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.customer = seed_catalog(products=6)
+        cls.products = {p.slug: p for p in Product.objects.all()}
+
+    def setUp(self):
+        cache.clear()
+
+    def add(self, slug, quantity=1):
+        return self.client.post(
+            reverse('bika:add_to_cart', args=[self.products[slug].pk]), {'quantity': quantity},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+
+    def test_signed_out_cart_writes_nothing_to_the_database(self):
+        with self.assertNumQueries(2):  # product lookup, then pricing for the badge
+            response = self.add('mango-5', 2)
+        self.assertEqual(response.json()['cart_count'], 1)
+        self.add('mango-4')
+
+        response = self.client.get(reverse('bika:cart'))
+        self.assertEqual(
+            [(item.product.slug, item.quantity) for item in response.context['cart_items']],
+            [('mango-4', 1), ('mango-5', 2)]
+        )
+        self.assertEqual(response.context['subtotal'], Decimal('3014.00'))
+        self.assertContains(response, 'badge rounded-pill bg-danger">\n    2')
+        self.assertFalse(Cart.objects.exclude(user=self.customer).exists())
+
+    def test_tampered_cookie_is_ignored(self):
+        self.add('mango-5')
+        self.client.cookies['bika_cart'] = '5:99:forged'
+        response = self.client.get(reverse('bika:cart'))
+        self.assertEqual(response.context['cart_items'], [])
+
+    def test_login_merges_into_the_cart_with_one_upsert(self):
+        self.add('mango-0', 3)  # the customer already has 2
+        self.add('mango-5', 1)
+        self.client.post(reverse('bika:login'), {'username': 'customer', 'password': 'password'})
+        quantities = dict(Cart.objects.filter(user=self.customer).values_list('product__slug', 'quantity'))
+        self.assertEqual(quantities['mango-0'], 5)
+        self.assertEqual(quantities['mango-5'], 1)
+        self.assertEqual(self.client.cookies['bika_cart'].value, '')
+
+    def test_merged_quantities_are_capped_at_stock(self):
+        self.add('mango-0', 3)  # the customer already has 2
+        self.add('mango-5', 2)
+        Product.objects.filter(slug='mango-0').update(stock_quantity=4)
+        Product.objects.filter(slug='mango-5').update(stock_quantity=0)
+        self.client.post(reverse('bika:login'), {'username': 'customer', 'password': 'password'})
+        quantities = dict(Cart.objects.filter(user=self.customer).values_list('product__slug', 'quantity'))
+        self.assertEqual(quantities['mango-0'], 4)
+        self.assertNotIn('mango-5', quantities)
+
+
+class PlaceOrderTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # The customer has 2 of each of mango-0..4 (stock 50) in the cart
+        cls.vendor, cls.customer = seed_catalog(products=8)
+
+    def setUp(self):
+        cache.clear()
+
+    def place(self, user=None):
+        return place_order(user or self.customer, 'Dar', 'Dar', 'mpesa', '0700000000')
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        buyer = CustomUser.objects.create_user('buyer', 'b@example.com', 'password')
+        Cart.objects.create(user=buyer, product=Product.objects.get(slug='mango-7'), quantity=1)
+        with CaptureQueriesContext(connection) as small:
+            self.place(buyer)
+        with CaptureQueriesContext(connection) as large:
+            order, payment = self.place()
+        self.assertEqual(len(small), len(large))
+
+        self.assertEqual(order.items.count(), 5)
+        self.assertEqual(order.total_amount, Decimal('16823.60'))
+        self.assertEqual(payment.mobile_money_phone, '0700000000')
+        self.assertEqual(Product.objects.get(slug='mango-0').stock_quantity, 48)
+        self.assertFalse(Cart.objects.filter(user=self.customer).exists())
+
+    def test_cached_pages_are_kept_until_stock_runs_low(self):
+        versions = get_tag_versions(['product'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.place()
+        self.assertEqual(get_tag_versions(['product']), versions)
+
+        buyer = CustomUser.objects.create_user('buyer', 'b@example.com', 'password')
+        mango = Product.objects.get(slug='mango-7')
+        Product.objects.filter(pk=mango.pk).update(stock_quantity=mango.low_stock_threshold + 1)
+        Cart.objects.create(user=buyer, product=mango, quantity=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.place(buyer)
+        self.assertNotEqual(get_tag_versions(['product']), versions)
+
+    def test_stock_is_checked_by_the_update_itself(self):
+        mango = Product.objects.get(slug='mango-0')
+        self.assertEqual(decrement_stock({mango.pk: 51}), [mango.pk])
+        self.assertEqual(decrement_stock({mango.pk: 50}), [])
+        mango.refresh_from_db()
+        self.assertEqual(mango.stock_quantity, 0)
+
+    def test_insufficient_stock_rolls_everything_back(self):
+        Product.objects.filter(slug='mango-3').update(stock_quantity=1)
+        with self.assertRaisesMessage(OrderError, 'Insufficient stock for Fresh Mango 3'):
+            self.place()
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(slug='mango-0').stock_quantity, 50)
+        self.assertEqual(Cart.objects.filter(user=self.customer).count(), 5)
+
+    def test_view_reports_order_errors(self):
+        self.client.force_login(self.customer)
+        Cart.objects.filter(user=self.customer).delete()
+        response = self.client.post(reverse('bika:place_order'), {
+            'shipping_address': 'Dar', 'billing_address': 'Dar', 'payment_method': 'visa',
+        })
+        self.assertEqual(response.json(), {'success': False, 'message': 'Your cart is empty!'})
+
+
+class StockHoldTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.customer = seed_catalog(products=1)
+        cls.mango = Product.objects.get()
+        Product.objects.filter(pk=cls.mango.pk).update(stock_quantity=5)
+        cls.rival = CustomUser.objects.create_user('rival', 'rival@example.com', 'password')
+
+    def hold(self, user, quantity):
+        return hold_stock(user, {self.mango.pk: (quantity, 5)})
+
+    def counter(self):
+        return HeldStock.objects.get(product=self.mango).quantity
+
+    def test_holds_are_admitted_against_stock(self):
+        self.assertEqual(self.hold(self.customer, 2), [])
+        self.assertEqual(self.hold(self.rival, 4), [self.mango.pk])
+        self.assertEqual(self.hold(self.rival, 3), [])
+        self.assertEqual(get_held_stock([self.mango.pk]), {self.mango.pk: 5})
+        # Holding again replaces the previous hold
+        self.assertEqual(self.hold(self.customer, 1), [])
+        self.assertEqual(get_held_stock([self.mango.pk]), {self.mango.pk: 4})
+        self.assertEqual(self.counter(), 4)
+
+    def test_a_short_line_admits_nothing(self):
+        papaya = Product.objects.create(
+            name='Papaya', slug='papaya', sku='PAPAYA', barcode='BC-PAPAYA', price=1, vendor=self.vendor,
+            category=self.mango.category, status='active', stock_quantity=5,
+        )
+        self.hold(self.rival, 4)
+        self.assertEqual(
+            hold_stock(self.customer, {papaya.pk: (2, 5), self.mango.pk: (2, 5)}), [self.mango.pk]
+        )
+        self.assertEqual(get_held_stock([papaya.pk, self.mango.pk]), {papaya.pk: 0, self.mango.pk: 4})
+        self.assertEqual(HeldStock.objects.get(product=papaya).quantity, 0)
+
+    def test_placing_the_order_turns_the_hold_into_a_decrement(self):
+        self.hold(self.customer, 2)
+        Cart.objects.create(user=self.rival, product=self.mango, quantity=4)
+        with self.assertRaisesMessage(OrderError, 'Insufficient stock'):
+            place_order(self.rival, 'Dar', 'Dar', 'visa')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(self.customer, 'Dar', 'Dar', 'visa')
+        self.assertEqual(Product.objects.get(pk=self.mango.pk).stock_quantity, 3)
+        self.assertFalse(StockHold.objects.exists())
+        self.assertEqual(get_held_stock([self.mango.pk]), {self.mango.pk: 0})
+        self.assertEqual(self.counter(), 0)
+
+    def test_expired_holds_are_swept(self):
+        self.hold(self.customer, 5)
+        StockHold.objects.update(expires_at=timezone.now())
+        self.assertEqual(sweep_expired_holds(), 1)
+        self.assertEqual(self.counter(), 0)
+        self.assertEqual(self.hold(self.rival, 5), [])
+
+    def test_expired_holds_are_not_counted_before_the_sweep(self):
+        self.hold(self.customer, 5)
+        StockHold.objects.update(expires_at=timezone.now())
+        self.assertEqual(get_held_stock([self.mango.pk]), {self.mango.pk: 0})
+        self.assertEqual(self.hold(self.rival, 5), [])
+        self.assertFalse(StockHold.objects.filter(user=self.customer).exists())
+        self.assertEqual(self.counter(), 5)
+
+    def test_sweep_corrects_counters_of_cascaded_deletes(self):
+        self.hold(self.customer, 2)
+        self.hold(self.rival, 3)
+        self.rival.delete()
+        self.assertEqual(self.counter(), 5)
+        sweep_expired_holds()
+        self.assertEqual(self.counter(), 2)
+        self.assertEqual(self.hold(self.customer, 5), [])
+
+
+class TaskQueueTests(TestCase):
+
+    def setUp(self):
+        self.calls = []
+        registry = mock.patch.dict(TASKS)
+        registry.start()
+        self.addCleanup(registry.stop)
+
+        @task(max_attempts=2)
+        def flaky(value):
+            self.calls.append(value)
+            raise RuntimeError('gateway down')
+
+        self.flaky = flaky
+
+    def test_contact_email_is_sent_by_the_worker(self):
+        SiteInfo.objects.create(name='Bika')
+        response = self.client.post(reverse('bika:contact'), {
+            'name': 'Asha', 'email': 'asha@example.com', 'phone': '', 'subject': 'Hello', 'message': 'Hi',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Task.objects.get().name, 'send_contact_email')
+
+        self.assertEqual(run_due_tasks(), 1)
+        self.assertEqual(mail.outbox[0].subject, 'New Contact Message: Hello')
+        self.assertEqual(Task.objects.get().status, 'done')
+
+    def test_failures_are_retried_with_backoff_then_given_up(self):
+        queued = enqueue(self.flaky, 7)
+        self.assertEqual(run_due_tasks(), 1)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('queued', 1))
+        self.assertGreater(queued.run_at, timezone.now())
+        self.assertIn('gateway down', queued.last_error)
+        self.assertEqual(run_due_tasks(), 0)  # Not due yet
+
+        Task.objects.update(run_at=timezone.now())
+        run_due_tasks()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('failed', 2))
+        self.assertEqual(self.calls, [7, 7])
+
+    def test_claimed_tasks_are_hidden_until_the_visibility_timeout(self):
+        enqueue(notify_product_alert, 0)
+        [claimed] = claim_tasks('worker-a', 10)
+        self.assertEqual(claim_tasks('worker-b', 10), [])
+
+        # worker-a died; the task comes back for another worker
+        Task.objects.update(run_at=timezone.now())
+        [reclaimed] = claim_tasks('worker-b', 10)
+        self.assertEqual(reclaimed.attempts, 2)
+        run_task(claimed)  # The late worker-a no longer owns it
+        self.assertEqual(Task.objects.get().status, 'queued')
+        run_task(reclaimed)
+        self.assertEqual(Task.objects.get().status, 'done')
+
+    def test_model_training_runs_on_the_worker(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(self.settings(MEDIA_ROOT=media_root))
+        staff = CustomUser.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        self.client.force_login(staff)
+        dataset = ContentFile(b'fruit,temperature,class\nMango,5,Good\n', name='fruits.csv')
+        with mock.patch('bika.views.fruit_ai_service.train_fruit_quality_model') as train:
+            train.return_value = {'success': True, 'message': 'Accuracy 0.85'}
+            response = self.client.post(reverse('bika:train_fruit_model'), {'dataset_file': dataset})
+            self.assertTrue(response.json()['queued'])
+            train.assert_not_called()
+            run_due_tasks()
+        self.assertEqual(train.call_args.args[1], 'random_forest')
+        self.assertEqual(Notification.objects.get(user=staff).title, 'Model training finished')
+        self.assertEqual(default_storage.listdir('fruit_datasets/uploads')[1], [])
+
+    def test_task_that_never_finishes_is_given_up(self):
+        queued = enqueue(self.flaky, 1)
+        for attempt in range(2):
+            self.assertEqual(len(claim_tasks('worker-a', 10)), 1)
+            # The worker dies; the visibility timeout passes
+            Task.objects.update(run_at=timezone.now())
+        self.assertEqual(claim_tasks('worker-a', 10), [])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('failed', 2))
+        self.assertEqual(self.calls, [])
+
+    def test_alert_notifications_fan_out_in_one_insert(self):
+        vendor, _ = seed_catalog(products=1)
+        for i in range(3):
+            CustomUser.objects.create_user(f'admin{i}', f'admin{i}@example.com', 'password', user_type='admin')
+        alert = ProductAlert.objects.create(
+            product=Product.objects.get(), alert_type='stock_low', severity='high',
+            message='Low stock', detected_by='system'
+        )
+        enqueue(notify_product_alert, alert.pk)
+        cache.clear()
+        self.assertEqual(get_user_counters(vendor)['unread_notifications_count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            run_due_tasks()
+        # 3 admins, the vendor, then 3 admins again as store managers
+        self.assertEqual(Notification.objects.count(), 7)
+        self.assertEqual(Notification.objects.filter(user=vendor).get().title, 'Your Product Alert: Low Stock')
+        self.assertEqual(get_user_counters(vendor)['unread_notifications_count'], 1)
+
+
+class TaskLeaseTests(TransactionTestCase):
+    """The claim is renewed from another thread, so data must be committed"""
+
+    def setUp(self):
+        registry = mock.patch.dict(TASKS)
+        registry.start()
+        self.addCleanup(registry.stop)
+
+    def test_a_task_outliving_the_visibility_timeout_keeps_its_claim(self):
+        seen = []
+
+        @task(max_attempts=1)
+        def slow():
+            time.sleep(0.5)
+            seen.append((claim_tasks('worker-b', 10), Task.objects.get().status))
+
+        enqueue(slow)
+        with override_settings(BIKA_SETTINGS={**settings.BIKA_SETTINGS, 'TASK_VISIBILITY_TIMEOUT': 0.3}):
+            [claimed] = claim_tasks('worker-a', 10)
+            self.assertTrue(run_task(claimed))
+        self.assertEqual(seen, [([], 'queued')])
+        self.assertEqual(Task.objects.get().status, 'done')
+
+
+class StubGatewayHandler(BaseHTTPRequestHandler):
+    """Local stand-in for a payment provider; answers are queued per path"""
+    protocol_version = 'HTTP/1.1'  # Keep-alive
+
+    def do_GET(self):
+        self.answer()
+
+    def do_POST(self):
+        self.answer(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+
+    def answer(self, request_body=b''):
+        path = self.path.split('?')[0]
+        self.server.calls.append((self.command, path, self.client_address[1]))
+        queued = self.server.answers.get(path) or [(200, {})]
+        if callable(queued):
+            status, body = queued(json.loads(request_body or 'null'))
+        else:
+            status, body = queued.pop(0) if len(queued) > 1 else queued[0]
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubGatewayTestCase(TestCase):
+    """Runs StubGatewayHandler and configures M-Pesa to talk to it"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubGatewayHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.server.calls = []
+        self.server.answers = {
+            '/oauth/v1/generate': [(200, {'access_token': 'token-1', 'expires_in': '3599'})],
+            '/mpesa/stkpush/v1/processrequest': [(200, {'ResponseCode': '0', 'CheckoutRequestID': 'ws_1'})],
+        }
+        self.config = PaymentGatewaySettings.objects.create(
+            gateway='mpesa_tz', is_active=True, base_url=f'http://127.0.0.1:{self.server.server_port}',
+            api_key='key', api_secret='secret', merchant_id='174379',
+        )
+
+    def paths(self):
+        return [path for _, path, _ in self.server.calls]
+
+
+@override_settings(BIKA_SETTINGS={
+    **settings.BIKA_SETTINGS, 'PAYMENT_GATEWAY_RETRY_BACKOFF': 0, 'PAYMENT_GATEWAY_CIRCUIT_FAILURES': 2,
+})
+class GatewayTransportTests(StubGatewayTestCase):
+
+    def test_token_is_cached_and_connections_kept_alive(self):
+        gateway = MpesaGateway(self.config)
+        for _ in range(3):
+            self.assertTrue(gateway.stk_push('0712345678', 1000, 'BIKA-1')['success'])
+        self.assertEqual(self.paths().count('/oauth/v1/generate'), 1)
+        self.assertEqual(len({port for *_, port in self.server.calls}), 1)
+
+        # Saving new credentials starts over with a new token
+        self.config.api_secret = 'rotated'
+        self.config.save()
+        MpesaGateway(self.config).stk_push('0712345678', 1000, 'BIKA-2')
+        self.assertEqual(self.paths().count('/oauth/v1/generate'), 2)
+
+    def test_only_idempotent_requests_are_retried(self):
+        self.server.answers['/status'] = [(503, {}), (503, {}), (200, {'ok': True})]
+        transport = get_transport(self.config)
+        self.assertEqual(transport.request('GET', '/status').json(), {'ok': True})
+        self.assertEqual(self.paths().count('/status'), 3)
+
+        self.server.answers['/pay'] = [(503, {}), (200, {})]
+        self.assertEqual(transport.request('POST', '/pay', json={}).status_code, 503)
+        self.assertEqual(self.paths().count('/pay'), 1)
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        self.server.answers['/pay'] = [(500, {})]
+        transport = get_transport(self.config)
+        transport.request('POST', '/pay', json={})
+        transport.request('POST', '/pay', json={})
+        with self.assertRaises(GatewayUnavailable):
+            transport.request('POST', '/pay', json={})
+        self.assertEqual(self.paths().count('/pay'), 2)
+        # Callers get a failure answer instead of waiting on the provider
+        self.assertFalse(MpesaGateway(self.config).stk_push('0712345678', 1000, 'BIKA-1')['success'])
+
+        # After the reset period one probe goes through and closes it again
+        cache.set(transport.breaker.open_key, 0, None)
+        self.server.answers['/pay'] = [(200, {})]
+        self.assertEqual(transport.request('POST', '/pay', json={}).status_code, 200)
+        self.assertEqual(transport.request('POST', '/pay', json={}).status_code, 200)
+
+
+class PaymentReconciliationTests(StubGatewayTestCase):
+
+    STK_RESULTS = {
+        'ws_paid': (200, {'ResultCode': '0', 'ResultDesc': 'Processed successfully'}),
+        'ws_cancelled': (200, {'ResultCode': '1032', 'ResultDesc': 'Request cancelled by user'}),
+        'ws_waiting': (200, {'ResponseCode': '0'}),
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.server.answers['/mpesa/stkpushquery/v1/query'] = (
+            lambda body: self.STK_RESULTS[body['CheckoutRequestID']]
+        )
+        _, self.customer = seed_catalog(products=1)
+        self.payments = {
+            reference: self.pending_payment(method, reference)
+            for method, reference in [
+                ('mpesa', 'ws_paid'), ('mpesa', 'ws_cancelled'), ('mpesa', 'ws_waiting'), ('visa', ''),
+            ]
+        }
+        Payment.objects.update(created_at=timezone.now() - timedelta(minutes=10))
+        # Its webhook may still come
+        self.recent = self.pending_payment('mpesa', 'ws_paid')
+
+    def pending_payment(self, method, reference):
+        order = Order.objects.create(
+            user=self.customer, total_amount=Decimal('1000'), shipping_address='Dar', billing_address='Dar'
+        )
+        return Payment.objects.create(
+            order=order, payment_method=method, amount=order.total_amount,
+            transaction_id=f'BIKA-{order.pk}', mobile_money_transaction_id=reference,
+        )
+
+    def status(self, payment):
+        payment.refresh_from_db()
+        return payment.status, payment.order.status
+
+    def test_pending_payments_are_settled_from_the_provider(self):
+        self.assertEqual(get_user_counters(self.customer)['pending_orders'], 5)
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reconcile_payments', '--batch', '2', stdout=out)
+        self.assertIn('Scanned 4 pending payments: 1 completed, 1 failed', out.getvalue())
+        self.assertEqual(self.status(self.payments['ws_paid']), ('completed', 'confirmed'))
+        self.assertEqual(self.status(self.payments['ws_cancelled']), ('failed', 'pending'))
+        self.assertEqual(self.status(self.payments['ws_waiting']), ('pending', 'pending'))
+        self.assertEqual(self.status(self.payments['']), ('pending', 'pending'))
+        self.assertEqual(self.status(self.recent), ('pending', 'pending'))
+        self.assertEqual(self.paths().count('/mpesa/stkpushquery/v1/query'), 3)
+        self.assertEqual(
+            sorted(Notification.objects.values_list('title', flat=True)), ['Payment failed', 'Payment success']
+        )
+        counters = get_user_counters(self.customer)
+        self.assertEqual((counters['pending_orders'], counters['unread_notifications_count']), (4, 2))
+
+    def test_settling_is_a_constant_number_of_queries(self):
+        for i in range(10):
+            self.pending_payment('mpesa', 'ws_paid')
+        Payment.objects.update(created_at=timezone.now() - timedelta(minutes=10))
+        with CaptureQueriesContext(connection) as queries:
+            result = reconcile_pending_payments()
+        self.assertEqual(result.completed, 12)
+        # Gateways, one page of payments and an empty one, then per outcome
+        # a locking read and the updates, and one notification insert
+        self.assertLessEqual(len(queries), 12)
+
+    def test_slow_provider_does_not_hold_up_the_others(self):
+        fast_answered = threading.Event()
+
+        class SlowGateway:
+            def query_status(self, reference):
+                # Only answers once the other provider has been asked
+                return 'completed' if fast_answered.wait(5) else 'pending'
+
+        class FastGateway:
+            def query_status(self, reference):
+                fast_answered.set()
+                return 'failed'
+
+        payments = [
+            SimpleNamespace(pk=pk, payment_method=method, mobile_money_transaction_id=f'ref-{pk}')
+            for pk, method in [(1, 'mpesa'), (2, 'mpesa'), (3, 'mpesa'), (4, 'paypal')]
+        ]
+        statuses = query_statuses(
+            payments, {'mpesa_tz': SlowGateway(), 'paypal': FastGateway()}, workers=2, per_gateway=1
+        )
+        self.assertEqual(statuses, {1: 'completed', 2: 'completed', 3: 'completed', 4: 'failed'})
+
+
+class PaymentWebhookTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        _, cls.customer = seed_catalog(products=1)
+        cls.order = Order.objects.create(
+            user=cls.customer, total_amount=Decimal('1000'), shipping_address='Dar', billing_address='Dar'
+        )
+        cls.payment = Payment.objects.create(
+            order=cls.order, payment_method='mpesa', amount=cls.order.total_amount, transaction_id='BIKA-1'
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def callback(self, **data):
+        return self.client.post(
+            reverse('bika:payment_webhook'), json.dumps({'transaction_id': 'BIKA-1', **data}),
+            content_type='application/json'
+        )
+
+    def test_callback_is_recorded_then_applied_by_the_worker(self):
+        response = self.callback(status='success')
+        self.assertEqual(response.json(), {'success': True, 'duplicate': False})
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'pending')
+
+        run_due_tasks()
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual((self.payment.status, self.order.status), ('completed', 'confirmed'))
+        self.assertEqual(Notification.objects.get().title, 'Payment success')
+        self.assertIsNotNone(PaymentWebhookEvent.objects.get().processed_at)
+
+    def test_applied_callback_refreshes_the_customers_counters(self):
+        self.assertEqual(get_user_counters(self.customer)['pending_orders'], 1)
+        self.callback(status='success')
+        with self.captureOnCommitCallbacks(execute=True):
+            run_due_tasks()
+        counters = get_user_counters(self.customer)
+        self.assertEqual((counters['pending_orders'], counters['unread_notifications_count']), (0, 1))
+
+    def test_retried_callbacks_are_acknowledged_with_one_lookup(self):
+        self.callback(status='success', event_id='evt_1')
+        with self.assertNumQueries(1):
+            response = self.callback(status='success', event_id='evt_1')
+        self.assertEqual(response.json(), {'success': True, 'duplicate': True})
+        self.assertEqual(Task.objects.count(), 1)
+
+        run_due_tasks()
+        self.callback(status='success', event_id='evt_1')
+        self.assertEqual(Notification.objects.count(), 1)
+
+    def test_invalid_body_is_rejected(self):
+        response = self.client.post(reverse('bika:payment_webhook'), 'nope', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PaymentWebhookEvent.objects.exists())
+
+
+class SensorBatchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(products=2)
+        cls.location = StorageLocation.objects.create(name='Cold Room 1', address='Dar')
+        fruit_type, _ = FruitType.objects.get_or_create(name='Mango', defaults={
+            'scientific_name': 'Mangifera indica',
+        })
+        cls.batch = FruitBatch.objects.create(
+            batch_number='MB-1', fruit_type=fruit_type, quantity=100,
+            arrival_date=timezone.now(), expected_expiry=timezone.now() + timedelta(days=7),
+            storage_location=cls.location,
+        )
+
+    def readings(self, count):
+        return [
+            {'sensor_type': 'temperature', 'value': 4 + i % 3, 'unit': 'C', 'product_barcode': f'BC-{i % 2}',
+             'batch_number': 'MB-1', 'location_id': self.location.pk}
+            for i in range(count)
+        ]
+
+    def send(self, body, content_type='application/json'):
+        return self.client.post(reverse('bika:receive_sensor_data_batch'), body, content_type=content_type)
+
+    def test_array_is_stored_with_a_constant_number_of_queries(self):
+        # Up to SQLite's bound parameter limit one INSERT holds the batch
+        for count in (3, 100):
+            with self.subTest(count=count), self.assertNumQueries(4):
+                response = self.send(json.dumps(self.readings(count)))
+            self.assertEqual(response.json()['created'], count)
+        reading = RealTimeSensorData.objects.filter(product__barcode='BC-1').first()
+        self.assertEqual((reading.fruit_batch, reading.location), (self.batch, self.location))
+
+    def test_ndjson_returns_a_result_per_line(self):
+        lines = [
+            json.dumps({'sensor_type': 'humidity', 'value': 90, 'unit': '%', 'location_id': self.location.pk}),
+            '{not json',
+            json.dumps({'sensor_type': 'humidity', 'unit': '%'}),
+            json.dumps({'sensor_type': 'co2', 'value': 400, 'unit': 'ppm', 'product_barcode': 'NOPE'}),
+        ]
+        data = self.send('\n'.join(lines), 'application/x-ndjson').json()
+        self.assertEqual((data['created'], data['failed']), (2, 2))
+        self.assertEqual([r['status'] for r in data['results']], ['created', 'error', 'error', 'created'])
+        self.assertEqual(data['results'][2]['error'], 'Missing field: value')
+        self.assertEqual(data['results'][3]['unresolved'], ['product_barcode'])
+        self.assertEqual(RealTimeSensorData.objects.count(), 2)
+
+    def test_one_alert_per_product_for_its_worst_anomaly(self):
+        readings = self.readings(2) + [
+            {'sensor_type': 'temperature', 'value': value, 'unit': 'C', 'product_barcode': 'BC-0'}
+            for value in (27, 31, -1)
+        ]
+        vendor = Product.objects.get(barcode='BC-0').vendor
+        cache.clear()
+        self.assertEqual(get_user_counters(vendor)['unresolved_alerts'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.send(json.dumps(readings))
+        alert = ProductAlert.objects.get()
+        self.assertEqual(alert.message, 'Temperature anomaly detected: 31.0C')
+        self.assertEqual(get_user_counters(vendor)['unresolved_alerts'], 1)
+
+    def test_unreadable_body_is_rejected(self):
+        self.assertEqual(self.send('{nope').status_code, 400)
+
+
+class SensorDeviceTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(products=1)
+        cls.product = Product.objects.get()
+        cls.location = StorageLocation.objects.create(name='Cold Room 1', address='Dar')
+        cls.device = SensorDevice.objects.create(
+            device_key='dev-1', name='Room 1 probe', location=cls.location, product=cls.product
+        )
+
+    def setUp(self):
+        cache.clear()
+        clear_device_cache()
+
+    def tearDown(self):
+        flush_heartbeats()
+
+    def send(self, readings, device_key='dev-1'):
+        return self.client.post(
+            reverse('bika:receive_sensor_data_batch'), json.dumps(readings),
+            content_type='application/json', HTTP_X_DEVICE_KEY=device_key
+        ).json()
+
+    def test_known_devices_need_no_lookups(self):
+        reading = {'sensor_type': 'temperature', 'value': 4, 'unit': 'C'}
+        self.send([reading])
+        with self.assertNumQueries(1):
+            data = self.send([reading] * 5)
+        self.assertEqual(data['created'], 5)
+        stored = RealTimeSensorData.objects.first()
+        self.assertEqual((stored.product, stored.location), (self.product, self.location))
+
+        response = self.client.post(
+            reverse('bika:receive_sensor_data'), json.dumps({**reading, 'device_key': 'nope'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.json(), {'success': False, 'error': 'Unknown device'})
+
+    def test_device_changes_reach_the_cached_identity(self):
+        self.assertEqual(resolve_device('dev-1').location_id, self.location.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.device.location = None
+            self.device.save()
+        self.assertIsNone(resolve_device('dev-1').location_id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.device.is_active = False
+            self.device.save()
+        self.assertIsNone(resolve_device('dev-1'))
+
+    def test_deleting_what_a_device_measures_reaches_the_cached_identity(self):
+        location = StorageLocation.objects.create(name='Cold Room 2', address='Dar')
+        SensorDevice.objects.create(device_key='dev-2', name='Room 2 probe', location=location)
+        self.assertEqual(resolve_device('dev-2').location_id, location.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            location.delete()
+        data = self.send([{'sensor_type': 'temperature', 'value': 4, 'unit': 'C'}], device_key='dev-2')
+        self.assertEqual(data['created'], 1)
+        self.assertIsNone(RealTimeSensorData.objects.get().location_id)
+
+    def test_heartbeats_are_buffered_and_silent_devices_alerted_once(self):
+        admin = CustomUser.objects.create_user('admin', 'admin@example.com', 'password', user_type='admin')
+        self.send([{'sensor_type': 'humidity', 'value': 90, 'unit': '%'}])
+        self.assertIn(self.device.pk, pending_heartbeats())
+        self.device.refresh_from_db()
+        self.assertIsNone(self.device.last_seen_at)
+
+        self.assertEqual(flush_heartbeats(), 1)
+        self.device.refresh_from_db()
+        self.assertIsNotNone(self.device.last_seen_at)
+        self.assertEqual(sweep_offline_devices(), 0)
+
+        SensorDevice.objects.update(last_seen_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(get_user_counters(admin)['unread_notifications_count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(sweep_offline_devices(), 1)
+        self.assertEqual(get_user_counters(admin)['unread_notifications_count'], 1)
+        self.assertEqual(sweep_offline_devices(), 0)
+        self.assertEqual(Notification.objects.get().title, 'Sensor offline: Room 1 probe')
+
+        # Back online: alerted again the next time it goes quiet
+        self.send([{'sensor_type': 'humidity', 'value': 90, 'unit': '%'}])
+        flush_heartbeats()
+        self.device.refresh_from_db()
+        self.assertIsNone(self.device.offline_alerted_at)
+
+
+class StaleDeviceIdentityTests(TransactionTestCase):
+    """Foreign keys are only checked at commit, which a TestCase never reaches"""
+
+    def setUp(self):
+        cache.clear()
+        clear_device_cache()
+        self.addCleanup(flush_heartbeats)
+
+    def test_a_reading_for_a_deleted_target_is_resolved_again(self):
+        location = StorageLocation.objects.create(name='Cold Room 1', address='Dar')
+        SensorDevice.objects.create(device_key='dev-1', name='Room 1 probe', location=location)
+        self.assertEqual(resolve_device('dev-1').location_id, location.pk)
+        # Deleted by another process whose registry bump has not arrived yet
+        with mock.patch('bika.signals.schedule_registry_version_bump'):
+            location.delete()
+
+        [result] = ingest_readings([{'sensor_type': 'humidity', 'value': 80, 'unit': '%'}], device_key='dev-1')
+        self.assertEqual(result['status'], 'created')
+        self.assertIsNone(RealTimeSensorData.objects.get().location_id)
+        self.assertIsNone(resolve_device('dev-1').location_id)
+
+
+class QueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Every page must stay within its BIKA_QUERY_BUDGETS entry"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor, cls.customer = seed_catalog()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.customer)
+
+    def tearDown(self):
+        flush_view_counts()
+
+    def test_content_pages(self):
+        for url_name in ['about', 'services', 'faq', 'contact']:
+            with self.subTest(url_name=url_name):
+                self.assertWithinQueryBudget(url_name)
+
+    def test_home(self):
+        self.assertWithinQueryBudget('home')
+
+    def test_product_list(self):
+        self.assertWithinQueryBudget('product_list')
+
+    def test_products_by_category(self):
+        self.assertWithinQueryBudget('products_by_category', kwargs={'category_slug': 'category-1'})
+
+    def test_product_detail(self):
+        self.assertWithinQueryBudget('product_detail', kwargs={'slug': 'mango-1'})
+
+    def test_product_search(self):
+        self.assertWithinQueryBudget('product_search', data={'q': 'mango'})
+
+    def test_autocomplete(self):
+        self.client.logout()
+        self.assertWithinQueryBudget('autocomplete', data={'q': 'mang'})
+
+    def test_api_product_detail(self):
+        self.assertWithinQueryBudget('api_product_detail', kwargs={'barcode': 'BC-1'})
+
+    def test_cart(self):
+        self.assertWithinQueryBudget('cart')
+
+    def test_account_pages(self):
+        for url_name in ['wishlist', 'user_orders', 'notifications', 'user_profile',
+                         'unread_notifications_count']:
+            with self.subTest(url_name=url_name):
+                self.assertWithinQueryBudget(url_name)
+
+    def test_vendor_pages(self):
+        self.client.force_login(self.vendor)
+        for url_name in ['vendor_dashboard', 'vendor_product_list']:
+            with self.subTest(url_name=url_name):
+                self.assertWithinQueryBudget(url_name)
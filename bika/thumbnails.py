@@ -0,0 +1,160 @@
+# bika/thumbnails.py - PRODUCT IMAGE DERIVATIVES (THUMBNAILS + WEBP)
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+
+from .models import ProductImage
+
+logger = logging.getLogger(__name__)
+
+# name -> (width, height, crop). Cropped sizes are exactly width x height
+# (cards line up in the grid); the others only shrink to fit.
+THUMBNAIL_SIZES = {
+    'thumb': (150, 150, True),
+    'card': (400, 400, True),
+    'large': (1200, 1200, False),
+}
+
+# Every size is written as WebP plus a JPEG (PNG when transparent) fallback
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+# Derivatives are generated on a small pool of background threads after the
+# upload commits, so the upload request never waits on Pillow
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='bika-thumbnails')
+
+
+def derivative_name(name, size, fmt):
+    """products/mango.jpg -> products/mango.jpg.card.webp (next to the original)
+
+    The source extension stays in the name, so mango.jpg and mango.png
+    do not share derivatives.
+    """
+    return f'{name}.{size}.{fmt}'
+
+
+def derivative_names(name):
+    return [
+        derivative_name(name, size, fmt)
+        for size in THUMBNAIL_SIZES for fmt in ('webp', fallback_format(name))
+    ]
+
+
+def fallback_format(name):
+    return 'png' if os.path.splitext(name)[1].lower() == '.png' else 'jpg'
+
+
+def _resize(image, size):
+    width, height, crop = THUMBNAIL_SIZES[size]
+    if crop:
+        return ImageOps.fit(image, (width, height), Image.LANCZOS)
+    resized = image.copy()
+    resized.thumbnail((width, height), Image.LANCZOS)
+    return resized
+
+
+def _encode(image, fmt):
+    buffer = BytesIO()
+    if fmt == 'webp':
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    elif fmt == 'png':
+        image.save(buffer, 'PNG', optimize=True)
+    else:
+        image.convert('RGB').save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def generate_derivatives(name, force=False, storage=None):
+    """Write every size/format of one image, returning how many were written
+
+    Existing derivatives are kept unless force=True, so reruns are cheap.
+    The images using the file then record them in ProductImage.derivatives,
+    which is what pages read instead of asking the storage.
+    """
+    storage = storage or default_storage
+    formats = ['webp', fallback_format(name)]
+    missing = [
+        (size, fmt) for size in THUMBNAIL_SIZES for fmt in formats
+        if force or not storage.exists(derivative_name(name, size, fmt))
+    ]
+    if missing:
+        _write_derivatives(name, missing, storage)
+    # update() sends no post_save, which would schedule generation again
+    ProductImage.objects.filter(image=name).update(derivatives=derivative_names(name))
+    return len(missing)
+
+
+def _write_derivatives(name, missing, storage):
+
+    with storage.open(name, 'rb') as original:
+        image = Image.open(original)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        resized = {}
+        for size, fmt in missing:
+            if size not in resized:
+                resized[size] = _resize(image, size)
+            target = derivative_name(name, size, fmt)
+            if storage.exists(target):
+                storage.delete(target)
+            storage.save(target, ContentFile(_encode(resized[size], fmt)))
+
+
+def _generate_safely(name):
+    try:
+        generate_derivatives(name)
+    except Exception:
+        # A broken upload must not take the worker thread down
+        logger.exception("Could not generate derivatives for %s", name)
+    finally:
+        # The pool thread has its own connection
+        connection.close()
+
+
+def schedule_derivatives(name):
+    """Generate derivatives in the background once the transaction commits"""
+    if name:
+        transaction.on_commit(lambda: _executor.submit(_generate_safely, name))
+
+
+def delete_derivatives(name, storage=None):
+    """Remove the derivatives of a file no image uses any more"""
+    storage = storage or default_storage
+    if ProductImage.objects.filter(image=name).exists():
+        return
+    for target in derivative_names(name):
+        storage.delete(target)
+
+
+def _delete_safely(name):
+    try:
+        delete_derivatives(name)
+    except Exception:
+        logger.exception("Could not delete derivatives of %s", name)
+    finally:
+        connection.close()
+
+
+def schedule_derivative_cleanup(name):
+    """Delete derivatives in the background once the transaction commits"""
+    if name:
+        transaction.on_commit(lambda: _executor.submit(_delete_safely, name))
+
+
+def derivative_url(image, size, fmt, storage=None):
+    """URL of a ProductImage's derivative, or None while it has not been generated
+
+    Reads the image's recorded derivatives; no storage call per render.
+    """
+    storage = storage or default_storage
+    target = derivative_name(image.image.name, size, fmt)
+    return storage.url(target) if target in (image.derivatives or ()) else None
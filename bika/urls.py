@@ -61,8 +61,8 @@ urlpatterns = [
     # ==================== PRODUCTS ====================
     path('products/', views.product_list_view, name='product_list'),
     path('products/category/<slug:category_slug>/', views.products_by_category_view, name='products_by_category'),
+    path('products/search/', views.product_search_view, name='product_search'),  # before the slug route
     path('products/<slug:slug>/', views.product_detail_view, name='product_detail'),
-    path('products/search/', views.product_search_view, name='product_search'),
     path('products/<int:product_id>/review/', views.add_review, name='add_review'),
     
     # ==================== VENDOR ====================
@@ -120,6 +120,7 @@ urlpatterns = [
     
     # ==================== API ENDPOINTS ====================
     # Product API
+    path('api/autocomplete/', views.autocomplete_api, name='autocomplete'),
     path('api/product/<str:barcode>/', views.api_product_detail, name='api_product_detail'),
     path('api/products/<int:product_id>/analytics/', views.product_analytics_api, name='product_analytics_api'),
     
@@ -127,10 +128,14 @@ urlpatterns = [
     path('api/upload-dataset/', views.upload_dataset, name='upload_dataset'),
     path('api/train-model/', views.train_model, name='train_model'),
     path('api/sensor-data/', views.receive_sensor_data, name='receive_sensor_data'),
+    path('api/sensor-data/batch/', views.receive_sensor_data_batch, name='receive_sensor_data_batch'),
     path('api/train-fruit-model/', views.train_fruit_model_api, name='train_fruit_model'),
     path('api/predict-fruit-quality/', views.predict_fruit_quality_api, name='predict_fruit_quality'),
     path('api/storage-compatibility/', views.storage_compatibility_check, name='storage_compatibility'),
     
+    # Performance API (staff only)
+    path('api/query-budget/', views.query_budget_report, name='query_budget_report'),
+    
     # Alerts API
     path('api/alerts/<int:alert_id>/resolve/', views.resolve_alert, name='resolve_alert'),
     
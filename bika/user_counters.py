@@ -0,0 +1,148 @@
+# bika/user_counters.py - PER-USER HEADER BADGE COUNTERS
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import Wishlist, Notification, Order, ProductAlert
+from .cart_pricing import cart_totals, get_request_cart_totals
+from .anonymous_cart import get_anonymous_cart
+
+USER_COUNTERS_KEY = 'bika:user_counters:{user_id}:{group}'
+DEFAULT_USER_COUNTERS_TIMEOUT = 60 * 60 * 24
+
+EMPTY_COUNTERS = {
+    'cart_count': 0,
+    'cart_total': Decimal('0.00'),
+    'wishlist_count': 0,
+    'unread_notifications_count': 0,
+    'critical_notifications_count': 0,
+    'pending_orders': 0,
+    'unresolved_alerts': 0,
+}
+
+# ==================== COUNTER GROUPS ====================
+# Each group is cached under its own key so that a write to one table only
+# recomputes (and can only ever overwrite) its own counters.
+
+def _cart_counters(user_id):
+    totals = cart_totals(user_id)
+    return {
+        'cart_count': totals.count,
+        'cart_total': totals.subtotal,
+    }
+
+
+def _wishlist_counters(user_id):
+    return {'wishlist_count': Wishlist.objects.filter(user_id=user_id).count()}
+
+
+def _notification_counters(user_id):
+    totals = Notification.objects.filter(user_id=user_id, is_read=False).aggregate(
+        unread=Count('id'),
+        critical=Count('id', filter=Q(notification_type='urgent_alert')),
+    )
+    return {
+        'unread_notifications_count': totals['unread'],
+        'critical_notifications_count': totals['critical'],
+    }
+
+
+def _order_counters(user_id):
+    return {'pending_orders': Order.objects.filter(user_id=user_id, status='pending').count()}
+
+
+def _alert_counters(user_id):
+    return {
+        'unresolved_alerts': ProductAlert.objects.filter(
+            product__vendor_id=user_id,
+            is_resolved=False
+        ).count()
+    }
+
+
+COUNTER_GROUPS = {
+    'cart': _cart_counters,
+    'wishlist': _wishlist_counters,
+    'notifications': _notification_counters,
+    'orders': _order_counters,
+    'alerts': _alert_counters,
+}
+
+# ==================== READ API ====================
+
+def _timeout():
+    return settings.BIKA_SETTINGS.get('USER_COUNTERS_TIMEOUT', DEFAULT_USER_COUNTERS_TIMEOUT)
+
+
+def _key(user_id, group):
+    return USER_COUNTERS_KEY.format(user_id=user_id, group=group)
+
+
+def get_user_counters(user):
+    """All header counters for a user in a single cache lookup"""
+    if not user.is_authenticated:
+        return dict(EMPTY_COUNTERS)
+
+    keys = {group: _key(user.pk, group) for group in COUNTER_GROUPS}
+    cached = cache.get_many(keys.values())
+
+    counters = {}
+    missing = {}
+    for group, key in keys.items():
+        values = cached.get(key)
+        if values is None:
+            # Cache miss - fall back to the database and repopulate
+            values = COUNTER_GROUPS[group](user.pk)
+            missing[key] = values
+        counters.update(values)
+
+    if missing:
+        cache.set_many(missing, _timeout())
+
+    if not user.is_vendor():
+        counters['unresolved_alerts'] = 0
+
+    return counters
+
+
+def get_request_counters(request):
+    """get_user_counters() memoized on the request
+
+    Signed-out shoppers get their cookie cart's count and total.
+    """
+    counters = getattr(request, '_bika_user_counters', None)
+    if counters is None:
+        counters = get_user_counters(request.user)
+        if not request.user.is_authenticated and get_anonymous_cart(request):
+            totals = get_request_cart_totals(request)
+            counters.update(cart_count=totals.count, cart_total=totals.subtotal)
+        request._bika_user_counters = counters
+    return counters
+
+# ==================== WRITE API ====================
+
+def refresh_user_counters(user_id, *groups):
+    """Recompute the given counter groups (all if none given) for a user"""
+    groups = groups or tuple(COUNTER_GROUPS)
+    cache.set_many(
+        {_key(user_id, group): COUNTER_GROUPS[group](user_id) for group in groups},
+        _timeout()
+    )
+
+
+def schedule_counter_refresh(user_ids, *groups):
+    """Refresh counters for one or more users once the transaction commits"""
+    if isinstance(user_ids, int):
+        user_ids = [user_ids]
+    user_ids = {user_id for user_id in user_ids if user_id}
+    if not user_ids:
+        return
+
+    def refresh():
+        for user_id in user_ids:
+            refresh_user_counters(user_id, *groups)
+
+    transaction.on_commit(refresh)
@@ -0,0 +1,108 @@
+# bika/view_counter.py - WRITE-BEHIND PRODUCT VIEW COUNTER
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+# Product page views are counted in memory and written at most this many
+# seconds later, so views_count (and the "popular" sort) lags by at most
+# this much. 0 writes every view straight through.
+DEFAULT_VIEW_COUNT_FLUSH_INTERVAL = 30
+
+# Flush early once this many distinct products are waiting
+MAX_BUFFERED_PRODUCTS = 1000
+
+_pending = Counter()
+_lock = threading.Lock()
+_timer = None
+
+
+def _flush_interval():
+    return settings.BIKA_SETTINGS.get('VIEW_COUNT_FLUSH_INTERVAL', DEFAULT_VIEW_COUNT_FLUSH_INTERVAL)
+
+
+def _schedule_flush(interval):
+    """Start the flush timer unless one is running (call with _lock held)"""
+    global _timer
+    if _timer is None:
+        _timer = threading.Timer(interval, _flush_in_background)
+        _timer.daemon = True
+        _timer.start()
+
+
+def _flush_in_background():
+    try:
+        flush_view_counts()
+    finally:
+        # The timer thread has its own connection
+        connection.close()
+
+
+def write_view_counts(counts):
+    """Add {product_id: views} to views_count, one UPDATE per distinct increment
+
+    Only views_count is written: no full-row save, no updated_at bump and
+    no post_save signals.
+    """
+    by_increment = defaultdict(list)
+    for product_id, views in counts.items():
+        by_increment[views].append(product_id)
+    with transaction.atomic():
+        for views, product_ids in by_increment.items():
+            Product.objects.filter(pk__in=product_ids).update(views_count=F('views_count') + views)
+
+
+def count_product_view(product_id):
+    """Record one product page view"""
+    interval = _flush_interval()
+    if interval <= 0:
+        write_view_counts({product_id: 1})
+        return
+
+    with _lock:
+        _pending[product_id] += 1
+        full = len(_pending) >= MAX_BUFFERED_PRODUCTS
+        if not full:
+            _schedule_flush(interval)
+    if full:
+        flush_view_counts()
+
+
+def flush_view_counts():
+    """Write every buffered view, returning how many were written"""
+    global _timer
+    with _lock:
+        counts = dict(_pending)
+        _pending.clear()
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+    if not counts:
+        return 0
+
+    try:
+        write_view_counts(counts)
+    except DatabaseError:
+        # Keep the views for the next attempt rather than losing them
+        logger.exception("Could not flush %d product view counts", len(counts))
+        with _lock:
+            _pending.update(counts)
+            _schedule_flush(max(_flush_interval(), 1))
+        return 0
+    return sum(counts.values())
+
+
+def pending_view_counts():
+    with _lock:
+        return dict(_pending)
+
+
+atexit.register(flush_view_counts)
@@ -7,9 +7,10 @@ import numpy as np
 from datetime import datetime, timedelta
 
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, JsonResponse, HttpResponseRedirect
+from django.http import HttpResponse, JsonResponse, HttpResponseRedirect, Http404
 from django.contrib import messages
 from django.core.mail import send_mail
+from django.core.files.storage import default_storage
 from django.conf import settings
 from django.views.generic import ListView, DetailView, TemplateView
 from django.contrib.auth import login, authenticate, logout
@@ -18,6 +19,7 @@ from django.contrib.admin.views.decorators import staff_member_required
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods, require_POST, require_GET
 from django.views.decorators.cache import never_cache
+from django.utils.decorators import method_decorator
 from django.db.models import Q, Count, Sum, F, Avg, Max, Min
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.utils import timezone
@@ -34,6 +36,24 @@ from .models import (
     ProductDataset, TrainedModel, PaymentGatewaySettings, CurrencyExchangeRate
 )
 
+from .site_context import get_site_info, invalidate_global_context
+from .page_cache import cached_page, invalidate_page_tags
+from .conditional import conditional_product, product_page_validators, product_api_validators
+from .user_counters import get_user_counters, get_request_counters, schedule_counter_refresh
+from .cart_pricing import get_request_cart_totals, forget_request_cart_totals
+from .anonymous_cart import get_anonymous_cart
+from .orders import OrderError, place_order as place_order_for
+from .reservations import hold_stock
+from .tasks import enqueue, send_contact_email, train_fruit_model
+from .payment_webhooks import record_webhook_event
+from .sensor_ingest import SensorBatchError, ingest_readings, parse_readings
+from .query_budget import get_query_budget_report
+from .search import search_products
+from .pagination import paginate, PRODUCT_SORTS
+from .facets import parse_filters, filter_products, get_facets
+from .view_counter import count_product_view
+from .autocomplete import suggest, invalidate_autocomplete, DEFAULT_LIMIT, MAX_LIMIT
+
 # Import forms
 from .forms import (
     ContactForm, NewsletterForm, CustomUserCreationForm, 
@@ -113,6 +133,7 @@ logger = logging.getLogger(__name__)
 
 # ==================== BASIC VIEWS ====================
 
+@method_decorator(cached_page('faq', 'testimonial'), name='dispatch')
 class HomeView(TemplateView):
     template_name = 'bika/home.html'
     
@@ -120,22 +141,14 @@ class HomeView(TemplateView):
         context = super().get_context_data(**kwargs)
         
         # Get site info
-        context['site_info'] = SiteInfo.objects.first()
+        context['site_info'] = get_site_info()
         
         # Get featured products
         try:
-            featured_products = Product.objects.filter(
+            context['featured_products'] = Product.objects.cards().filter(
                 status='active',
                 is_featured=True
-            ).select_related('category', 'vendor')[:8]
-            
-            # Add primary images
-            for product in featured_products:
-                product.primary_image = product.images.filter(is_primary=True).first()
-                if not product.primary_image:
-                    product.primary_image = product.images.first()
-            
-            context['featured_products'] = featured_products
+            )[:8]
         except Exception as e:
             logger.error(f"Error loading featured products: {e}")
             context['featured_products'] = []
@@ -176,15 +189,18 @@ def product_search_view(request):
     if not query:
         return redirect('bika:product_list')
     
-    # Search products
-    products = Product.objects.filter(
-        Q(name__icontains=query) | 
-        Q(description__icontains=query) |
-        Q(short_description__icontains=query) |
-        Q(tags__icontains=query) |
-        Q(category__name__icontains=query),
-        status='active'
-    ).select_related('category', 'vendor')
+    # Search products (ranked full-text index, icontains fallback)
+    products, ranked = search_products(
+        Product.objects.cards().filter(status='active'),
+        query
+    )
+    filters = parse_filters(request.GET)
+    products = filter_products(products, filters)
+    if ranked:
+        products = products.order_by('search_rank', '-created_at')
+        ordering = None
+    else:
+        ordering = PRODUCT_SORTS['newest']
     
     # Get search suggestions
     suggestions = []
@@ -194,44 +210,47 @@ def product_search_view(request):
             status='active'
         ).exclude(id__in=products.values_list('id', flat=True))[:5]
     
-    # Get categories
-    categories = ProductCategory.objects.filter(
-        is_active=True,
-        parent__isnull=True
-    ).annotate(
-        product_count=Count('products', filter=Q(products__status='active'))
-    )
+    # Sidebar facet counts (one grouped query, cached per filter set)
+    facets = get_facets(filters)
     
     # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    try:
-        page_obj = paginator.get_page(page_number)
-    except PageNotAnInteger:
-        page_obj = paginator.get_page(1)
-    except EmptyPage:
-        page_obj = paginator.get_page(paginator.num_pages)
+    page_obj, total_results = paginate(request, products, ordering, 12)
     
     context = {
         'products': page_obj,
         'query': query,
         'suggestions': suggestions,
-        'categories': categories,
-        'total_results': products.count(),
-        'site_info': SiteInfo.objects.first(),
+        'categories': facets['categories'],
+        'facets': facets,
+        'filters': filters,
+        'total_results': total_results,
+        'total_products': total_results,
+        'sort_by': 'relevance' if ranked else 'newest',
+        'site_info': get_site_info(),
     }
     
-    return render(request, 'bika/pages/search_results.html', context)
+    # Same listing template as product_list_view
+    return render(request, 'bika/pages/products.html', context)
+
+@require_GET
+def autocomplete_api(request):
+    """As-you-type suggestions from the in-memory index (no database access)"""
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(max(int(request.GET.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    
+    return JsonResponse(suggest(query, limit))
 
 def user_settings(request):
     """User settings page"""
     context = {
         'user': request.user,
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     return render(request, 'bika/pages/user/settings.html', context)
 
-@login_required
 @require_POST
 def quick_add_to_cart(request, product_id):
     """Quick add to cart (for AJAX requests)"""
@@ -244,30 +263,42 @@ def quick_add_to_cart(request, product_id):
             'message': f'Product out of stock!'
         })
     
-    # Add to cart
-    cart_item, created = Cart.objects.get_or_create(
-        user=request.user,
-        product=product,
-        defaults={'quantity': 1}
-    )
-    
-    if not created:
-        cart_item.quantity += 1
-        cart_item.save()
-    
-    # Get updated cart count
-    cart_count = Cart.objects.filter(user=request.user).count()
+    # Add to cart (a cookie cart until the shopper signs in)
+    if request.user.is_authenticated:
+        cart_item, created = Cart.objects.get_or_create(
+            user=request.user,
+            product=product,
+            defaults={'quantity': 1}
+        )
+        
+        if not created:
+            cart_item.quantity += 1
+            cart_item.save()
+        
+        counters = get_user_counters(request.user)
+    else:
+        anonymous_cart = get_anonymous_cart(request)
+        created = product.pk not in anonymous_cart
+        if not anonymous_cart.add(product.pk):
+            return JsonResponse({
+                'success': False,
+                'message': 'Your cart is full. Please sign in to add more products.'
+            })
+        forget_request_cart_totals(request)
+        counters = get_request_counters(request)
     
     return JsonResponse({
         'success': True,
         'message': f'{product.name} added to cart!',
-        'cart_count': cart_count,
+        'cart_count': counters['cart_count'],
+        'cart_total': str(counters['cart_total']),
         'created': created
     })
+@cached_page('testimonial')
 def about_view(request):
     services = Service.objects.filter(is_active=True)
     testimonials = Testimonial.objects.filter(is_active=True)[:4]
-    site_info = SiteInfo.objects.first()
+    site_info = get_site_info()
     
     context = {
         'services': services,
@@ -276,9 +307,10 @@ def about_view(request):
     }
     return render(request, 'bika/pages/about.html', context)
 
+@cached_page()
 def services_view(request):
     services = Service.objects.filter(is_active=True)
-    site_info = SiteInfo.objects.first()
+    site_info = get_site_info()
     
     context = {
         'services': services,
@@ -295,11 +327,11 @@ class ServiceDetailView(DetailView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['site_info'] = SiteInfo.objects.first()
+        context['site_info'] = get_site_info()
         return context
 
 def contact_view(request):
-    site_info = SiteInfo.objects.first()
+    site_info = get_site_info()
     
     if request.method == 'POST':
         form = ContactForm(request.POST)
@@ -315,24 +347,8 @@ def contact_view(request):
             
             contact_message.save()
             
-            # Send email notification
-            try:
-                send_mail(
-                    f'New Contact Message: {contact_message.subject}',
-                    f'''
-                    Name: {contact_message.name}
-                    Email: {contact_message.email}
-                    Phone: {contact_message.phone}
-                    
-                    Message:
-                    {contact_message.message}
-                    ''',
-                    settings.DEFAULT_FROM_EMAIL,
-                    [settings.DEFAULT_FROM_EMAIL],
-                    fail_silently=True,
-                )
-            except Exception as e:
-                logger.error(f"Email error: {e}")
+            # Emailed by the task worker, outside the request
+            enqueue(send_contact_email, contact_message.pk)
             
             messages.success(
                 request, 
@@ -348,9 +364,10 @@ def contact_view(request):
     }
     return render(request, 'bika/pages/contact.html', context)
 
+@cached_page('faq')
 def faq_view(request):
     faqs = FAQ.objects.filter(is_active=True)
-    site_info = SiteInfo.objects.first()
+    site_info = get_site_info()
     
     context = {
         'faqs': faqs,
@@ -459,9 +476,7 @@ def admin_dashboard(request):
     quality_readings = FruitQualityReading.objects.count()
     
     # ===== RECENT DATA =====
-    recent_products = Product.objects.select_related(
-        'vendor', 'category'
-    ).prefetch_related('images').order_by('-created_at')[:6]
+    recent_products = Product.objects.cards().order_by('-created_at')[:6]
     
     recent_orders = Order.objects.select_related('user').order_by('-created_at')[:5]
     
@@ -527,127 +542,100 @@ def admin_dashboard(request):
         'django_version': django_version,
         'debug': debug,
         
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     
     return render(request, 'bika/pages/admin/dashboard.html', context)
+
+@staff_member_required
+@require_GET
+def query_budget_report(request):
+    """Per-view SQL query stats collected by QueryBudgetMiddleware"""
+    return JsonResponse({
+        'monitoring': bool(settings.BIKA_SETTINGS.get('QUERY_BUDGET_MONITORING')),
+        'budgets': getattr(settings, 'BIKA_QUERY_BUDGETS', {}),
+        'views': get_query_budget_report(),
+    })
+
+@cached_page()
 def product_list_view(request):
     """Display all active products with filtering and pagination"""
-    products = Product.objects.filter(status='active').select_related('category', 'vendor')
+    products = Product.objects.cards().filter(status='active')
     
     # Get filter parameters
     category_slug = request.GET.get('category')
     query = request.GET.get('q', '')
-    sort_by = request.GET.get('sort', 'newest')
+    sort_by = request.GET.get('sort', 'relevance' if query else 'newest')
     min_price = request.GET.get('min_price')
     max_price = request.GET.get('max_price')
     
-    # Filter by category
+    # Resolve category
     current_category = None
     if category_slug:
         try:
             current_category = ProductCategory.objects.get(slug=category_slug, is_active=True)
-            products = products.filter(category=current_category)
         except ProductCategory.DoesNotExist:
             pass
     
-    # Search functionality
+    # Search functionality (ranked full-text index, icontains fallback)
+    ranked = False
     if query:
-        products = products.filter(
-            Q(name__icontains=query) | 
-            Q(description__icontains=query) |
-            Q(short_description__icontains=query) |
-            Q(tags__icontains=query) |
-            Q(category__name__icontains=query) |
-            Q(brand__icontains=query) |
-            Q(model__icontains=query)
-        )
-    
-    # Price filtering
-    if min_price:
-        try:
-            products = products.filter(price__gte=float(min_price))
-        except ValueError:
-            pass
+        products, ranked = search_products(products, query)
     
-    if max_price:
-        try:
-            products = products.filter(price__lte=float(max_price))
-        except ValueError:
-            pass
+    # Category (with subcategories), price, brand and condition filters
+    filters = parse_filters(request.GET, current_category)
+    products = filter_products(products, filters)
     
-    # Sorting
-    if sort_by == 'price_low':
-        products = products.order_by('price')
-    elif sort_by == 'price_high':
-        products = products.order_by('-price')
-    elif sort_by == 'name':
-        products = products.order_by('name')
-    elif sort_by == 'popular':
-        products = products.order_by('-views_count')
-    elif sort_by == 'featured':
-        products = products.order_by('-is_featured', '-created_at')
-    else:  # newest
-        products = products.order_by('-created_at')
+    # Sorting (relevance rank cannot be keyset-paged)
+    if sort_by == 'relevance' and ranked:
+        products = products.order_by('search_rank', '-created_at')
+        ordering = None
+    else:
+        ordering = PRODUCT_SORTS.get(sort_by, PRODUCT_SORTS['newest'])
     
     # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    try:
-        page_obj = paginator.get_page(page_number)
-    except PageNotAnInteger:
-        page_obj = paginator.get_page(1)
-    except EmptyPage:
-        page_obj = paginator.get_page(paginator.num_pages)
-    
-    # Get categories for sidebar
-    categories = ProductCategory.objects.filter(
-        is_active=True,
-        parent__isnull=True
-    ).annotate(
-        product_count=Count('products', filter=Q(products__status='active'))
-    )
+    page_obj, total_products = paginate(request, products, ordering, 12)
+    
+    # Sidebar facet counts (one grouped query, cached per filter set)
+    facets = get_facets(filters)
     
     context = {
         'products': page_obj,
-        'categories': categories,
+        'categories': facets['categories'],
+        'facets': facets,
+        'filters': filters,
         'current_category': current_category,
         'query': query,
         'sort_by': sort_by,
         'min_price': min_price,
         'max_price': max_price,
-        'total_products': products.count(),
-        'site_info': SiteInfo.objects.first(),
+        'total_products': total_products,
+        'site_info': get_site_info(),
     }
     return render(request, 'bika/pages/products.html', context)
 
+def _count_revalidated_view(request, validators):
+    count_product_view(validators.pk)
+
+@conditional_product(product_page_validators, not_modified=_count_revalidated_view)
 def product_detail_view(request, slug):
     """Display single product details"""
     product = get_object_or_404(Product.objects.select_related(
         'category', 'vendor'
     ).prefetch_related('images'), slug=slug, status='active')
     
-    # Increment view count
-    product.views_count += 1
-    product.save()
+    # Count the view (buffered, written in batches)
+    count_product_view(product.pk)
     
-    # Get related products
-    related_products = Product.objects.filter(
-        category=product.category,
-        status='active'
-    ).exclude(id=product.id).select_related(
-        'category', 'vendor'
-    ).prefetch_related('images')[:4]
+    # Get related products (co-purchased, then same category)
+    related_products = product.get_related_products(4)
     
-    # Get product reviews
+    # Get product reviews (aggregates are kept on the product)
     reviews = ProductReview.objects.filter(
         product=product, 
         is_approved=True
     ).select_related('user').order_by('-created_at')
     
-    # Calculate average rating
-    avg_rating = reviews.aggregate(Avg('rating'))['rating__avg'] or 0
-    
     # Check if product is in user's wishlist
     in_wishlist = False
     if request.user.is_authenticated:
@@ -672,15 +660,17 @@ def product_detail_view(request, slug):
         'product': product,
         'related_products': related_products,
         'reviews': reviews,
-        'avg_rating': round(avg_rating, 1) if avg_rating else 0,
-        'review_count': reviews.count(),
+        'avg_rating': round(product.avg_rating, 1) if product.review_count else 0,
+        'review_count': product.review_count,
+        'rating_histogram': product.rating_histogram,
         'in_wishlist': in_wishlist,
         'in_cart': in_cart,
         'cart_quantity': cart_quantity,
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     return render(request, 'bika/pages/product_detail.html', context)
 
+@cached_page()
 def products_by_category_view(request, category_slug):
     """Display products by category"""
     category = get_object_or_404(
@@ -691,10 +681,10 @@ def products_by_category_view(request, category_slug):
     
     # Get products in this category and subcategories
     subcategory_ids = list(category.subcategories.values_list('id', flat=True)) + [category.id]
-    products = Product.objects.filter(
+    products = Product.objects.cards().filter(
         category_id__in=subcategory_ids,
         status='active'
-    ).select_related('category', 'vendor')
+    )
     
     # Get filter parameters
     query = request.GET.get('q', '')
@@ -708,24 +698,10 @@ def products_by_category_view(request, category_slug):
         )
     
     # Sorting
-    if sort_by == 'price_low':
-        products = products.order_by('price')
-    elif sort_by == 'price_high':
-        products = products.order_by('-price')
-    elif sort_by == 'name':
-        products = products.order_by('name')
-    else:  # newest
-        products = products.order_by('-created_at')
+    ordering = PRODUCT_SORTS.get(sort_by, PRODUCT_SORTS['newest'])
     
     # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    try:
-        page_obj = paginator.get_page(page_number)
-    except PageNotAnInteger:
-        page_obj = paginator.get_page(1)
-    except EmptyPage:
-        page_obj = paginator.get_page(paginator.num_pages)
+    page_obj, total_products = paginate(request, products, ordering, 12)
     
     # Get sibling categories
     if category.parent:
@@ -743,8 +719,8 @@ def products_by_category_view(request, category_slug):
         'current_category': category,
         'query': query,
         'sort_by': sort_by,
-        'total_products': products.count(),
-        'site_info': SiteInfo.objects.first(),
+        'total_products': total_products,
+        'site_info': get_site_info(),
     }
     return render(request, 'bika/pages/products.html', context)
 
@@ -851,7 +827,7 @@ def vendor_dashboard(request):
         'recent_products': recent_products,
         'recent_orders': recent_orders,
         'total_sales': total_sales,
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     
     return render(request, 'bika/pages/vendor/dashboard.html', context)
@@ -865,9 +841,9 @@ def vendor_product_list(request):
     
     # For staff, show all products; for vendors, show only their products
     if request.user.is_staff:
-        products = Product.objects.all()
+        products = Product.objects.cards()
     else:
-        products = Product.objects.filter(vendor=request.user)
+        products = Product.objects.cards().filter(vendor=request.user)
     
     # Apply filters
     query = request.GET.get('q', '')
@@ -901,11 +877,10 @@ def vendor_product_list(request):
     
     # Apply sorting
     sort_by = request.GET.get('sort', '-updated_at')
-    if sort_by in ['name', '-name', 'price', '-price', 'stock_quantity', '-stock_quantity', 
-                   'created_at', '-created_at', 'updated_at', '-updated_at']:
-        products = products.order_by(sort_by)
-    else:
-        products = products.order_by('-updated_at')
+    if sort_by not in ['name', '-name', 'price', '-price', 'stock_quantity', '-stock_quantity', 
+                       'created_at', '-created_at', 'updated_at', '-updated_at']:
+        sort_by = '-updated_at'
+    ordering = (sort_by, '-id' if sort_by.startswith('-') else 'id')
     
     # Calculate statistics
     stats = {
@@ -922,17 +897,11 @@ def vendor_product_list(request):
     categories = ProductCategory.objects.filter(is_active=True)
     
     # Pagination
-    paginator = Paginator(products, 10)
-    page_number = request.GET.get('page')
-    try:
-        page_obj = paginator.get_page(page_number)
-    except PageNotAnInteger:
-        page_obj = paginator.get_page(1)
-    except EmptyPage:
-        page_obj = paginator.get_page(paginator.num_pages)
+    page_obj, total_products = paginate(request, products, ordering, 10)
     
     context = {
         'products': page_obj,
+        'total_products': total_products,
         'stats': stats,
         'categories': categories,
         'query': query,
@@ -940,7 +909,7 @@ def vendor_product_list(request):
         'stock_filter': stock_filter,
         'category_filter': category_filter,
         'sort_by': sort_by,
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     
     return render(request, 'bika/pages/vendor/products.html', context)
@@ -995,7 +964,7 @@ def vendor_add_product(request):
     context = {
         'form': form,
         'title': 'Add New Product',
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     
     return render(request, 'bika/pages/vendor/add_product.html', context)
@@ -1031,7 +1000,7 @@ def vendor_edit_product(request, product_id):
         'product': product,
         'images': images,
         'title': 'Edit Product',
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     
     return render(request, 'bika/pages/vendor/edit_product.html', context)
@@ -1060,15 +1029,14 @@ def user_profile(request):
     """User profile page"""
     user = request.user
     recent_orders = Order.objects.filter(user=user).order_by('-created_at')[:5]
-    wishlist_count = Wishlist.objects.filter(user=user).count()
-    cart_count = Cart.objects.filter(user=user).count()
+    counters = get_request_counters(request)
     
     context = {
         'user': user,
         'recent_orders': recent_orders,
-        'wishlist_count': wishlist_count,
-        'cart_count': cart_count,
-        'site_info': SiteInfo.objects.first(),
+        'wishlist_count': counters['wishlist_count'],
+        'cart_count': counters['cart_count'],
+        'site_info': get_site_info(),
     }
     return render(request, 'bika/pages/user/profile.html', context)
 
@@ -1112,14 +1080,14 @@ def user_orders(request):
         'orders': orders,
         'total_orders': total_orders,
         'total_spent': total_spent,
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     return render(request, 'bika/pages/user/orders.html', context)
 
 @login_required
 def order_detail(request, order_id):
     """Order detail page"""
-    order = get_object_or_404(Order.objects.select_related('user').prefetch_related('items'), 
+    order = get_object_or_404(Order.objects.select_related('user').prefetch_related('items__product__primary_image'), 
                              id=order_id, user=request.user)
     
     # Get payments for this order
@@ -1128,7 +1096,7 @@ def order_detail(request, order_id):
     context = {
         'order': order,
         'payments': payments,
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     return render(request, 'bika/pages/user/order_detail.html', context)
 
@@ -1139,11 +1107,11 @@ def wishlist(request):
     """User wishlist page"""
     wishlist_items = Wishlist.objects.filter(
         user=request.user
-    ).select_related('product').order_by('-added_at')
+    ).select_related('product', 'product__primary_image').order_by('-added_at')
     
     context = {
         'wishlist_items': wishlist_items,
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     return render(request, 'bika/pages/user/wishlist.html', context)
 
@@ -1159,11 +1127,11 @@ def add_to_wishlist(request, product_id):
     )
     
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        wishlist_count = Wishlist.objects.filter(user=request.user).count()
+        counters = get_user_counters(request.user)
         return JsonResponse({
             'success': True,
             'message': 'Product added to wishlist!',
-            'wishlist_count': wishlist_count,
+            'wishlist_count': counters['wishlist_count'],
             'created': created
         })
     
@@ -1182,11 +1150,11 @@ def remove_from_wishlist(request, product_id):
     ).delete()
     
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        wishlist_count = Wishlist.objects.filter(user=request.user).count()
+        counters = get_user_counters(request.user)
         return JsonResponse({
             'success': True,
             'message': 'Product removed from wishlist!',
-            'wishlist_count': wishlist_count,
+            'wishlist_count': counters['wishlist_count'],
             'deleted': deleted_count > 0
         })
     
@@ -1200,49 +1168,29 @@ def remove_from_wishlist(request, product_id):
 
 # ==================== CART VIEWS ====================
 
-@login_required
 def cart(request):
     """Shopping cart page"""
-    from decimal import Decimal
-    
-    cart_items = Cart.objects.filter(
-        user=request.user
-    ).select_related('product').order_by('-added_at')
-    
-    # Calculate totals - Use Decimal for calculations
-    subtotal = Decimal('0.00')
-    
-    # Prepare cart items with total_price for template
-    cart_items_with_total = []
-    for item in cart_items:
-        # Calculate total for each item
-        item_price = Decimal(str(item.product.price))
-        item_quantity = Decimal(str(item.quantity))
-        item_subtotal = item_price * item_quantity
-        
-        # Add calculated total to item (as a simple attribute, not property)
-        item.total_price_calculated = item_subtotal
-        cart_items_with_total.append(item)
-        
-        subtotal += item_subtotal
+    if request.user.is_authenticated:
+        cart_items = list(Cart.objects.filter(
+            user=request.user
+        ).select_related('product', 'product__vendor', 'product__primary_image').order_by('-added_at'))
+    else:
+        cart_items = get_anonymous_cart(request).items()
     
-    tax_rate = Decimal('0.18')  # 18% VAT
-    tax_amount = subtotal * tax_rate
-    shipping_cost = Decimal('5000')  # Fixed shipping cost
-    total_amount = subtotal + tax_amount + shipping_cost
+    totals = get_request_cart_totals(request)
     
     context = {
-        'cart_items': cart_items_with_total,  # Use the list with calculated totals
-        'subtotal': subtotal,
-        'tax_amount': tax_amount,
-        'shipping_cost': shipping_cost,
-        'total_amount': total_amount,
-        'tax_rate': tax_rate,
-        'site_info': SiteInfo.objects.first(),
+        'cart_items': cart_items,
+        'subtotal': totals.subtotal,
+        'tax_amount': totals.tax_amount,
+        'shipping_cost': totals.shipping_cost,
+        'total_amount': totals.total,
+        'tax_rate': totals.tax_rate,
+        'tax_rate_percentage': totals.tax_rate * 100,
+        'site_info': get_site_info(),
     }
     return render(request, 'bika/pages/user/cart.html', context)
 
-@login_required
 @require_POST
 def add_to_cart(request, product_id):
     """Add product to cart"""
@@ -1259,37 +1207,45 @@ def add_to_cart(request, product_id):
         messages.error(request, f'Only {product.stock_quantity} items available!')
         return redirect('bika:product_detail', slug=product.slug)
     
-    # Add to cart
-    cart_item, created = Cart.objects.get_or_create(
-        user=request.user,
-        product=product,
-        defaults={'quantity': quantity}
-    )
-    
-    if not created:
-        cart_item.quantity += quantity
-        cart_item.save()
+    # Add to cart (a cookie cart until the shopper signs in)
+    if request.user.is_authenticated:
+        cart_item, created = Cart.objects.get_or_create(
+            user=request.user,
+            product=product,
+            defaults={'quantity': quantity}
+        )
+        
+        if not created:
+            cart_item.quantity += quantity
+            cart_item.save()
+        counters = get_user_counters(request.user)
+    else:
+        anonymous_cart = get_anonymous_cart(request)
+        created = product.pk not in anonymous_cart
+        if not anonymous_cart.add(product.pk, quantity):
+            message = 'Your cart is full. Please sign in to add more products.'
+            if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                return JsonResponse({'success': False, 'message': message})
+            messages.error(request, message)
+            return redirect('bika:cart')
+        forget_request_cart_totals(request)
+        counters = get_request_counters(request)
     
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        cart_count = Cart.objects.filter(user=request.user).count()
         return JsonResponse({
             'success': True,
             'message': 'Product added to cart!',
-            'cart_count': cart_count,
+            'cart_count': counters['cart_count'],
+            'cart_total': str(counters['cart_total']),
             'created': created
         })
     
     messages.success(request, 'Product added to cart!')
     return redirect('bika:cart')
 
-@login_required
-@require_POST
-@login_required
 @require_POST
 def update_cart(request, product_id):
     """Update cart item quantity"""
-    from decimal import Decimal
-    
     product = get_object_or_404(Product, id=product_id)
     quantity = int(request.POST.get('quantity', 1))
     
@@ -1301,93 +1257,85 @@ def update_cart(request, product_id):
                 'message': f'Only {product.stock_quantity} items available!'
             })
         
-        cart_item = get_object_or_404(Cart, user=request.user, product=product)
-        cart_item.quantity = quantity
-        cart_item.save()
-        
-        # Recalculate totals
-        cart_items = Cart.objects.filter(user=request.user)
-        subtotal = sum(Decimal(str(item.product.price)) * Decimal(str(item.quantity)) for item in cart_items)
-        tax_rate = Decimal('0.18')
-        tax_amount = subtotal * tax_rate
-        shipping_cost = Decimal('5000')
-        total_amount = subtotal + tax_amount + shipping_cost
+        if request.user.is_authenticated:
+            cart_item = get_object_or_404(Cart, user=request.user, product=product)
+            cart_item.quantity = quantity
+            cart_item.save()
+        else:
+            anonymous_cart = get_anonymous_cart(request)
+            if product.pk not in anonymous_cart:
+                raise Http404("Product is not in the cart")
+            anonymous_cart.set(product.pk, quantity)
+        forget_request_cart_totals(request)
+        totals = get_request_cart_totals(request)
         
         return JsonResponse({
             'success': True,
-            'item_total': str(cart_item.total_price),
-            'subtotal': str(subtotal),
-            'tax_amount': str(tax_amount),
-            'total_amount': str(total_amount),
-            'cart_count': cart_items.count(),
+            'item_total': str(product.price * quantity),
+            'subtotal': str(totals.subtotal),
+            'tax_amount': str(totals.tax_amount),
+            'shipping_cost': str(totals.shipping_cost),
+            'total_amount': str(totals.total),
+            'cart_count': totals.count,
             'max_quantity': product.stock_quantity if product.track_inventory else 99
         })
     else:
-        Cart.objects.filter(user=request.user, product=product).delete()
-        cart_items = Cart.objects.filter(user=request.user)
-        
-        if cart_items.exists():
-            subtotal = sum(Decimal(str(item.product.price)) * Decimal(str(item.quantity)) for item in cart_items)
-            tax_rate = Decimal('0.18')
-            tax_amount = subtotal * tax_rate
-            shipping_cost = Decimal('5000')
-            total_amount = subtotal + tax_amount + shipping_cost
-            
-            return JsonResponse({
-                'success': True,
-                'subtotal': str(subtotal),
-                'tax_amount': str(tax_amount),
-                'total_amount': str(total_amount),
-                'cart_count': cart_items.count()
-            })
+        if request.user.is_authenticated:
+            Cart.objects.filter(user=request.user, product=product).delete()
         else:
-            return JsonResponse({
-                'success': True,
-                'subtotal': '0.00',
-                'tax_amount': '0.00',
-                'total_amount': '0.00',
-                'cart_count': 0
-            })
+            get_anonymous_cart(request).remove(product.pk)
+        forget_request_cart_totals(request)
+        totals = get_request_cart_totals(request)
         
+        return JsonResponse({
+            'success': True,
+            'subtotal': str(totals.subtotal),
+            'tax_amount': str(totals.tax_amount),
+            'shipping_cost': str(totals.shipping_cost),
+            'total_amount': str(totals.total),
+            'cart_count': totals.count
+        })
+
 
-@login_required
 @require_POST
 def remove_from_cart(request, product_id):
     """Remove product from cart"""
-    from decimal import Decimal  # ADD THIS IMPORT
-    
     product = get_object_or_404(Product, id=product_id)
     
-    deleted_count, _ = Cart.objects.filter(
-        user=request.user, 
-        product=product
-    ).delete()
+    if request.user.is_authenticated:
+        deleted_count, _ = Cart.objects.filter(
+            user=request.user, 
+            product=product
+        ).delete()
+    else:
+        deleted_count = int(get_anonymous_cart(request).remove(product.pk))
     
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        cart_items = Cart.objects.filter(user=request.user)
-        subtotal = sum(item.total_price for item in cart_items)
-        tax_rate = Decimal('0.18')  # CHANGE TO DECIMAL
-        tax_amount = subtotal * tax_rate
-        shipping_cost = Decimal('5000')  # CHANGE TO DECIMAL
-        total_amount = subtotal + tax_amount + shipping_cost
+        forget_request_cart_totals(request)
+        totals = get_request_cart_totals(request)
         
         return JsonResponse({
             'success': True,
-            'subtotal': float(subtotal),  # CONVERT TO FLOAT
-            'tax_amount': float(tax_amount),  # CONVERT TO FLOAT
-            'total_amount': float(total_amount),  # CONVERT TO FLOAT
-            'cart_count': cart_items.count(),
+            'subtotal': float(totals.subtotal),
+            'tax_amount': float(totals.tax_amount),
+            'shipping_cost': float(totals.shipping_cost),
+            'total_amount': float(totals.total),
+            'cart_count': totals.count,
             'deleted': deleted_count > 0
         })
     
     messages.success(request, 'Product removed from cart!')
     return redirect('bika:cart')
 
-@login_required
 def clear_cart(request):
     """Clear entire cart"""
     if request.method == 'POST':
-        deleted_count, _ = Cart.objects.filter(user=request.user).delete()
+        if request.user.is_authenticated:
+            deleted_count, _ = Cart.objects.filter(user=request.user).delete()
+        else:
+            anonymous_cart = get_anonymous_cart(request)
+            deleted_count = len(anonymous_cart)
+            anonymous_cart.clear()
         
         messages.success(request, f'Cart cleared! {deleted_count} items removed.')
         return redirect('bika:cart')
@@ -1399,9 +1347,7 @@ def clear_cart(request):
 @login_required
 def checkout(request):
     """Checkout page"""
-    from decimal import Decimal  # ADD THIS IMPORT
-    
-    cart_items = Cart.objects.filter(user=request.user).select_related('product')
+    cart_items = Cart.objects.filter(user=request.user).select_related('product', 'product__primary_image')
     
     if not cart_items:
         messages.error(request, "Your cart is empty!")
@@ -1416,12 +1362,20 @@ def checkout(request):
             )
             return redirect('bika:cart')
     
-    # Calculate totals - USE DECIMAL
-    subtotal = sum(item.total_price for item in cart_items)
-    tax_rate = Decimal('0.18')  # CHANGE TO DECIMAL
-    tax_amount = subtotal * tax_rate
-    shipping_cost = Decimal('5000')  # CHANGE TO DECIMAL
-    total_amount = subtotal + tax_amount + shipping_cost
+    # Hold the stock while the customer fills in the form
+    short = hold_stock(request.user, {
+        item.product_id: (item.quantity, item.product.stock_quantity)
+        for item in cart_items if item.product.track_inventory
+    })
+    if short:
+        names = ', '.join(item.product.name for item in cart_items if item.product_id in short)
+        messages.error(
+            request,
+            f'{names} is being checked out by other customers right now. Please try again in a few minutes.'
+        )
+        return redirect('bika:cart')
+    
+    totals = get_request_cart_totals(request)
     
     # Get user's default addresses
     user = request.user
@@ -1440,15 +1394,15 @@ def checkout(request):
     
     context = {
         'cart_items': cart_items,
-        'subtotal': float(subtotal),  # CONVERT TO FLOAT
-        'tax_amount': float(tax_amount),  # CONVERT TO FLOAT
-        'shipping_cost': float(shipping_cost),  # CONVERT TO FLOAT
-        'total_amount': float(total_amount),  # CONVERT TO FLOAT
+        'subtotal': float(totals.subtotal),
+        'tax_amount': float(totals.tax_amount),
+        'shipping_cost': float(totals.shipping_cost),
+        'total_amount': float(totals.total),
         'shipping_address': shipping_address,
         'billing_address': billing_address,
         'payment_methods': payment_methods,
-        'tax_rate': float(tax_rate * Decimal('100')),  # For display
-        'site_info': SiteInfo.objects.first(),
+        'tax_rate': float(totals.tax_rate * 100),  # For display
+        'site_info': get_site_info(),
     }
     
     return render(request, 'bika/pages/checkout.html', context)
@@ -1459,102 +1413,32 @@ def checkout(request):
 @require_POST
 def place_order(request):
     """Place order and process payment"""
+    shipping_address = request.POST.get('shipping_address', '')
+    billing_address = request.POST.get('billing_address', '')
+    payment_method = request.POST.get('payment_method', '')
+    phone_number = request.POST.get('phone_number', '')
+    
+    if not shipping_address or not billing_address:
+        return JsonResponse({
+            'success': False,
+            'message': 'Please provide shipping and billing addresses'
+        })
+    
+    if not payment_method:
+        return JsonResponse({
+            'success': False,
+            'message': 'Please select a payment method'
+        })
+    
     try:
-        with transaction.atomic():
-            from decimal import Decimal  # ADD THIS IMPORT
-            
-            # Get cart items
-            cart_items = Cart.objects.filter(user=request.user).select_related('product')
-            
-            if not cart_items:
-                return JsonResponse({
-                    'success': False,
-                    'message': 'Your cart is empty!'
-                })
-            
-            # Validate stock
-            for item in cart_items:
-                if item.product.track_inventory and item.product.stock_quantity < item.quantity:
-                    return JsonResponse({
-                        'success': False,
-                        'message': f'Insufficient stock for {item.product.name}'
-                    })
-            
-            # Calculate totals - USE DECIMAL
-            subtotal = sum(item.total_price for item in cart_items)
-            tax_rate = Decimal('0.18')  # CHANGE TO DECIMAL
-            tax_amount = subtotal * tax_rate
-            shipping_cost = Decimal('5000')  # CHANGE TO DECIMAL
-            total_amount = subtotal + tax_amount + shipping_cost
-            
-            # Get form data
-            shipping_address = request.POST.get('shipping_address', '')
-            billing_address = request.POST.get('billing_address', '')
-            payment_method = request.POST.get('payment_method', '')
-            phone_number = request.POST.get('phone_number', '')
-            
-            if not shipping_address or not billing_address:
-                return JsonResponse({
-                    'success': False,
-                    'message': 'Please provide shipping and billing addresses'
-                })
-            
-            if not payment_method:
-                return JsonResponse({
-                    'success': False,
-                    'message': 'Please select a payment method'
-                })
-            
-            # Create order
-            order = Order.objects.create(
-                user=request.user,
-                total_amount=total_amount,  # This should already be Decimal
-                shipping_address=shipping_address,
-                billing_address=billing_address,
-                status='pending'
-            )
-            
-            # Create order items and update stock
-            for cart_item in cart_items:
-                OrderItem.objects.create(
-                    order=order,
-                    product=cart_item.product,
-                    quantity=cart_item.quantity,
-                    price=cart_item.product.price
-                )
-                
-                # Update product stock
-                if cart_item.product.track_inventory:
-                    cart_item.product.stock_quantity -= cart_item.quantity
-                    cart_item.product.save()
-            
-            # Create initial payment record
-            payment = Payment.objects.create(
-                order=order,
-                payment_method=payment_method,
-                amount=total_amount,  # This should already be Decimal
-                currency='TZS',
-                status='pending'
-            )
-            
-            # If mobile money, save phone number
-            if payment_method in ['mpesa', 'airtel_tz', 'tigo_tz'] and phone_number:
-                payment.mobile_money_phone = phone_number
-                payment.save()
-            
-            # Clear cart
-            cart_items.delete()
-            
-            # Return success with order details
-            return JsonResponse({
-                'success': True,
-                'order_id': order.id,
-                'order_number': order.order_number,
-                'payment_id': payment.id,
-                'redirect_url': reverse('bika:payment_processing', args=[payment.id]),
-                'total_amount': float(total_amount)  # CONVERT TO FLOAT FOR JSON
-            })
-            
+        order, payment = place_order_for(
+            request.user, shipping_address, billing_address, payment_method, phone_number
+        )
+    except OrderError as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        })
     except Exception as e:
         logger.error(f"Error placing order: {e}")
         return JsonResponse({
@@ -1562,6 +1446,16 @@ def place_order(request):
             'message': 'An error occurred while placing your order. Please try again.'
         })
     
+    # Return success with order details
+    return JsonResponse({
+        'success': True,
+        'order_id': order.id,
+        'order_number': order.order_number,
+        'payment_id': payment.id,
+        'redirect_url': reverse('bika:payment_processing', args=[payment.id]),
+        'total_amount': float(order.total_amount)
+    })
+    
 @login_required
 def payment_processing(request, payment_id):
     """Payment processing page"""
@@ -1571,7 +1465,7 @@ def payment_processing(request, payment_id):
     context = {
         'payment': payment,
         'order': order,
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     
     return render(request, 'bika/pages/payment_processing.html', context)
@@ -1579,41 +1473,22 @@ def payment_processing(request, payment_id):
 @csrf_exempt
 @require_POST
 def payment_webhook(request):
-    """Handle payment webhooks from payment providers"""
+    """Handle payment webhooks from payment providers
+    
+    Only records the callback; the payment, order and customer are updated
+    by the process_payment_webhook task. Retried callbacks are
+    acknowledged without doing anything.
+    """
     try:
         # This is a simplified version - implement based on your payment provider
         data = json.loads(request.body)
+        if not isinstance(data, dict):
+            raise ValueError('Webhook body must be a JSON object')
         
-        # Extract payment info from webhook
-        transaction_id = data.get('transaction_id')
-        status = data.get('status')
-        
-        if transaction_id:
-            payment = Payment.objects.filter(transaction_id=transaction_id).first()
-            if payment:
-                if status == 'success':
-                    payment.status = 'completed'
-                    payment.paid_at = timezone.now()
-                    payment.order.status = 'confirmed'
-                    payment.order.save()
-                elif status == 'failed':
-                    payment.status = 'failed'
-                    payment.order.status = 'pending'
-                    payment.order.save()
-                
-                payment.save()
-                
-                # Send notification to user
-                Notification.objects.create(
-                    user=payment.order.user,
-                    title=f"Payment {status}",
-                    message=f"Your payment for order #{payment.order.order_number} has been {status}.",
-                    notification_type='order_update',
-                    related_object_type='payment',
-                    related_object_id=payment.id
-                )
-        
-        return JsonResponse({'success': True})
+        provider = str(data.get('provider') or 'default')[:50]
+        created = record_webhook_event(provider, data)
+        
+        return JsonResponse({'success': True, 'duplicate': not created})
         
     except Exception as e:
         logger.error(f"Payment webhook error: {e}")
@@ -1659,7 +1534,7 @@ def fruit_quality_dashboard(request):
         'recent_readings': recent_readings,
         'alerts': alerts,
         'ai_available': AI_SERVICES_AVAILABLE,
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     
     return render(request, 'bika/pages/vendor/fruit_dashboard.html', context)
@@ -1702,7 +1577,7 @@ def create_fruit_batch(request):
         'form': form,
         'fruit_types': FruitType.objects.all(),
         'storage_locations': StorageLocation.objects.filter(is_active=True),
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     
     return render(request, 'bika/pages/vendor/create_fruit_batch.html', context)
@@ -1742,7 +1617,7 @@ def batch_detail(request, batch_id):
         'quality_readings': quality_readings,
         'sensor_data': sensor_data,
         'ai_analysis': ai_analysis,
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     
     return render(request, 'bika/pages/vendor/batch_detail.html', context)
@@ -1789,7 +1664,7 @@ def add_quality_reading(request, batch_id):
     context = {
         'form': form,
         'batch': batch,
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     
     return render(request, 'bika/pages/vendor/add_quality_reading.html', context)
@@ -1812,12 +1687,15 @@ def train_fruit_model_api(request):
         if not AI_SERVICES_AVAILABLE:
             return JsonResponse({'success': False, 'error': 'AI services not available'})
         
-        result = fruit_ai_service.train_fruit_quality_model(csv_file, model_type)
-        
-        if result.get('success'):
-            return JsonResponse(result)
-        else:
-            return JsonResponse({'success': False, 'error': result.get('error', 'Training failed')})
+        # Training takes minutes; the worker runs it and notifies the user
+        dataset_name = default_storage.save(f'fruit_datasets/uploads/{csv_file.name}', csv_file)
+        queued = enqueue(train_fruit_model, dataset_name, model_type, request.user.pk)
+        return JsonResponse({
+            'success': True,
+            'queued': True,
+            'task_id': queued.pk,
+            'message': 'Model training queued; you will be notified when it finishes'
+        })
             
     except Exception as e:
         logger.error(f"Error training model: {e}")
@@ -1869,7 +1747,7 @@ def notifications(request):
     context = {
         'notifications': notifications,
         'unread_count': unread_count,
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     
     return render(request, 'bika/pages/user/notifications.html', context)
@@ -1883,14 +1761,11 @@ def mark_notification_read(request, notification_id):
     notification.save()
     
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        unread_count = Notification.objects.filter(
-            user=request.user, 
-            is_read=False
-        ).count()
+        counters = get_user_counters(request.user)
         
         return JsonResponse({
             'success': True,
-            'unread_count': unread_count
+            'unread_count': counters['unread_notifications_count']
         })
     
     messages.success(request, 'Notification marked as read!')
@@ -1904,6 +1779,8 @@ def mark_all_notifications_read(request):
         user=request.user,
         is_read=False
     ).update(is_read=True)
+    # QuerySet.update() sends no signals
+    schedule_counter_refresh(request.user.pk, 'notifications')
     
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
         return JsonResponse({
@@ -1920,20 +1797,11 @@ def mark_all_notifications_read(request):
 def unread_notifications_count(request):
     """Get unread notifications count"""
     if request.user.is_authenticated:
-        unread_count = Notification.objects.filter(
-            user=request.user,
-            is_read=False
-        ).count()
-        
-        critical_count = Notification.objects.filter(
-            user=request.user,
-            is_read=False,
-            notification_type='urgent_alert'
-        ).count()
+        counters = get_request_counters(request)
         
         return JsonResponse({
-            'unread_count': unread_count,
-            'critical_count': critical_count
+            'unread_count': counters['unread_notifications_count'],
+            'critical_count': counters['critical_notifications_count']
         })
     
     return JsonResponse({'unread_count': 0, 'critical_count': 0})
@@ -1966,7 +1834,7 @@ def register_view(request):
     
     context = {
         'form': form,
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     
     return render(request, 'bika/pages/registration/register.html', context)
@@ -1997,7 +1865,7 @@ def vendor_register_view(request):
     
     context = {
         'form': form,
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     
     return render(request, 'bika/pages/registration/vendor_register.html', context)
@@ -2055,59 +1923,21 @@ def handler400(request, exception):
 @csrf_exempt
 @require_POST
 def receive_sensor_data(request):
-    """Receive sensor data from IoT devices"""
+    """Receive sensor data from IoT devices
+    
+    A registered device sends its key (X-Device-Key header or device_key
+    field) instead of product_barcode / batch_number / location_id.
+    """
     try:
         data = json.loads(request.body)
+        if not isinstance(data, dict):
+            return JsonResponse({'success': False, 'error': 'Reading must be a JSON object'}, status=400)
         
-        # Validate required fields
-        required_fields = ['sensor_type', 'value', 'unit']
-        for field in required_fields:
-            if field not in data:
-                return JsonResponse({'success': False, 'error': f'Missing field: {field}'})
+        [result] = ingest_readings([data], device_key=request.headers.get('X-Device-Key'))
+        if result['status'] == 'error':
+            return JsonResponse({'success': False, 'error': result['error']})
         
-        # Get optional fields
-        product_barcode = data.get('product_barcode')
-        batch_number = data.get('batch_number')
-        location_id = data.get('location_id')
-        
-        # Find related objects
-        product = None
-        fruit_batch = None
-        location = None
-        
-        if product_barcode:
-            product = Product.objects.filter(barcode=product_barcode).first()
-        
-        if batch_number:
-            fruit_batch = FruitBatch.objects.filter(batch_number=batch_number).first()
-        
-        if location_id:
-            location = StorageLocation.objects.filter(id=location_id).first()
-        
-        # Create sensor reading
-        sensor_reading = RealTimeSensorData.objects.create(
-            product=product,
-            fruit_batch=fruit_batch,
-            sensor_type=data['sensor_type'],
-            value=data['value'],
-            unit=data['unit'],
-            location=location,
-            recorded_at=timezone.now()
-        )
-        
-        # Check for anomalies (simplified version)
-        if data['sensor_type'] == 'temperature' and (data['value'] < 0 or data['value'] > 25):
-            # Create alert
-            if product:
-                ProductAlert.objects.create(
-                    product=product,
-                    alert_type='temperature_anomaly',
-                    severity='high',
-                    message=f'Temperature anomaly detected: {data["value"]}{data["unit"]}',
-                    detected_by='sensor_system'
-                )
-        
-        return JsonResponse({'success': True, 'id': sensor_reading.id})
+        return JsonResponse({'success': True, 'id': result['id']})
         
     except json.JSONDecodeError:
         return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
@@ -2115,12 +1945,40 @@ def receive_sensor_data(request):
         logger.error(f"Error receiving sensor data: {e}")
         return JsonResponse({'success': False, 'error': str(e)}, status=400)
 
+@csrf_exempt
+@require_POST
+def receive_sensor_data_batch(request):
+    """Receive many sensor readings at once, as a JSON array or NDJSON
+    
+    Returns a result per reading, in order, so devices can resend only
+    the ones that failed.
+    """
+    try:
+        readings = parse_readings(
+            request.body, ndjson=request.content_type in ('application/x-ndjson', 'application/jsonl')
+        )
+        results = ingest_readings(readings, device_key=request.headers.get('X-Device-Key'))
+    except SensorBatchError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"Error receiving sensor data batch: {e}")
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    
+    created = sum(1 for result in results if result['status'] == 'created')
+    return JsonResponse({
+        'success': True,
+        'created': created,
+        'failed': len(results) - created,
+        'results': results,
+    })
+
 @csrf_exempt
 @require_GET
+@conditional_product(product_api_validators)
 def api_product_detail(request, barcode):
     """API endpoint for product details by barcode"""
     try:
-        product = Product.objects.select_related('category', 'vendor').get(barcode=barcode)
+        product = Product.objects.cards().get(barcode=barcode)
         
         product_data = {
             'id': product.id,
@@ -2142,6 +2000,10 @@ def api_product_detail(request, barcode):
                 'username': product.vendor.username,
                 'business_name': product.vendor.business_name,
             },
+            'primary_image': (
+                product.primary_image.image.url
+                if product.primary_image and product.primary_image.image else None
+            ),
             'images': [
                 {
                     'image': img.image.url if img.image else None,
@@ -2164,7 +2026,7 @@ def api_product_detail(request, barcode):
 def scan_product(request):
     """Product scanning interface"""
     context = {
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     return render(request, 'bika/pages/scan_product.html', context)
 
@@ -2175,7 +2037,7 @@ def storage_sites(request):
     
     context = {
         'sites': sites,
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     return render(request, 'bika/pages/admin/storage_sites.html', context)
 
@@ -2233,7 +2095,7 @@ def track_my_products(request):
         'stats': stats,
         'query': query,
         'stock_filter': stock_filter,
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     
     return render(request, 'bika/pages/vendor/track_products.html', context)
@@ -2252,7 +2114,7 @@ def batch_analytics(request, batch_id):
     
     context = {
         'batch': batch,
-        'site_info': SiteInfo.objects.first(),
+        'site_info': get_site_info(),
     }
     return render(request, 'bika/pages/vendor/batch_analytics.html', context)
 
@@ -2265,7 +2127,7 @@ def upload_dataset(request):
         # Handle dataset upload
         return JsonResponse({'success': True, 'message': 'Dataset uploaded successfully'})
     
-    return render(request, 'bika/pages/ai/upload_dataset.html', {'site_info': SiteInfo.objects.first()})
+    return render(request, 'bika/pages/ai/upload_dataset.html', {'site_info': get_site_info()})
 
 def train_model(request):
     """Train AI model"""
@@ -2276,7 +2138,7 @@ def train_model(request):
         # Handle model training
         return JsonResponse({'success': True, 'message': 'Model training started'})
     
-    return render(request, 'bika/pages/ai/train_model.html', {'site_info': SiteInfo.objects.first()})
+    return render(request, 'bika/pages/ai/train_model.html', {'site_info': get_site_info()})
 
 def product_analytics_api(request, product_id):
     """API endpoint for product analytics"""
@@ -2371,7 +2233,14 @@ def handle_bulk_actions(request):
             elif action == 'delete':
                 deleted_count, _ = products.delete()
                 updated_count = deleted_count
-            
+
+            # QuerySet.update() sends no signals
+            if updated_count:
+                invalidate_global_context()
+                invalidate_page_tags('product')
+                if action in ('activate', 'draft'):
+                    invalidate_autocomplete()
+
             return JsonResponse({
                 'success': True,
                 'message': f'{updated_count} products updated successfully',
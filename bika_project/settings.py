@@ -36,7 +36,9 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'bika.middleware.AnonymousCartMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'bika.middleware.QueryBudgetMiddleware',  # Inactive unless QUERY_BUDGET_MONITORING is on
 ]
 
 ROOT_URLCONF = 'bika_project.urls'
@@ -152,12 +154,44 @@ if not DEBUG:
     X_FRAME_OPTIONS = 'DENY'
 
 # Cache Configuration
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+# Bika keeps its invalidation state in this cache: global context, page
+# cache tag, autocomplete, product and sensor device versions, header
+# counters and gateway circuit breakers. Web servers and the run_tasks /
+# reconcile_payments / sweep_* workers must therefore share it. Set
+# BIKA_CACHE_URL to redis://... (recommended), memcached://host:port or
+# "db" (run `manage.py createcachetable` once). Without it, production
+# (DEBUG off) uses the database cache; LocMemCache is per process and only
+# fit for a single development server (`manage.py check --deploy` rejects
+# it, see bika/checks.py).
+BIKA_CACHE_URL = os.environ.get('BIKA_CACHE_URL', '')
+if BIKA_CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': BIKA_CACHE_URL,
+        }
+    }
+elif BIKA_CACHE_URL.startswith('memcached://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': BIKA_CACHE_URL[len('memcached://'):],
+        }
+    }
+elif BIKA_CACHE_URL == 'db' or not DEBUG:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'bika_cache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+        }
     }
-}
 
 # File Upload Settings
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
@@ -182,12 +216,85 @@ BIKA_SETTINGS = {
     'FREE_SHIPPING_THRESHOLD': 100000,  # Free shipping above this amount
     'ORDER_PROCESSING_DAYS': 1,
     'DELIVERY_ESTIMATE_DAYS': 3,
+    'STOCK_HOLD_MINUTES': 15,  # How long checkout holds stock (see bika/reservations.py)
     
     # Fruit Quality Monitoring
     'DEFAULT_FRUIT_SHELF_LIFE': 7,  # days
     'QUALITY_CHECK_INTERVAL_HOURS': 24,
     'CRITICAL_TEMP_THRESHOLD': 10,  # °C
     'CRITICAL_HUMIDITY_THRESHOLD': 95,  # %
+
+    # Performance Monitoring
+    'QUERY_BUDGET_MONITORING': os.environ.get('BIKA_QUERY_BUDGET_MONITORING') == '1',
+
+    # Seconds product page views are buffered before being written (0 = write each view)
+    'VIEW_COUNT_FLUSH_INTERVAL': int(os.environ.get('BIKA_VIEW_COUNT_FLUSH_INTERVAL', 30)),
+
+    # Full-page cache for anonymous catalog/content pages (see bika/page_cache.py)
+    'PAGE_CACHE_ENABLED': os.environ.get('BIKA_PAGE_CACHE', '1') == '1',
+    'PAGE_CACHE_TIMEOUT': 60 * 10,
+
+    # Seconds a signed-out shopper's cart cookie is kept (see bika/anonymous_cart.py)
+    'ANONYMOUS_CART_MAX_AGE': 60 * 60 * 24 * 30,
+
+    # Background tasks run by `manage.py run_tasks` (see bika/tasks.py)
+    'TASK_MAX_ATTEMPTS': 5,
+    'TASK_VISIBILITY_TIMEOUT': 60 * 5,  # Seconds a claimed task stays hidden if its worker stops renewing it
+    'TASK_RETRY_BACKOFF': 30,  # Seconds before the first retry, doubled on each attempt
+
+    # Payment gateway HTTP calls (see bika/gateway_transport.py)
+    'PAYMENT_GATEWAY_TIMEOUT': (3.05, 10),  # Connect, read seconds
+    'PAYMENT_GATEWAY_RETRIES': 2,
+    'PAYMENT_GATEWAY_RETRY_BACKOFF': 0.25,  # Seconds, doubled on each retry
+    'PAYMENT_GATEWAY_POOL_SIZE': 10,  # Keep-alive connections per gateway
+    'PAYMENT_GATEWAY_CIRCUIT_FAILURES': 5,  # Consecutive failures that open the circuit
+    'PAYMENT_GATEWAY_CIRCUIT_RESET': 30,  # Seconds before a probe call is let through
+
+    # `manage.py reconcile_payments` (see bika/payment_reconciliation.py)
+    'PAYMENT_RECONCILE_AFTER': 120,  # Seconds a pending payment waits for its webhook first
+    'PAYMENT_RECONCILE_WINDOW_DAYS': 3,  # Older pending payments are left to the admins
+
+    # Sensor device registry (see bika/sensor_devices.py)
+    'SENSOR_DEVICE_CACHE_SIZE': 1024,  # Resolved devices kept per process
+    'SENSOR_HEARTBEAT_FLUSH_INTERVAL': 30,  # Seconds heartbeats are buffered (0 = write each reading)
+    'SENSOR_DEVICE_OFFLINE_MINUTES': 15,  # Silence after which `sweep_sensor_devices` alerts
+}
+
+# Maximum SQL queries per request, by URL name (see bika/query_budget.py).
+# Enforced by bika/tests.py against a seeded catalog and reported by
+# QueryBudgetMiddleware when monitoring is on. Transaction statements are
+# not counted. Lower these as views get cheaper - never raise them to make
+# a regression pass.
+BIKA_QUERY_BUDGETS = {
+    # Catalog (12 product cards per page)
+    'home': 9,
+    'product_list': 4,
+    'products_by_category': 8,
+    'product_detail': 10,
+    'product_search': 6,
+    'autocomplete': 0,
+    'api_product_detail': 5,
+
+    # Content pages
+    'about': 3,
+    'services': 3,
+    'faq': 3,
+    'contact': 3,
+
+    # Customer account
+    'cart': 5,
+    'wishlist': 5,
+    'user_orders': 5,
+    'notifications': 5,
+    'user_profile': 4,
+    'unread_notifications_count': 3,
+
+    # Vendor
+    'vendor_dashboard': 15,
+    'vendor_product_list': 8,
+
+    # Devices (whatever the batch size)
+    'receive_sensor_data_batch': 5,
 }
 
 # Bika AI Settings
@@ -219,6 +326,35 @@ required_dirs = [
 for directory in required_dirs:
     os.makedirs(directory, exist_ok=True)
 
+# Logging
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json_lines': {
+            'format': '%(message)s',
+        },
+    },
+    'handlers': {
+        'query_budget_file': {
+            'level': 'INFO',
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': BASE_DIR / 'logs' / 'query_budget.log',
+            'maxBytes': 5 * 1024 * 1024,
+            'backupCount': 3,
+            'delay': True,
+            'formatter': 'json_lines',
+        },
+    },
+    'loggers': {
+        'bika.query_budget': {
+            'handlers': ['query_budget_file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 # Custom error handlers
 handler404 = 'bika.views.handler404'
 handler500 = 'bika.views.handler500'